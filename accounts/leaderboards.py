@@ -0,0 +1,108 @@
+"""
+Rankingi użytkowników (najwięcej przepisów, polubień, obserwujących) trzymane
+w pamięci podręcznej jako listy (ID użytkownika, wartość).
+
+Ranking jest liczony z indeksowanej tabeli UserStats przy pierwszym odczycie,
+a potem aktualizowany przyrostowo: po zatwierdzeniu zmiany statystyk jednego
+użytkownika refresh_user() przesuwa go w rankingu, dopisuje albo usuwa. Gdy
+na podstawie samej listy nie da się ustalić poprawnej kolejności (użytkownik
+z pełnego rankingu spadł poniżej ostatniego miejsca), ranking jest usuwany
+i przy następnym odczycie liczony od nowa jednym zapytaniem.
+
+Przy kilku procesach serwera aktualizacje z różnych procesów mogą się nałożyć -
+ranking odświeża się wtedy najpóźniej po LEADERBOARD_TIMEOUT sekundach.
+"""
+import threading
+
+from django.core.cache import cache
+
+# Ile miejsc ma każdy ranking
+LEADERBOARD_SIZE = 10
+# Jak długo (w sekundach) ranking może być odczytywany bez przeliczenia od nowa
+LEADERBOARD_TIMEOUT = 3600
+
+# Nazwa rankingu -> pole UserStats, według którego sortujemy
+LEADERBOARDS = {
+    'recipes': 'recipe_count',
+    'likes': 'likes_received',
+    'followers': 'follower_count',
+}
+
+_lock = threading.Lock()
+
+
+def _key(name):
+    return f'leaderboard:{name}'
+
+
+def _compute(name):
+    from accounts.models import UserStats
+
+    field = LEADERBOARDS[name]
+    return list(
+        UserStats.objects.filter(**{f'{field}__gt': 0})
+        .order_by(f'-{field}', 'user_id')
+        .values_list('user_id', field)[:LEADERBOARD_SIZE]
+    )
+
+
+def get_leaderboard(name):
+    """Zwraca ranking jako listę (ID użytkownika, wartość) od pierwszego miejsca"""
+    entries = cache.get(_key(name))
+    if entries is None:
+        entries = _compute(name)
+        cache.set(_key(name), entries, LEADERBOARD_TIMEOUT)
+    return entries
+
+
+def leaderboard_users(name, limit=LEADERBOARD_SIZE):
+    """Użytkownicy z rankingu (z wczytanymi stats i profile) w kolejności miejsc"""
+    from django.contrib.auth.models import User
+
+    user_ids = [user_id for user_id, _ in get_leaderboard(name)[:limit]]
+    users = User.objects.select_related('stats', 'profile').in_bulk(user_ids)
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
+
+def _apply(entries, user_id, value):
+    """
+    Nowa wersja rankingu po zmianie wartości użytkownika albo None, gdy ranking
+    trzeba policzyć od nowa. Miejsca porządkuje klucz (-wartość, ID użytkownika),
+    a użytkownicy spoza pełnego rankingu mają klucz większy niż ostatnie miejsce.
+    """
+    full = len(entries) >= LEADERBOARD_SIZE
+    rank = (-value, user_id)
+    last_rank = (-entries[-1][1], entries[-1][0]) if entries else None
+    others = [entry for entry in entries if entry[0] != user_id]
+    was_member = len(others) != len(entries)
+
+    if was_member and full and rank > last_rank:
+        # Ktoś spoza rankingu mógł wyprzedzić użytkownika - nie wiemy kto
+        return None
+    if value > 0 and (was_member or not full or rank < last_rank):
+        others.append((user_id, value))
+    others.sort(key=lambda entry: (-entry[1], entry[0]))
+    return others[:LEADERBOARD_SIZE]
+
+
+def refresh_user(user_id):
+    """Aktualizuje zapamiętane rankingi po zmianie statystyk użytkownika"""
+    from accounts.models import UserStats
+
+    stats = UserStats.objects.filter(pk=user_id).values(*LEADERBOARDS.values()).first()
+    with _lock:
+        for name, field in LEADERBOARDS.items():
+            entries = cache.get(_key(name))
+            if entries is None:
+                # Ranking nie jest zapamiętany - zostanie policzony przy odczycie
+                continue
+            entries = _apply(entries, user_id, stats[field] if stats else 0)
+            if entries is None:
+                cache.delete(_key(name))
+            else:
+                cache.set(_key(name), entries, LEADERBOARD_TIMEOUT)
+
+
+def invalidate_leaderboards():
+    """Usuwa zapamiętane rankingi (np. po przeliczeniu statystyk od nowa)"""
+    cache.delete_many([_key(name) for name in LEADERBOARDS])
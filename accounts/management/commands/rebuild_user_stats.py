@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from accounts.leaderboards import invalidate_leaderboards
+from accounts.models import UserStats
+
+class Command(BaseCommand):
+    help = ('Przelicza od nowa statystyki użytkowników (przepisy, otrzymane polubienia, obserwujący, '
+            'obserwowani) i rankingi - np. po ręcznej zmianie danych lub zmianie autora przepisu')
+
+    def handle(self, *args, **kwargs):
+        stats = UserStats.rebuild()
+        invalidate_leaderboards()
+        self.stdout.write(self.style.SUCCESS(f'Przeliczono statystyki {len(stats)} użytkowników'))
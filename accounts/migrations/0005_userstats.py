@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, fk_field):
+    counts = model.objects.filter(**{fk_field: models.OuterRef('user_id')}).order_by().values(fk_field).annotate(
+        total=models.Count('pk')
+    ).values('total')
+    return Coalesce(models.Subquery(counts), 0)
+
+
+def backfill_user_stats(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    UserStats = apps.get_model('accounts', 'UserStats')
+    UserFollowing = apps.get_model('accounts', 'UserFollowing')
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=user_id) for user_id in User.objects.values_list('pk', flat=True)],
+        batch_size=1000,
+    )
+    UserStats.objects.update(
+        recipe_count=count_subquery(apps.get_model('recipes', 'Recipe'), 'author'),
+        likes_received=count_subquery(apps.get_model('recipes', 'RecipeLike'), 'recipe__author'),
+        follower_count=count_subquery(UserFollowing, 'followed_user'),
+        following_count=count_subquery(UserFollowing, 'user'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_userfollowing'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('recipes', '0015_recipeingredient_base_amount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Użytkownik')),
+                ('recipe_count', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Liczba przepisów')),
+                ('likes_received', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Otrzymane polubienia')),
+                ('follower_count', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Liczba obserwujących')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Liczba obserwowanych')),
+            ],
+            options={
+                'verbose_name': 'Statystyki użytkownika',
+                'verbose_name_plural': 'Statystyki użytkowników',
+            },
+        ),
+        migrations.RunPython(backfill_user_stats, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,11 @@
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
+from ksiazkakucharska.relations import invalidate_relations
+from accounts import leaderboards
+from recipes import versions
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -20,7 +23,7 @@ class UserProfile(models.Model):
     @property
     def recipe_count(self):
         """Zwraca liczbę przepisów utworzonych przez użytkownika"""
-        return self.user.recipe_set.count()
+        return UserStats.for_user(self.user).recipe_count
     
     @property
     def fridge_items_count(self):
@@ -30,12 +33,12 @@ class UserProfile(models.Model):
     @property
     def followers_count(self):
         """Zwraca liczbę użytkowników śledzących tego użytkownika"""
-        return UserFollowing.objects.filter(followed_user=self.user).count()
+        return UserStats.for_user(self.user).follower_count
     
     @property
     def following_count(self):
         """Zwraca liczbę użytkowników, których śledzi ten użytkownik"""
-        return UserFollowing.objects.filter(user=self.user).count()
+        return UserStats.for_user(self.user).following_count
 
 class UserFollowing(models.Model):
     """Model do śledzenia użytkowników"""
@@ -51,6 +54,73 @@ class UserFollowing(models.Model):
     def __str__(self):
         return f"{self.user.username} śledzi {self.followed_user.username}"
 
+class UserStats(models.Model):
+    """
+    Statystyki użytkownika aktualizowane atomowo (F()) przez sygnały przy dodawaniu
+    i usuwaniu przepisów, polubień i obserwacji. Pola rankingów są indeksowane.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats', verbose_name="Użytkownik")
+    recipe_count = models.PositiveIntegerField(default=0, db_index=True, verbose_name="Liczba przepisów")
+    likes_received = models.PositiveIntegerField(default=0, db_index=True, verbose_name="Otrzymane polubienia")
+    follower_count = models.PositiveIntegerField(default=0, db_index=True, verbose_name="Liczba obserwujących")
+    following_count = models.PositiveIntegerField(default=0, verbose_name="Liczba obserwowanych")
+    
+    class Meta:
+        verbose_name = "Statystyki użytkownika"
+        verbose_name_plural = "Statystyki użytkowników"
+    
+    def __str__(self):
+        return f"Statystyki {self.user.username}"
+    
+    @classmethod
+    def for_user(cls, user):
+        """Zwraca statystyki użytkownika (tworzy brakujący wiersz, np. dla konta sprzed migracji)"""
+        try:
+            return user.stats
+        except cls.DoesNotExist:
+            stats = cls.rebuild([user.pk])[0]
+            user.stats = stats
+            return stats
+    
+    @classmethod
+    def change(cls, user_id, field, delta):
+        """Atomowo zmienia licznik użytkownika i po zatwierdzeniu transakcji aktualizuje rankingi"""
+        if user_id is None:
+            return
+        queryset = cls.objects.filter(pk=user_id)
+        if delta < 0:
+            # Licznik nie może spaść poniżej zera (np. po ręcznej zmianie danych)
+            queryset = queryset.filter(**{f'{field}__gte': -delta})
+        queryset.update(**{field: models.F(field) + delta})
+        transaction.on_commit(lambda: leaderboards.refresh_user(user_id))
+    
+    @classmethod
+    def rebuild(cls, user_ids=None):
+        """Przelicza statystyki od nowa z danych (wszystkich lub wybranych użytkowników)"""
+        from django.db.models import Count, OuterRef, Subquery
+        from django.db.models.functions import Coalesce
+        from recipes.models import Recipe, RecipeLike
+        
+        def count(queryset, fk_field):
+            counts = queryset.filter(**{fk_field: OuterRef('pk')}).order_by().values(fk_field).annotate(
+                total=Count('pk')
+            ).values('total')
+            return Coalesce(Subquery(counts), 0)
+        
+        users = User.objects.all() if user_ids is None else User.objects.filter(pk__in=user_ids)
+        cls.objects.bulk_create(
+            [cls(user_id=user_id) for user_id in users.filter(stats__isnull=True).values_list('pk', flat=True)],
+            ignore_conflicts=True,
+        )
+        stats = cls.objects.filter(user__in=users)
+        stats.update(
+            recipe_count=count(Recipe.objects.all(), 'author'),
+            likes_received=count(RecipeLike.objects.all(), 'recipe__author'),
+            follower_count=count(UserFollowing.objects.all(), 'followed_user'),
+            following_count=count(UserFollowing.objects.all(), 'user'),
+        )
+        return list(stats)
+
 class RecipeHistory(models.Model):
     """Model przechowujący historię przygotowanych przepisów przez użytkownika"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recipe_history', verbose_name="Użytkownik")
@@ -82,13 +152,71 @@ class RecipeHistory(models.Model):
             notes=notes
         )
 
+def recipe_author_id(recipe_id):
+    """ID autora przepisu (polubienie zna tylko ID przepisu)"""
+    from recipes.models import Recipe
+    return Recipe.objects.filter(pk=recipe_id).values_list('author_id', flat=True).first()
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     """Automatycznie tworzy profil dla nowego użytkownika"""
     if created:
         UserProfile.objects.create(user=instance)
 
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, **kwargs):
+    """Tworzy pusty wiersz statystyk dla nowego użytkownika"""
+    if created:
+        UserStats.objects.create(user=instance)
+
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     """Zapisuje profil użytkownika przy zapisie użytkownika"""
     instance.profile.save()
+
+@receiver([post_save, post_delete], sender=UserFollowing)
+def invalidate_request_followed_users(sender, instance, **kwargs):
+    """Unieważnia wczytaną w bieżącym żądaniu listę śledzonych użytkowników i wersję obserwacji"""
+    invalidate_relations(instance.user_id)
+    versions.bump_version(versions.FOLLOWING, instance.user_id)
+
+@receiver(post_save, sender=UserFollowing)
+def increment_follow_stats(sender, instance, created, **kwargs):
+    """Zwiększa liczniki obserwujących i obserwowanych po rozpoczęciu obserwacji"""
+    if created:
+        UserStats.change(instance.followed_user_id, 'follower_count', 1)
+        UserStats.change(instance.user_id, 'following_count', 1)
+
+@receiver(post_delete, sender=UserFollowing)
+def decrement_follow_stats(sender, instance, **kwargs):
+    """Zmniejsza liczniki obserwujących i obserwowanych po zakończeniu obserwacji"""
+    UserStats.change(instance.followed_user_id, 'follower_count', -1)
+    UserStats.change(instance.user_id, 'following_count', -1)
+
+@receiver(post_save, sender='recipes.Recipe')
+def increment_recipe_stats(sender, instance, created, **kwargs):
+    """Zwiększa liczbę przepisów autora po dodaniu przepisu"""
+    if created:
+        UserStats.change(instance.author_id, 'recipe_count', 1)
+
+@receiver(post_delete, sender='recipes.Recipe')
+def decrement_recipe_stats(sender, instance, **kwargs):
+    """Zmniejsza liczbę przepisów autora po usunięciu przepisu"""
+    UserStats.change(instance.author_id, 'recipe_count', -1)
+
+@receiver(post_save, sender='recipes.RecipeLike')
+def increment_likes_received(sender, instance, created, **kwargs):
+    """Zwiększa liczbę polubień otrzymanych przez autora przepisu"""
+    if created:
+        UserStats.change(recipe_author_id(instance.recipe_id), 'likes_received', 1)
+
+@receiver(post_delete, sender='recipes.RecipeLike')
+def decrement_likes_received(sender, instance, **kwargs):
+    """Zmniejsza liczbę polubień otrzymanych przez autora przepisu (także przy usuwaniu przepisu)"""
+    UserStats.change(recipe_author_id(instance.recipe_id), 'likes_received', -1)
+
+@receiver(post_delete, sender=UserStats)
+def remove_user_from_leaderboards(sender, instance, **kwargs):
+    """Usuwa z rankingów użytkownika, którego konto zostało usunięte"""
+    user_id = instance.user_id
+    transaction.on_commit(lambda: leaderboards.refresh_user(user_id))
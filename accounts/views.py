@@ -14,16 +14,17 @@ from django.utils.encoding import force_bytes, force_str
 from django.core.mail import EmailMessage
 from django.db.models.query_utils import Q
 from django.contrib.auth.tokens import default_token_generator
-from django.db.models import Count, Avg
 from django.http import JsonResponse, HttpResponseRedirect
 from django.views.decorators.http import require_POST
 from django.contrib.auth.views import LoginView
 
 from recipes.models import Recipe, RecipeLike
 from fridge.models import FridgeItem, ExpiryNotification
+from fridge.availability import FridgeSnapshot
 from shopping.models import ShoppingList
 
-from .models import UserProfile, RecipeHistory, UserFollowing
+from .models import UserProfile, RecipeHistory, UserFollowing, UserStats
+from .leaderboards import leaderboard_users
 from .forms import UserProfileForm, CustomUserCreationForm, CustomPasswordChangeForm
 
 # Funkcja pomocnicza do wysyłania emaili
@@ -106,7 +107,7 @@ def activation_sent(request):
 def dashboard(request):
     """Główny panel użytkownika"""
     # Pobierz ostatnie przepisy użytkownika
-    user_recipes = Recipe.objects.filter(author=request.user).order_by('-created_at')[:5]
+    user_recipes = Recipe.objects.cards().filter(author=request.user).order_by('-created_at')[:5]
     
     # Pobierz produkty z lodówki
     fridge_items = FridgeItem.objects.filter(user=request.user).order_by('ingredient__name')[:10]
@@ -119,23 +120,20 @@ def dashboard(request):
     
     # Pobierz przepisy, które można przygotować z dostępnych składników
     available_recipes = []
-    recipes = Recipe.objects.all().order_by('-created_at')[:20]  # Ogranicz do 20 najnowszych przepisów
+    recipes = Recipe.objects.cards(with_ingredients=True).order_by('-created_at')[:20]  # Ogranicz do 20 najnowszych przepisów
+    snapshot = FridgeSnapshot(request.user)
     
     for recipe in recipes:
-        if recipe.can_be_prepared_with_available_ingredients(request.user):
+        if snapshot.can_prepare(recipe):
             available_recipes.append(recipe)
             if len(available_recipes) >= 5:  # Ogranicz do 5 przepisów
                 break
     
     # Pobierz top 3 najlepsze przepisy (z największą liczbą polubień)
-    top_recipes = Recipe.objects.annotate(
-        likes_total=Count('likes')
-    ).order_by('-likes_total', '-created_at')[:3]
+    top_recipes = Recipe.objects.cards().order_by('-like_count', '-created_at')[:3]
     
     # Pobierz ranking użytkowników (top 5) dodających najwięcej przepisów
-    top_users = User.objects.annotate(
-        recipes_count=Count('recipe')
-    ).order_by('-recipes_count')[:5]
+    top_users = leaderboard_users('recipes', limit=5)
     
     context = {
         'user_recipes': user_recipes,
@@ -143,7 +141,7 @@ def dashboard(request):
         'shopping_lists': shopping_lists,
         'expired_count': len(expired_items),
         'available_recipes': available_recipes,
-        'recipe_count': Recipe.objects.filter(author=request.user).count(),
+        'recipe_count': UserStats.for_user(request.user).recipe_count,
         'fridge_item_count': FridgeItem.objects.filter(user=request.user).count(),
         'shopping_list_count': ShoppingList.objects.filter(user=request.user).count(),
         'top_recipes': top_recipes,
@@ -170,12 +168,11 @@ def profile_view(request):
     # Pobierz historię przygotowania przepisów
     recipe_history = RecipeHistory.objects.filter(user=request.user)[:5]
     
-    # Pobierz liczbę obserwowanych i obserwujących
-    following_count = UserFollowing.objects.filter(user=request.user).count()
-    followers_count = UserFollowing.objects.filter(followed_user=request.user).count()
-    
-    # Pobierz liczby do statystyk
-    recipes_count = Recipe.objects.filter(author=request.user).count()
+    # Pobierz liczbę obserwowanych, obserwujących i przepisów
+    stats = UserStats.for_user(request.user)
+    following_count = stats.following_count
+    followers_count = stats.follower_count
+    recipes_count = stats.recipe_count
     
     # Sprawdź czy istnieje model FridgeItem
     try:
@@ -224,12 +221,7 @@ def user_profile_view(request, username):
     user = get_object_or_404(User, username=username)
     
     # Sprawdź, czy zalogowany użytkownik obserwuje tego użytkownika
-    is_following = False
-    if request.user.is_authenticated:
-        is_following = UserFollowing.objects.filter(
-            user=request.user, 
-            followed_user=user
-        ).exists()
+    is_following = user.pk in request.user_relations.followed_user_ids
     
     # Dodanie debugowania
     print(f"DEBUG: Username: {username}, is_following: {is_following}, user authenticated: {request.user.is_authenticated}")
@@ -238,8 +230,9 @@ def user_profile_view(request, username):
     recipes = Recipe.objects.filter(author=user, is_public=True)
     
     # Pobierz liczbę obserwowanych i obserwujących
-    following_count = UserFollowing.objects.filter(user=user).count()
-    followers_count = UserFollowing.objects.filter(followed_user=user).count()
+    stats = UserStats.for_user(user)
+    following_count = stats.following_count
+    followers_count = stats.follower_count
     
     context = {
         'profile_user': user,
@@ -287,7 +280,7 @@ def toggle_follow(request, username):
             'status': 'success',
             'success': True,  # Dodajemy dla kompatybilności z różnymi szablonami
             'is_following': is_following,
-            'followers_count': UserFollowing.objects.filter(followed_user=user_to_follow).count()
+            'followers_count': UserStats.for_user(user_to_follow).follower_count
         })
     
     # W przeciwnym razie przekieruj z powrotem do profilu użytkownika
@@ -325,7 +318,7 @@ def followers(request):
     followers = UserFollowing.objects.filter(followed_user=request.user).select_related('user')
     
     # Pobierz ID użytkowników, których obecnie obserwuje zalogowany użytkownik
-    following_ids = UserFollowing.objects.filter(user=request.user).values_list('followed_user_id', flat=True)
+    following_ids = request.user_relations.followed_user_ids
     
     context = {
         'followers': followers,
@@ -338,32 +331,13 @@ def followers(request):
 @login_required
 def top_users_list(request):
     """Wyświetla listę najpopularniejszych użytkowników"""
-    # Użytkownicy z największą liczbą polubień przepisów
-    top_liked_users = User.objects.annotate(
-        likes_count=Count('recipe__likes')
-    ).exclude(
-        likes_count=0
-    ).order_by('-likes_count')[:10]
-    
-    # Użytkownicy z największą liczbą przepisów
-    most_recipes_users = User.objects.annotate(
-        recipes_count=Count('recipe')
-    ).exclude(
-        recipes_count=0
-    ).order_by('-recipes_count')[:10]
-    
-    # Użytkownicy z największą liczbą obserwujących
-    most_followers_users = User.objects.annotate(
-        followers_count=Count('followers')
-    ).exclude(
-        followers_count=0
-    ).order_by('-followers_count')[:10]
+    # Rankingi utrzymywane przyrostowo na podstawie tabeli UserStats
+    top_liked_users = leaderboard_users('likes')
+    most_recipes_users = leaderboard_users('recipes')
+    most_followers_users = leaderboard_users('followers')
     
     # Sprawdź, których użytkowników śledzi zalogowany użytkownik
-    if request.user.is_authenticated:
-        followed_users = UserFollowing.objects.filter(user=request.user).values_list('followed_user_id', flat=True)
-    else:
-        followed_users = []
+    followed_users = request.user_relations.followed_user_ids
     
     context = {
         'top_liked_users': top_liked_users,
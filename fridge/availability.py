@@ -0,0 +1,184 @@
+"""
+Zbiorcze sprawdzanie dostępności składników w lodówce użytkownika.
+
+FridgeSnapshot sumuje produkty z lodówki per składnik w jednostkach bazowych
+(g, ml lub sztuki) - sumowanie wykonuje baza danych na kolumnie base_amount. Na tej podstawie
+odpowiada na pytania o brakujące i dostępne składniki dowolnej liczby
+przepisów bez ponownego odpytywania bazy danych.
+
+Listy brakujących składników są zapamiętywane w pamięci podręcznej pod kluczem
+(użytkownik, wersja lodówki, przepis, wersja przepisu, liczba porcji). Wersje
+(recipes/versions.py) zmieniają się przy każdej zmianie produktów w lodówce lub
+składników przepisu, a lodówka jest wczytywana z bazy dopiero wtedy, gdy
+któregoś wyniku nie ma w pamięci podręcznej.
+"""
+import copy
+import logging
+
+from django.core.cache import cache
+
+from recipes import versions
+from recipes.conversion_graph import get_conversion_graph
+from recipes.utils import convert_units
+
+logger = logging.getLogger(__name__)
+
+# Jak długo (w sekundach) przechowywać wyniki sprawdzenia dostępności
+AVAILABILITY_CACHE_TIMEOUT = 3600
+
+
+def touch_fridge(user_id):
+    """Oznacza zmianę zawartości lodówki użytkownika (unieważnia zapamiętane wyniki)"""
+    versions.bump_version(versions.FRIDGE, user_id)
+
+
+class FridgeSnapshot:
+    """Migawka zawartości lodówki użytkownika"""
+
+    def __init__(self, user):
+        self.user = user
+        self.is_authenticated = user is not None and user.is_authenticated
+        # Wersja odczytana przed wczytaniem danych - wynik obliczony na starszych
+        # danych nigdy nie trafi pod klucz nowszej wersji
+        self.version = versions.get_version(versions.FRIDGE, user.id) if self.is_authenticated else None
+        self._totals = None
+        self._ingredients = None
+        self._available_cache = {}
+
+    @property
+    def totals(self):
+        """{ingredient_id: {unit_id: [jednostka, ilość]}} - wczytywane przy pierwszym użyciu"""
+        if self._totals is None:
+            self._load()
+        return self._totals
+
+    @property
+    def ingredients(self):
+        """{ingredient_id: Ingredient} - składniki obecne w lodówce"""
+        if self._ingredients is None:
+            self._load()
+        return self._ingredients
+
+    def _load(self):
+        from fridge.models import FridgeItem
+        from recipes.models import Ingredient
+
+        self._totals = {}
+        self._ingredients = {}
+        if not self.is_authenticated:
+            return
+
+        items = FridgeItem.objects.filter(user=self.user)
+
+        # Produkty bez ilości bazowej (np. jednostka bez przelicznika) sumujemy w ich własnych jednostkach
+        for item in items.filter(base_amount__isnull=True).select_related('ingredient', 'unit'):
+            self._ingredients[item.ingredient_id] = item.ingredient
+            self._add(item.ingredient_id, item.unit, float(item.amount))
+
+        # Pozostałe sumuje baza danych: SUM(base_amount) GROUP BY składnik, jednostka bazowa
+        totals = FridgeItem.base_totals(items)
+        missing_ids = {ingredient_id for ingredient_id, _ in totals} - set(self._ingredients)
+        if missing_ids:
+            self._ingredients.update(Ingredient.objects.in_bulk(missing_ids))
+
+        graph = get_conversion_graph()
+        for (ingredient_id, base_symbol), amount in totals.items():
+            unit = graph.base_unit(base_symbol)
+            if unit is not None:
+                self._add(ingredient_id, unit, amount)
+
+    def _add(self, ingredient_id, unit, amount):
+        buckets = self._totals.setdefault(ingredient_id, {})
+        if unit.id in buckets:
+            buckets[unit.id][1] += amount
+        else:
+            buckets[unit.id] = [unit, amount]
+
+    def available_amount(self, ingredient, unit):
+        """Zwraca ilość składnika dostępną w lodówce, wyrażoną w podanej jednostce"""
+        if unit is None:
+            return 0.0
+        key = (ingredient.id, unit.id)
+        if key in self._available_cache:
+            return self._available_cache[key]
+
+        total = 0.0
+        for bucket_unit, amount in self.totals.get(ingredient.id, {}).values():
+            if bucket_unit == unit:
+                total += amount
+                continue
+            try:
+                total += convert_units(amount, bucket_unit, unit, ingredient=ingredient)
+            except ValueError as e:
+                # Produkty, których nie da się przeliczyć, pomijamy
+                logger.debug(f"Pominięto {ingredient.name} ({bucket_unit.symbol} -> {unit.symbol}): {e}")
+
+        self._available_cache[key] = total
+        return total
+
+    def is_available(self, ingredient, amount, unit):
+        """Sprawdza, czy składnik jest dostępny w wystarczającej ilości"""
+        try:
+            amount = float(amount)
+        except (ValueError, TypeError):
+            return False
+        if amount <= 0:
+            return True
+        if unit is None or ingredient.id not in self.totals:
+            return False
+        return self.available_amount(ingredient, unit) >= amount
+
+    def _cache_key(self, recipe, servings):
+        if not self.is_authenticated or recipe.pk is None:
+            return None
+        if not servings or servings == recipe.servings:
+            servings = recipe.servings
+        return 'availability:{}:{}:{}:{}:{}:{}'.format(
+            self.user.id, self.version,
+            recipe.pk, versions.get_version(versions.RECIPE, recipe.pk),
+            versions.get_version(versions.UNITS), float(servings)
+        )
+
+    def missing_ingredients(self, recipe, servings=None):
+        """
+        Zwraca listę kopii RecipeIngredient, których brakuje do przygotowania przepisu.
+        Każda kopia ma ustawione atrybuty amount (przeskalowana ilość), missing i available.
+        Wynik jest zapamiętywany w pamięci podręcznej do zmiany lodówki lub przepisu.
+        """
+        key = self._cache_key(recipe, servings)
+        if key is not None:
+            missing = cache.get(key)
+            if missing is not None:
+                return missing
+
+        missing = self._compute_missing(recipe, servings)
+        if key is not None:
+            cache.set(key, missing, AVAILABILITY_CACHE_TIMEOUT)
+        return missing
+
+    def _compute_missing(self, recipe, servings):
+        scale_factor = 1.0
+        if servings and servings != recipe.servings:
+            scale_factor = float(servings) / float(recipe.servings)
+
+        missing = []
+        for ingredient_entry in recipe.ingredients.all():
+            ingredient = ingredient_entry.ingredient
+            unit = ingredient_entry.unit
+            required_amount = ingredient_entry.amount * scale_factor
+
+            if self.is_available(ingredient, required_amount, unit):
+                continue
+
+            available = self.available_amount(ingredient, unit)
+            missing_entry = copy.copy(ingredient_entry)
+            missing_entry.amount = required_amount
+            missing_entry.missing = max(0, required_amount - available)
+            missing_entry.available = available
+            missing.append(missing_entry)
+
+        return missing
+
+    def can_prepare(self, recipe, servings=None):
+        """Sprawdza, czy przepis może być przygotowany z zawartości lodówki"""
+        return not self.missing_ingredients(recipe, servings)
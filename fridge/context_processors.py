@@ -1,16 +1,18 @@
+from django.utils.functional import SimpleLazyObject
+
 from .models import ExpiryNotification
 
 def notifications_processor(request):
     """
     Dodaje liczbę nieprzeczytanych powiadomień do kontekstu wszystkich widoków.
+    Liczba jest pobierana leniwie - dopiero gdy szablon jej użyje - i pochodzi
+    z pamięci podręcznej, więc większość żądań nie wykonuje zapytania.
     """
-    if request.user.is_authenticated:
-        unread_count = ExpiryNotification.objects.filter(
-            user=request.user, is_read=False
-        ).count()
-        return {
-            'unread_notifications_count': unread_count,
-        }
+    def unread_count():
+        if request.user.is_authenticated:
+            return ExpiryNotification.unread_count(request.user.id)
+        return 0
+
     return {
-        'unread_notifications_count': 0,
-    } 
\ No newline at end of file
+        'unread_notifications_count': SimpleLazyObject(unread_count),
+    }
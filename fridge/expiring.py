@@ -0,0 +1,109 @@
+"""
+Ranking przepisów, które pozwalają wykorzystać kończące się produkty z lodówki.
+
+Przepisy są oceniane jednym zapytaniem grupującym: składniki przepisów są
+łączone z produktami użytkownika, których data ważności mija w ciągu
+EXPIRY_HORIZON_DAYS dni, a każdy taki produkt dodaje do wyniku przepisu wagę
+zależną od liczby dni do przeterminowania (dziś - 1, ostatni dzień horyzontu -
+najmniej). Szczegóły wykorzystywanych produktów są pobierane drugim zapytaniem
+tylko dla najlepszych przepisów.
+"""
+from datetime import date, timedelta
+
+from django.db.models import Case, Count, FloatField, Q, Sum, Value, When
+
+from recipes.cookable_index import get_cookable_index
+
+# Ile dni naprzód szukać kończących się produktów
+EXPIRY_HORIZON_DAYS = 7
+
+
+def expiry_weight(days_left, horizon=EXPIRY_HORIZON_DAYS):
+    """Zwraca wagę produktu - im bliżej końca terminu, tym większa (od 1 do 1/(horizon+1))"""
+    return (horizon + 1 - days_left) / (horizon + 1)
+
+
+def _expiring_rows(user, today, horizon):
+    """Składniki przepisów widocznych dla użytkownika, połączone z jego kończącymi się produktami"""
+    from recipes.models import RecipeIngredient
+
+    return RecipeIngredient.objects.filter(
+        Q(recipe__is_public=True) | Q(recipe__author=user),
+        amount__gt=0,
+        ingredient__fridgeitem__user=user,
+        ingredient__fridgeitem__expiry_date__gte=today,
+        ingredient__fridgeitem__expiry_date__lte=today + timedelta(days=horizon),
+    ).order_by()
+
+
+def rank_recipes_for_expiring(user, limit=10, horizon=EXPIRY_HORIZON_DAYS, snapshot=None):
+    """
+    Zwraca listę słowników {'recipe', 'score', 'expiring_ingredients', 'can_be_prepared'}
+    dla co najwyżej limit przepisów, od najlepiej wykorzystujących kończące się produkty.
+
+    expiring_ingredients zawiera dla każdego składnika najwcześniej kończący się
+    produkt: {'name', 'days_left', 'amount', 'unit'}.
+    """
+    from fridge.availability import FridgeSnapshot
+    from recipes.models import Recipe
+
+    if user is None or not user.is_authenticated:
+        return []
+
+    today = date.today()
+    weight = Case(
+        *[
+            When(ingredient__fridgeitem__expiry_date=today + timedelta(days=days_left),
+                 then=Value(expiry_weight(days_left, horizon)))
+            for days_left in range(horizon + 1)
+        ],
+        default=Value(0.0),
+        output_field=FloatField()
+    )
+
+    # Jedno zapytanie: wynik każdego przepisu jako suma wag kończących się produktów
+    ranking = list(
+        _expiring_rows(user, today, horizon).values('recipe_id').annotate(
+            score=Sum(weight),
+            expiring_count=Count('ingredient__fridgeitem', distinct=True)
+        ).order_by('-score', '-expiring_count', '-recipe_id')[:limit]
+    )
+    if not ranking:
+        return []
+
+    recipe_ids = [row['recipe_id'] for row in ranking]
+    recipes = Recipe.objects.cards().in_bulk(recipe_ids)
+
+    # Szczegóły tylko dla wybranych przepisów - najwcześniej kończący się produkt każdego składnika
+    details = {}
+    rows = _expiring_rows(user, today, horizon).filter(recipe_id__in=recipe_ids).values_list(
+        'recipe_id', 'ingredient_id', 'ingredient__name',
+        'ingredient__fridgeitem__expiry_date', 'ingredient__fridgeitem__amount',
+        'ingredient__fridgeitem__unit__symbol'
+    ).order_by('ingredient__fridgeitem__expiry_date', 'ingredient__name')
+    for recipe_id, ingredient_id, name, expiry_date, amount, unit_symbol in rows:
+        used = details.setdefault(recipe_id, {})
+        if ingredient_id not in used:
+            used[ingredient_id] = {
+                'name': name,
+                'days_left': (expiry_date - today).days,
+                'amount': amount,
+                'unit': unit_symbol
+            }
+
+    if snapshot is None:
+        snapshot = FridgeSnapshot(user)
+    cookable_ids = get_cookable_index().cookable_recipe_ids(snapshot)
+
+    results = []
+    for row in ranking:
+        recipe = recipes.get(row['recipe_id'])
+        if recipe is None:
+            continue
+        results.append({
+            'recipe': recipe,
+            'score': row['score'],
+            'expiring_ingredients': list(details.get(recipe.id, {}).values()),
+            'can_be_prepared': recipe.id in cookable_ids
+        })
+    return results
@@ -0,0 +1,36 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from fridge.models import ExpiryNotification, FridgeItem
+
+class Command(BaseCommand):
+    help = ('Generuje powiadomienia o przeterminowanych i kończących się produktach dla wszystkich '
+            'użytkowników. Przeznaczona do uruchamiania codziennie (np. z crona); nie powtarza '
+            'nieprzeczytanych powiadomień o tej samej treści.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Liczba użytkowników przetwarzanych w jednej partii (domyślnie 1000)')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        today = date.today()
+        # Tylko użytkownicy, którzy mają produkty z terminem ważności w najbliższym tygodniu
+        candidates = FridgeItem.objects.filter(expiry_date__lte=today + timedelta(days=7)).exclude(
+            expiry_date=today
+        ).order_by('user_id').values_list('user_id', flat=True).distinct()
+
+        users = created = 0
+        last_user_id = 0
+        while True:
+            # Stronicowanie po kluczu (user_id > ostatni) zamiast OFFSET - każda partia kosztuje tyle samo
+            user_ids = list(candidates.filter(user_id__gt=last_user_id)[:batch_size])
+            if not user_ids:
+                break
+            created += ExpiryNotification.notify_users(user_ids, today=today)
+            users += len(user_ids)
+            last_user_id = user_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Sprawdzono {users} użytkowników, utworzono {created} powiadomień'
+        ))
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:26
+
+from django.db import migrations, models
+
+from recipes.migrations._base_amounts import backfill_base_amounts
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipeingredient_base_amount'),
+        ('fridge', '0002_expirynotification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fridgeitem',
+            name='base_amount',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Ilość w jednostce bazowej'),
+        ),
+        migrations.AddField(
+            model_name='fridgeitem',
+            name='base_unit',
+            field=models.CharField(blank=True, choices=[('g', 'g'), ('ml', 'ml'), ('szt', 'szt')], editable=False, max_length=3, verbose_name='Jednostka bazowa'),
+        ),
+        migrations.RunPython(backfill_base_amounts('fridge', 'FridgeItem'), migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fridge', '0003_fridgeitem_base_amount'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expirynotification',
+            name='content_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40),
+        ),
+        migrations.AddIndex(
+            model_name='expirynotification',
+            index=models.Index(fields=['user', 'is_read', 'content_key'], name='fridge_expi_user_id_84cfb4_idx'),
+        ),
+    ]
@@ -1,13 +1,36 @@
-from django.db import models
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
-from recipes.models import Ingredient, MeasurementUnit
+from recipes.models import BaseQuantity, Ingredient, MeasurementUnit
 from recipes.utils import convert_units
+from ksiazkakucharska import events
+from .availability import touch_fridge
 from django.utils import timezone
 from datetime import date, timedelta
+import hashlib
 import logging
 import math
 
-class FridgeItem(models.Model):
+# Tolerancja błędów zaokrągleń przy przeliczaniu jednostek podczas zużywania produktów
+CONSUMPTION_EPSILON = 1e-6
+# Jak długo (w sekundach) przechowywać liczbę nieprzeczytanych powiadomień
+UNREAD_COUNT_TIMEOUT = 3600
+# Ile razy FridgeItem.bulk_add próbuje zapisu, gdy ten sam produkt jest dodawany równolegle
+BULK_ADD_ATTEMPTS = 3
+
+
+def _to_int(value):
+    """Zamienia identyfikator z formularza lub JSON na liczbę całkowitą (None, jeśli się nie da)"""
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
+
+
+class FridgeItem(BaseQuantity):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='fridge_items', verbose_name="Użytkownik")
     ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, verbose_name="Składnik")
     amount = models.FloatField(verbose_name="Ilość")
@@ -164,6 +187,242 @@ class FridgeItem(models.Model):
             logger.info(f"Utworzono nowy wpis: {new_item}")
             return new_item, converted
     
+    @classmethod
+    def bulk_add(cls, user, rows):
+        """
+        Dodaje wiele produktów do lodówki naraz (np. cały paragon lub listę zakupów).
+
+        Składniki i jednostki są wczytywane dwoma zapytaniami, przeliczanie do
+        jednostek podstawowych odbywa się w pamięci, a wiersze o tym samym kluczu
+        (składnik, jednostka, data ważności) są scalane. Istniejące produkty są
+        blokowane i aktualizowane jednym bulk_update, nowe tworzone jednym
+        bulk_create. Jeśli nowy produkt zostanie w tym czasie dodany równolegle,
+        zapis jest powtarzany, więc ilości zawsze się sumują.
+
+        Args:
+            user (User): Użytkownik
+            rows (iterable): Słowniki z kluczami ingredient_id, unit_id, amount
+                             i opcjonalnie expiry_date (date lub tekst RRRR-MM-DD)
+
+        Returns:
+            dict: Słownik z listą zapisanych produktów (items), liczbą dodanych
+                  pozycji (added), liczbą przeliczonych pozycji (converted)
+                  i listą błędów (errors)
+        """
+        result = {"items": [], "added": 0, "converted": 0, "errors": []}
+        rows = list(rows)
+        if not rows:
+            return result
+
+        ingredient_ids = {_to_int(row.get('ingredient_id')) for row in rows} - {None}
+        unit_ids = {_to_int(row.get('unit_id')) for row in rows} - {None}
+        ingredients = Ingredient.objects.in_bulk(ingredient_ids)
+        # Jednostki z wierszy i jednostki podstawowe (g, ml) jednym zapytaniem
+        units = MeasurementUnit.objects.filter(Q(pk__in=unit_ids) | Q(symbol__in=['g', 'ml'])).in_bulk()
+        base_units = {unit.symbol: unit for unit in units.values() if unit.symbol in ('g', 'ml')}
+
+        # Scal wiersze według klucza unikalności produktu w lodówce
+        merged = {}
+        for row in rows:
+            ingredient = ingredients.get(_to_int(row.get('ingredient_id')))
+            unit = units.get(_to_int(row.get('unit_id')))
+            if ingredient is None or unit is None:
+                result["errors"].append(f"Nieznany składnik lub jednostka: {row}")
+                continue
+
+            try:
+                amount = float(row.get('amount'))
+            except (ValueError, TypeError):
+                amount = 0
+            if amount <= 0:
+                result["errors"].append(f"Nieprawidłowa ilość składnika {ingredient.name}: {row.get('amount')}")
+                continue
+
+            expiry_date = row.get('expiry_date') or None
+            if isinstance(expiry_date, str):
+                try:
+                    expiry_date = date.fromisoformat(expiry_date)
+                except ValueError:
+                    result["errors"].append(f"Nieprawidłowa data ważności składnika {ingredient.name}: {expiry_date}")
+                    continue
+
+            # Przelicz do jednostki podstawowej (sztuki zostają sztukami dla składników liczonych w sztukach)
+            base_unit = base_units.get('ml' if ingredient.unit_type.startswith('volume') else 'g')
+            if base_unit is not None and unit != base_unit and not (unit.type == 'piece' and 'piece' in ingredient.unit_type):
+                try:
+                    amount = convert_units(amount, unit, base_unit, ingredient=ingredient)
+                    unit = base_unit
+                    result["converted"] += 1
+                except ValueError:
+                    pass
+
+            key = (ingredient.id, unit.id, expiry_date)
+            merged[key] = merged.get(key, 0.0) + amount
+            result["added"] += 1
+
+        if not merged:
+            return result
+
+        for attempt in range(BULK_ADD_ATTEMPTS):
+            try:
+                result["items"] = cls._write_merged(user, merged, ingredients, units)
+                break
+            except IntegrityError:
+                # Ten sam produkt dodano równolegle - przy ponownej próbie zostanie
+                # zablokowany i zwiększony, a nie nadpisany
+                if attempt == BULK_ADD_ATTEMPTS - 1:
+                    raise
+        return result
+
+    @classmethod
+    def _write_merged(cls, user, merged, ingredients, units):
+        """
+        Zapisuje scalone ilości {(ingredient_id, unit_id, expiry_date): ilość}:
+        zwiększa zablokowane istniejące produkty i tworzy brakujące. Zgłasza
+        IntegrityError, gdy brakujący produkt został w międzyczasie dodany
+        w innej transakcji (zmiany w tej transakcji są wtedy wycofywane).
+        """
+        with transaction.atomic():
+            existing = {
+                (item.ingredient_id, item.unit_id, item.expiry_date): item
+                # Bez domyślnego sortowania - łączyłoby tabelę składników i blokowało jej wiersze
+                for item in cls.objects.select_for_update().filter(
+                    user=user, ingredient_id__in={key[0] for key in merged}
+                ).order_by()
+            }
+
+            to_update = []
+            to_create = []
+            for (ingredient_id, unit_id, expiry_date), amount in merged.items():
+                item = existing.get((ingredient_id, unit_id, expiry_date))
+                if item is not None:
+                    item.amount += amount
+                    item.ingredient = ingredients[ingredient_id]
+                    item.unit = units[unit_id]
+                    to_update.append(item)
+                else:
+                    item = cls(
+                        user=user,
+                        ingredient=ingredients[ingredient_id],
+                        unit=units[unit_id],
+                        amount=amount,
+                        expiry_date=expiry_date
+                    )
+                    to_create.append(item)
+                item.update_base_amount()
+
+            if to_update:
+                cls.objects.bulk_update(to_update, ['amount', 'base_amount', 'base_unit'])
+            if to_create:
+                cls.objects.bulk_create(to_create)
+            if to_update or to_create:
+                # Zapisy zbiorcze nie wysyłają sygnałów - wersję lodówki zmieniamy sami
+                touch_fridge(user.id)
+
+        return to_update + to_create
+
+    @classmethod
+    def _lock_items(cls, user, ingredients):
+        """
+        Pobiera jednym zapytaniem i blokuje (select_for_update) produkty użytkownika
+        dla podanych składników. Musi być wywołana wewnątrz transakcji.
+
+        Args:
+            user (User): Użytkownik
+            ingredients (dict): Słownik {ingredient_id: Ingredient}
+
+        Returns:
+            dict: Słownik {ingredient_id: [FridgeItem]} w kolejności FIFO -
+                  najpierw najkrótszy termin ważności, potem najstarsze zakupy
+        """
+        items = list(
+            cls.objects.select_for_update()
+            .filter(user=user, ingredient_id__in=list(ingredients))
+            .order_by('expiry_date', 'purchase_date', 'id')
+        )
+
+        # Jednostki wczytujemy osobno, aby blokada nie obejmowała wierszy tabeli jednostek
+        units = MeasurementUnit.objects.in_bulk({item.unit_id for item in items})
+
+        items_by_ingredient = {}
+        for item in items:
+            item.unit = units[item.unit_id]
+            item.ingredient = ingredients[item.ingredient_id]
+            items_by_ingredient.setdefault(item.ingredient_id, []).append(item)
+        return items_by_ingredient
+
+    @staticmethod
+    def _plan_consumption(items, ingredient, amount, unit, updated, deleted):
+        """
+        Planuje zużycie ilości składnika z zablokowanych produktów według reguły FIFO,
+        zaczynając od produktów w tej samej jednostce. Ilości produktów są zmieniane
+        tylko w pamięci - zmienione produkty trafiają do updated, zużyte do deleted
+        (słowniki {id: FridgeItem}).
+
+        Returns:
+            tuple: (lista użytych produktów, ilość, której nie udało się pokryć)
+        """
+        logger = logging.getLogger(__name__)
+        remaining = float(amount)
+        used = []
+        if unit is None:
+            return used, remaining
+
+        ordered = [item for item in items if item.unit_id == unit.id]
+        ordered += [item for item in items if item.unit_id != unit.id]
+
+        for item in ordered:
+            if remaining <= CONSUMPTION_EPSILON:
+                break
+            if item.pk in deleted:
+                continue
+
+            item_amount = float(item.amount)
+            if item.unit_id == unit.id:
+                available = item_amount
+                needed = remaining
+            else:
+                try:
+                    available = convert_units(item_amount, item.unit, unit, ingredient=ingredient)
+                    needed = convert_units(remaining, unit, item.unit, ingredient=ingredient)
+                except ValueError as e:
+                    # Produkty, których nie da się przeliczyć, pomijamy
+                    logger.debug(f"Pominięto {ingredient.name} ({item.unit.symbol} -> {unit.symbol}): {e}")
+                    continue
+
+            if item_amount > needed:
+                # Produkt wystarcza - zmniejsz jego ilość
+                item.amount = item_amount - needed
+                updated[item.pk] = item
+                used.append({'item': item, 'amount': needed, 'unit': item.unit})
+                remaining = 0.0
+            else:
+                # Zużywamy cały produkt
+                updated.pop(item.pk, None)
+                deleted[item.pk] = item
+                used.append({
+                    'item': item,
+                    'amount': item_amount,
+                    'unit': item.unit,
+                    'fully_used': True,
+                    'equivalent': available
+                })
+                remaining -= available
+
+        return used, max(0.0, remaining)
+
+    @classmethod
+    def _apply_consumption(cls, user, updated, deleted):
+        """Zapisuje zaplanowane zużycie: jedno zbiorcze UPDATE i jedno DELETE"""
+        if updated:
+            for item in updated.values():
+                item.update_base_amount()
+            cls.objects.bulk_update(list(updated.values()), ['amount', 'base_amount', 'base_unit'])
+            # bulk_update nie wysyła sygnałów - wersję lodówki zmieniamy sami
+            touch_fridge(user.id)
+        if deleted:
+            cls.objects.filter(id__in=list(deleted)).delete()
+
     @classmethod
     def remove_from_fridge(cls, user, ingredient, amount, unit):
         """
@@ -171,257 +430,100 @@ class FridgeItem(models.Model):
         Usuwa produkty od najstarszych/najbliższych przeterminowania.
         Zwraca True, jeśli udało się usunąć całą ilość, False w przeciwnym razie.
         """
-        # Inicjalizacja loggera
         logger = logging.getLogger(__name__)
         logger.info(f"Usuwanie z lodówki: {amount} {unit.symbol} składnika {ingredient.name}")
-        
-        # Pobierz wszystkie pasujące produkty z lodówki, posortowane od najstarszych
-        items = cls.objects.filter(
-            user=user,
-            ingredient=ingredient
-        ).order_by('expiry_date', 'purchase_date')
-        
-        if not items:
-            logger.info(f"Brak produktu {ingredient.name} w lodówce")
+
+        with transaction.atomic():
+            items = cls._lock_items(user, {ingredient.id: ingredient}).get(ingredient.id, [])
+            if not items:
+                logger.info(f"Brak produktu {ingredient.name} w lodówce")
+                return False
+
+            updated, deleted = {}, {}
+            _, remaining = cls._plan_consumption(items, ingredient, amount, unit, updated, deleted)
+            # Zużyta część zostaje usunięta nawet wtedy, gdy całej ilości nie udało się pokryć
+            cls._apply_consumption(user, updated, deleted)
+
+        if remaining > CONSUMPTION_EPSILON:
+            logger.warning(f"Nie udało się usunąć całej żądanej ilości {ingredient.name}. Pozostało {remaining} {unit.symbol}")
             return False
-        
-        amount_to_remove = float(amount)
-        
-        for item in items:
-            # Jeśli jednostki są różne, przelicz ilość
-            if item.unit != unit:
-                try:
-                    from recipes.utils import convert_units
-                    converted_amount = convert_units(amount_to_remove, unit, item.unit, ingredient=ingredient)
-                    logger.info(f"Konwersja dla usuwania: {amount_to_remove} {unit.symbol} = {converted_amount} {item.unit.symbol}")
-                except ValueError as e:
-                    # Jeśli konwersja niemożliwa, przejdź do następnego produktu
-                    logger.error(f"Błąd konwersji: {e} dla {ingredient.name}")
-                    continue
-            else:
-                converted_amount = amount_to_remove
-            
-            if item.amount > converted_amount:
-                # Jeśli w tym produkcie jest więcej niż potrzebujemy, zmniejsz jego ilość
-                item.amount -= converted_amount
-                item.save()
-                logger.info(f"Zaktualizowano ilość produktu {ingredient.name} na {item.amount} {item.unit.symbol}")
-                return True
-            else:
-                # Jeśli zużywamy cały produkt, usuń go i odejmij od ilości do usunięcia
-                current_amount = float(item.amount)
-                if item.unit != unit:
-                    try:
-                        from recipes.utils import convert_units
-                        amount_removed = convert_units(current_amount, item.unit, unit, ingredient=ingredient)
-                        amount_to_remove -= amount_removed
-                        logger.info(f"Usunięto cały produkt {ingredient.name} ({current_amount} {item.unit.symbol} = {amount_removed} {unit.symbol})")
-                    except ValueError as e:
-                        logger.error(f"Błąd konwersji odwrotnej: {e} dla {ingredient.name}")
-                        continue
-                else:
-                    amount_to_remove -= current_amount
-                    logger.info(f"Usunięto cały produkt {ingredient.name} ({current_amount} {unit.symbol})")
-                
-                item.delete()
-                
-                # Jeśli usunęliśmy wszystko, zwróć True
-                if amount_to_remove <= 0:
-                    return True
-        
-        # Jeśli dotarliśmy tutaj, znaczy to, że nie udało się usunąć całej ilości
-        logger.warning(f"Nie udało się usunąć całej żądanej ilości {ingredient.name}. Pozostało {amount_to_remove} {unit.symbol}")
-        return False
-    
+        return True
+
     @classmethod
     def use_recipe_ingredients(cls, user, recipe, servings=None):
         """
         Usuwa z lodówki składniki potrzebne do przygotowania przepisu.
         Używa produktów według reguły FIFO - najpierw najkrótszy termin ważności.
-        
+
+        Produkty są wczytywane i blokowane jednym zapytaniem, plan zużycia jest
+        liczony w pamięci i zapisywany w jednej transakcji - albo zużywane są
+        wszystkie składniki, albo żaden.
+
         Args:
             user (User): Użytkownik
             recipe (Recipe): Przepis
             servings (int, optional): Liczba porcji. Domyślnie używa liczby porcji z przepisu.
-            
+
         Returns:
             dict: Słownik z informacjami o usuniętych składnikach i ewentualnych brakach
         """
         result = {"success": True, "missing": [], "used": []}
-        
-        # Inicjalizacja loggera
+
         logger = logging.getLogger(__name__)
         logger.info(f"Używanie składników do przepisu: {recipe.title}")
-        
+
         # Jeśli nie podano liczby porcji, użyj domyślnej z przepisu
         if not servings:
             servings = recipe.servings
-            
+
         # Oblicz współczynnik skalowania
         scale_factor = float(servings) / float(recipe.servings)
         logger.info(f"Współczynnik skalowania: {scale_factor} (z {recipe.servings} na {servings} porcji)")
-        
-        # Import funkcji konwersji jednostek
-        from recipes.utils import convert_units
-        
-        # Sprawdź, czy wszystkie składniki są dostępne w wystarczającej ilości
-        for ingredient_entry in recipe.ingredients.all():
-            ingredient = ingredient_entry.ingredient
-            amount_needed = float(ingredient_entry.amount) * scale_factor
-            unit = ingredient_entry.unit
-            
-            logger.info(f"Sprawdzam dostępność: {amount_needed} {unit.symbol} składnika {ingredient.name}")
-            
-            # Sprawdź dostępność składnika
-            if not cls.check_ingredient_availability(user, ingredient, amount_needed, unit):
-                result["success"] = False
-                result["missing"].append({
-                    "ingredient": ingredient,
-                    "amount_needed": amount_needed,
-                    "unit": unit
-                })
-                logger.warning(f"Brak wystarczającej ilości {ingredient.name} ({amount_needed} {unit.symbol})")
-        
-        # Jeśli wszystkie składniki są dostępne, usuń je z lodówki
-        if result["success"]:
-            for ingredient_entry in recipe.ingredients.all():
-                ingredient = ingredient_entry.ingredient
-                amount_needed = float(ingredient_entry.amount) * scale_factor
-                unit = ingredient_entry.unit
-                
-                logger.info(f"Usuwam z lodówki: {amount_needed} {unit.symbol} składnika {ingredient.name}")
-                
-                # Pobierz dostępne w lodówce produkty dla tego składnika, posortowane po dacie ważności (FIFO)
-                fridge_items = cls.objects.filter(
-                    user=user,
-                    ingredient=ingredient
-                ).order_by('expiry_date', 'purchase_date')  # najpierw najkrótszy termin ważności, potem najstarsze zakupy
-                
-                amount_to_remove = amount_needed
-                removed_items = []
-                
-                # Najpierw użyj produktów w tej samej jednostce, co w przepisie
-                for item in fridge_items.filter(unit=unit):
-                    # Jeśli już usunęliśmy całą potrzebną ilość, przerwij pętlę
-                    if amount_to_remove <= 0:
-                        break
-                    
-                    try:
-                        # Zapewnij, że wartości są typu float
-                        item_amount = float(item.amount)
-                        
-                        if item_amount > amount_to_remove:
-                            # Mamy wystarczającą ilość w tym produkcie
-                            item.amount = item_amount - amount_to_remove
-                            item.save()
-                            
-                            # Rejestruj użycie - ile i z jakiego produktu
-                            removed_items.append({
-                                'item': item,
-                                'amount': amount_to_remove,
-                                'unit': item.unit
-                            })
-                            
-                            logger.info(f"Użyto {amount_to_remove} {unit.symbol} z {item}")
-                            
-                            # Zaktualizuj ilość do usunięcia na 0
-                            amount_to_remove = 0
-                        else:
-                            # Zużywamy cały produkt
-                            removed_items.append({
-                                'item': item,
-                                'amount': item_amount,
-                                'unit': item.unit,
-                                'fully_used': True
-                            })
-                            
-                            logger.info(f"Użyto całego produktu: {item}")
-                            
-                            # Odejmij usuniętą ilość od ilości do usunięcia
-                            amount_to_remove -= item_amount
-                            
-                            # Usuń produkt z lodówki
-                            item.delete()
-                    except Exception as e:
-                        logger.error(f"Błąd podczas usuwania składnika {ingredient.name}: {e}")
-                        continue
-                
-                # Jeśli nadal potrzebujemy więcej, użyj produktów w innych jednostkach
-                if amount_to_remove > 0:
-                    logger.info(f"Potrzeba jeszcze {amount_to_remove} {unit.symbol} składnika {ingredient.name}")
-                    
-                    for item in fridge_items.exclude(unit=unit):
-                        # Jeśli już usunęliśmy całą potrzebną ilość, przerwij pętlę
-                        if amount_to_remove <= 0:
-                            break
-                        
-                        try:
-                            # Konwertuj ilość potrzebną na jednostkę produktu w lodówce
-                            converted_amount = convert_units(amount_to_remove, unit, item.unit, ingredient=ingredient)
-                            
-                            # Zapewnij, że wartości są typu float
-                            item_amount = float(item.amount)
-                            converted_amount = float(converted_amount)
-                            
-                            logger.info(f"Konwersja: {amount_to_remove} {unit.symbol} = {converted_amount} {item.unit.symbol}")
-                                
-                            if item_amount > converted_amount:
-                                # Mamy wystarczającą ilość w tym produkcie
-                                item.amount = item_amount - converted_amount
-                                item.save()
-                                
-                                # Rejestruj użycie - ile i z jakiego produktu
-                                removed_items.append({
-                                    'item': item,
-                                    'amount': converted_amount,
-                                    'unit': item.unit
-                                })
-                                
-                                # Konwersja z powrotem na jednostkę przepisu, aby odliczyć od amount_to_remove
-                                amount_removed_in_recipe_unit = convert_units(converted_amount, item.unit, unit, ingredient=ingredient)
-                                
-                                logger.info(f"Użyto {converted_amount} {item.unit.symbol} z {item} (odpowiada {amount_removed_in_recipe_unit} {unit.symbol})")
-                                
-                                # Zaktualizuj ilość do usunięcia
-                                amount_to_remove -= amount_removed_in_recipe_unit
-                            else:
-                                # Zużywamy cały produkt
-                                # Konwertuj ilość z produktu na jednostkę przepisu
-                                amount_removed_in_recipe_unit = convert_units(item_amount, item.unit, unit, ingredient=ingredient)
-                                
-                                removed_items.append({
-                                    'item': item,
-                                    'amount': item_amount,
-                                    'unit': item.unit,
-                                    'fully_used': True,
-                                    'equivalent': amount_removed_in_recipe_unit
-                                })
-                                
-                                logger.info(f"Użyto całego produktu: {item} (odpowiada {amount_removed_in_recipe_unit} {unit.symbol})")
-                                
-                                # Odejmij usuniętą ilość od ilości do usunięcia (w jednostkach przepisu)
-                                amount_to_remove -= amount_removed_in_recipe_unit
-                                
-                                # Usuń produkt z lodówki
-                                item.delete()
-                        except Exception as e:
-                            logger.error(f"Błąd podczas usuwania składnika {ingredient.name} (konwersja): {e}")
-                            continue
-                
-                # Dodaj informację o zużytym składniku do wyniku
+
+        entries = list(recipe.ingredients.select_related('ingredient', 'unit'))
+        ingredients = {entry.ingredient_id: entry.ingredient for entry in entries}
+
+        with transaction.atomic():
+            items_by_ingredient = cls._lock_items(user, ingredients)
+            updated, deleted = {}, {}
+
+            for entry in entries:
+                ingredient = entry.ingredient
+                unit = entry.unit
+                amount_needed = float(entry.amount) * scale_factor
+                if amount_needed <= 0:
+                    continue
+
+                used, remaining = cls._plan_consumption(
+                    items_by_ingredient.get(ingredient.id, []), ingredient, amount_needed, unit, updated, deleted
+                )
+
+                if remaining > CONSUMPTION_EPSILON:
+                    result["success"] = False
+                    result["missing"].append({
+                        "ingredient": ingredient,
+                        "amount_needed": amount_needed,
+                        "unit": unit
+                    })
+                    logger.warning(f"Brak wystarczającej ilości {ingredient.name} ({amount_needed} {unit.symbol if unit else ''})")
+                    continue
+
                 result["used"].append({
                     "ingredient": ingredient,
-                    "amount": ingredient_entry.amount * scale_factor,
+                    "amount": amount_needed,
                     "unit": unit,
-                    "items_used": removed_items,
-                    "remaining_amount": max(0, amount_to_remove)
+                    "items_used": used,
+                    "remaining_amount": 0
                 })
-                
-                if amount_to_remove > 0:
-                    logger.warning(f"Nie udało się usunąć całej ilości {ingredient.name}. Pozostało {amount_to_remove} {unit.symbol}")
-        
+
+            if result["success"]:
+                cls._apply_consumption(user, updated, deleted)
+            else:
+                # Brakuje składników - nic nie zostało zużyte
+                result["used"] = []
+
         return result
-    
+
     @classmethod
     def check_ingredient_availability(cls, user, ingredient, amount, unit):
         """
@@ -498,20 +600,175 @@ class ExpiryNotification(models.Model):
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
+    # Skrót rodzaju powiadomienia i produktów, których dotyczy - do pomijania powtórzeń
+    content_key = models.CharField(max_length=40, blank=True, default='', editable=False)
     
     class Meta:
         ordering = ['-created_at']
         verbose_name = "Powiadomienie o przeterminowaniu"
         verbose_name_plural = "Powiadomienia o przeterminowaniu"
+        indexes = [
+            models.Index(fields=['user', 'is_read', 'content_key']),
+        ]
     
     def __str__(self):
         return f"{self.title} ({self.created_at.strftime('%d.%m.%Y')})"
     
+    def publish(self):
+        """Wysyła powiadomienie do otwartych kart przeglądarki użytkownika (SSE)"""
+        events.publish(self.user_id, 'notification', {
+            'id': self.pk,
+            'title': self.title,
+            'message': self.message,
+        })
+
+    @staticmethod
+    def _unread_count_key(user_id):
+        return f'unread-notifications:{user_id}'
+
+    @classmethod
+    def unread_count(cls, user_id):
+        """Zwraca liczbę nieprzeczytanych powiadomień użytkownika (z pamięci podręcznej)"""
+        key = cls._unread_count_key(user_id)
+        count = cache.get(key)
+        if count is None:
+            count = cls.objects.filter(user_id=user_id, is_read=False).count()
+            cache.set(key, count, UNREAD_COUNT_TIMEOUT)
+        return count
+
+    @classmethod
+    def invalidate_unread_count(cls, *user_ids):
+        """Usuwa zapamiętaną liczbę nieprzeczytanych powiadomień - zostanie policzona przy następnym użyciu"""
+        keys = [cls._unread_count_key(user_id) for user_id in user_ids]
+        cache.delete_many(keys)
+        # Ponownie po zatwierdzeniu transakcji, aby inne żądania nie zapamiętały starej liczby
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+    @classmethod
+    def mark_all_read(cls, user):
+        """Oznacza wszystkie powiadomienia użytkownika jako przeczytane. Zwraca liczbę zmienionych."""
+        updated = cls.objects.filter(user=user, is_read=False).update(is_read=True)
+        if updated:
+            cls.invalidate_unread_count(user.id)
+        return updated
+
+    @staticmethod
+    def make_content_key(kind, item_ids):
+        """Klucz treści powiadomienia - ten sam rodzaj i te same produkty dają ten sam klucz"""
+        payload = f"{kind}:{','.join(str(item_id) for item_id in sorted(item_ids))}"
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    @classmethod
+    def build_notifications(cls, user_id, items, today):
+        """
+        Tworzy (bez zapisu) powiadomienia dla jednego użytkownika.
+
+        Args:
+            user_id (int): ID użytkownika
+            items (list): Krotki (id produktu, data ważności, nazwa składnika) posortowane według daty ważności
+            today (date): Dzień, względem którego liczone są terminy
+
+        Returns:
+            list: Niezapisane obiekty ExpiryNotification
+        """
+        tomorrow = today + timedelta(days=1)
+        groups = {'expired': [], 'tomorrow': [], 'soon': []}
+        for item in items:
+            expiry_date = item[1]
+            if expiry_date < today:
+                groups['expired'].append(item)
+            elif expiry_date == tomorrow:
+                groups['tomorrow'].append(item)
+            elif expiry_date > tomorrow:
+                groups['soon'].append(item)
+
+        notifications = []
+        for kind, group in groups.items():
+            if not group:
+                continue
+
+            count = len(group)
+            if kind == 'soon':
+                names = [f"{name} ({(expiry_date - today).days} dni)" for _, expiry_date, name in group[:5]]
+            else:
+                names = [name for _, _, name in group[:5]]
+            items_list = ", ".join(names)
+            if count > 5:
+                items_list += f" i {count - 5} innych"
+
+            if kind == 'expired':
+                title = "Przeterminowane produkty"
+                message = (f"Masz {count} przeterminowanych produktów w lodówce: {items_list}. "
+                           f"Zalecamy ich usunięcie.")
+            elif kind == 'tomorrow':
+                title = "Produkty wygasają jutro"
+                message = (f"{count} produktów wygasa jutro: {items_list}. "
+                           f"Wykorzystaj je jak najszybciej.")
+            else:
+                title = "Produkty wygasają wkrótce"
+                message = (f"{count} produktów wygasa w ciągu tygodnia: {items_list}. "
+                           f"Zaplanuj wykorzystanie tych produktów.")
+
+            notifications.append(cls(
+                user_id=user_id,
+                title=title,
+                message=message,
+                content_key=cls.make_content_key(kind, [item_id for item_id, _, _ in group])
+            ))
+        return notifications
+
+    @classmethod
+    def notify_users(cls, user_ids, today=None):
+        """
+        Generuje powiadomienia dla grupy użytkowników: jedno zapytanie o produkty
+        z kończącym się terminem, jedno o nieprzeczytane powiadomienia i jeden
+        zbiorczy zapis. Powiadomienia o tej samej treści co nieprzeczytane
+        (ten sam klucz treści) są pomijane.
+
+        Returns:
+            int: Liczba utworzonych powiadomień
+        """
+        if today is None:
+            today = date.today()
+        user_ids = list(user_ids)
+        if not user_ids:
+            return 0
+
+        rows = FridgeItem.objects.filter(
+            user_id__in=user_ids,
+            expiry_date__lte=today + timedelta(days=7)
+        ).exclude(expiry_date=today).order_by('user_id', 'expiry_date', 'ingredient__name').values_list(
+            'user_id', 'id', 'expiry_date', 'ingredient__name'
+        )
+        items_by_user = {}
+        for user_id, item_id, expiry_date, name in rows:
+            items_by_user.setdefault(user_id, []).append((item_id, expiry_date, name))
+
+        existing = set(
+            cls.objects.filter(user_id__in=user_ids, is_read=False).exclude(content_key='').values_list(
+                'user_id', 'content_key'
+            )
+        )
+
+        notifications = []
+        for user_id, items in items_by_user.items():
+            for notification in cls.build_notifications(user_id, items, today):
+                if (user_id, notification.content_key) not in existing:
+                    notifications.append(notification)
+
+        cls.objects.bulk_create(notifications)
+        # bulk_create nie wysyła sygnałów - liczniki nieprzeczytanych unieważniamy sami
+        if notifications:
+            cls.invalidate_unread_count(*{notification.user_id for notification in notifications})
+        for notification in notifications:
+            notification.publish()
+        return len(notifications)
+
     @classmethod
     def check_expiring_products(cls, user):
         """
         Sprawdza produkty, które niedługo się przeterminują lub już są przeterminowane
-        i generuje odpowiednie powiadomienia.
+        i generuje odpowiednie powiadomienia (bez powtarzania nieprzeczytanych).
         
         Args:
             user (User): Użytkownik, dla którego sprawdzane są produkty
@@ -519,79 +776,23 @@ class ExpiryNotification(models.Model):
         Returns:
             int: Liczba wygenerowanych powiadomień
         """
-        today = date.today()
-        tomorrow = today + timedelta(days=1)
-        next_week = today + timedelta(days=7)
-        
-        # Produkty przeterminowane, o których użytkownik jeszcze nie został powiadomiony
-        expired_items = FridgeItem.objects.filter(
-            user=user,
-            expiry_date__lt=today
-        )
-        
-        # Produkty, które przeterminują się jutro
-        expiring_tomorrow = FridgeItem.objects.filter(
-            user=user, 
-            expiry_date=tomorrow
-        )
-        
-        # Produkty, które przeterminują się w ciągu tygodnia
-        expiring_soon = FridgeItem.objects.filter(
-            user=user,
-            expiry_date__gt=tomorrow,
-            expiry_date__lte=next_week
-        )
-        
-        notifications_count = 0
-        
-        # Powiadomienie o przeterminowanych produktach
-        if expired_items.exists():
-            expired_count = expired_items.count()
-            items_list = ", ".join([item.ingredient.name for item in expired_items[:5]])
-            
-            if expired_count > 5:
-                items_list += f" i {expired_count - 5} innych"
-            
-            cls.objects.create(
-                user=user,
-                title="Przeterminowane produkty",
-                message=f"Masz {expired_count} przeterminowanych produktów w lodówce: {items_list}. "
-                        f"Zalecamy ich usunięcie."
-            )
-            notifications_count += 1
-        
-        # Powiadomienie o produktach, które przeterminują się jutro
-        if expiring_tomorrow.exists():
-            expiring_count = expiring_tomorrow.count()
-            items_list = ", ".join([item.ingredient.name for item in expiring_tomorrow[:5]])
-            
-            if expiring_count > 5:
-                items_list += f" i {expiring_count - 5} innych"
-            
-            cls.objects.create(
-                user=user,
-                title="Produkty wygasają jutro",
-                message=f"{expiring_count} produktów wygasa jutro: {items_list}. "
-                        f"Wykorzystaj je jak najszybciej."
-            )
-            notifications_count += 1
-        
-        # Powiadomienie o produktach, które przeterminują się w ciągu tygodnia
-        if expiring_soon.exists():
-            expiring_count = expiring_soon.count()
-            items_list = ", ".join([f"{item.ingredient.name} ({item.days_until_expiry} dni)" for item in expiring_soon[:5]])
-            
-            if expiring_count > 5:
-                items_list += f" i {expiring_count - 5} innych"
-            
-            cls.objects.create(
-                user=user,
-                title="Produkty wygasają wkrótce",
-                message=f"{expiring_count} produktów wygasa w ciągu tygodnia: {items_list}. "
-                        f"Zaplanuj wykorzystanie tych produktów."
-            )
-            notifications_count += 1
-        
-        return notifications_count
+        return cls.notify_users([user.id])
+
+
+@receiver([post_save, post_delete], sender=FridgeItem)
+def touch_user_fridge(sender, instance, **kwargs):
+    """Zmienia wersję lodówki użytkownika po dodaniu, zmianie lub usunięciu produktu"""
+    touch_fridge(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=ExpiryNotification)
+def invalidate_unread_notifications(sender, instance, **kwargs):
+    """Unieważnia liczbę nieprzeczytanych powiadomień po dodaniu, przeczytaniu lub usunięciu powiadomienia"""
+    ExpiryNotification.invalidate_unread_count(instance.user_id)
 
 
+@receiver(post_save, sender=ExpiryNotification)
+def publish_new_notification(sender, instance, created, **kwargs):
+    """Wysyła nowe powiadomienie do otwartych kart użytkownika"""
+    if created:
+        instance.publish()
@@ -5,7 +5,8 @@ from django.views.generic import ListView, CreateView, UpdateView, DeleteView, F
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy, reverse
 from django.http import JsonResponse, HttpResponse
-from django.db.models import Q
+from django.core.paginator import Paginator
+from django.db.models import Q, prefetch_related_objects
 import json
 import requests
 from datetime import datetime, timedelta, date
@@ -14,8 +15,15 @@ import csv
 
 from recipes.models import Ingredient, MeasurementUnit, Recipe, IngredientCategory, IngredientConversion
 from .models import FridgeItem, ExpiryNotification
+from .availability import FridgeSnapshot
+from .expiring import rank_recipes_for_expiring
+from recipes.autocomplete import search_ingredients
+from recipes.cookable_index import get_cookable_index
 from .forms import FridgeItemForm, BulkAddForm, FridgeSearchForm, BulkItemFormSet
 
+# Największa liczba brakujących składników do wyboru na liście przepisów "prawie dostępnych"
+MAX_MISSING_LIMIT = 5
+
 @login_required
 def fridge_dashboard(request):
     """
@@ -44,10 +52,11 @@ def fridge_dashboard(request):
     
     # Pobierz przepisy, które można przygotować z produktów w lodówce
     available_recipes = []
-    recipes = Recipe.objects.filter(Q(author=request.user) | Q(is_public=True)).distinct()[:20]  # Ogranicz do 20 najnowszych przepisów
+    recipes = Recipe.objects.cards(with_ingredients=True).filter(Q(author=request.user) | Q(is_public=True)).distinct()[:20]  # Ogranicz do 20 najnowszych przepisów
+    snapshot = FridgeSnapshot(request.user)
     
     for recipe in recipes:
-        if recipe.can_be_prepared_with_available_ingredients(request.user):
+        if snapshot.can_prepare(recipe):
             available_recipes.append({
                 'recipe': recipe,
                 'available': True,
@@ -55,38 +64,8 @@ def fridge_dashboard(request):
             if len(available_recipes) >= 5:  # Ogranicz do 5 przepisów
                 break
     
-    # Pobierz przepisy, które wykorzystują kończące się produkty
-    expiring_ingredients = [item.ingredient for item in expiring_soon_items]
-    recipes_with_expiring = []
-    
-    if expiring_ingredients:
-        # Znajdź przepisy zawierające kończące się składniki
-        recipes_with_expiring_ingredients = Recipe.objects.filter(
-            Q(author=request.user) | Q(is_public=True),
-            ingredients__ingredient__in=expiring_ingredients
-        ).distinct()[:10]  # Ogranicz do 10 przepisów
-        
-        for recipe in recipes_with_expiring_ingredients:
-            # Sprawdź, które z kończących się składników są używane w przepisie
-            used_expiring = []
-            for ingredient in expiring_ingredients:
-                if recipe.ingredients.filter(ingredient=ingredient).exists():
-                    # Znajdź odpowiedni FridgeItem, żeby pokazać ile dni zostało
-                    expiring_item = next((item for item in expiring_soon_items if item.ingredient == ingredient), None)
-                    if expiring_item:
-                        used_expiring.append({
-                            'name': ingredient.name,
-                            'days_left': expiring_item.days_until_expiry,
-                            'amount': expiring_item.amount,
-                            'unit': expiring_item.unit.symbol
-                        })
-            
-            if used_expiring:
-                recipes_with_expiring.append({
-                    'recipe': recipe,
-                    'expiring_ingredients': used_expiring,
-                    'can_be_prepared': recipe.can_be_prepared_with_available_ingredients(request.user)
-                })
+    # Przepisy, które wykorzystują kończące się produkty - ranking według terminów ważności
+    recipes_with_expiring = rank_recipes_for_expiring(request.user, limit=10, snapshot=snapshot)
     
     context = {
         'item_count': item_count,
@@ -401,50 +380,37 @@ def bulk_add_to_fridge(request):
                 messages.warning(request, 'Nie dodano żadnych produktów. Formularz był pusty.')
                 return redirect('fridge:bulk_add')
             
-            # Liczniki dla statystyk
-            added_count = 0
-            converted_count = 0
-            error_count = 0
-            
-            # Dodaj każdy produkt z listy
+            rows = []
             for item in items:
+                ingredient_id = item.get('ingredient_id')
+                amount = item.get('amount')
+                unit_id = item.get('unit_id')
+                
+                # Sprawdź czy wszystkie wymagane pola są dostępne
+                if not (ingredient_id and amount and unit_id):
+                    continue
+                
+                # Przekonwertuj ilość na float
                 try:
-                    ingredient_id = item.get('ingredient_id')
-                    amount = item.get('amount')
-                    unit_id = item.get('unit_id')
-                    expiry_date = item.get('expiry_date') or None
-                    
-                    # Sprawdź czy wszystkie wymagane pola są dostępne
-                    if not (ingredient_id and amount and unit_id):
-                        continue
-                    
-                    # Pobierz obiekty z bazy danych
-                    ingredient = get_object_or_404(Ingredient, pk=ingredient_id)
-                    unit = get_object_or_404(MeasurementUnit, pk=unit_id)
-                    
-                    # Przekonwertuj ilość na float
-                    try:
-                        amount = float(amount)
-                    except (ValueError, TypeError):
-                        # Jeśli nie da się przekonwertować, użyj wartości domyślnej 1
-                        amount = 1
-                    
-                    # Dodaj produkt do lodówki - metoda add_to_fridge zajmie się konwersją
-                    added_item, was_converted = FridgeItem.add_to_fridge(
-                        user=request.user,
-                        ingredient=ingredient,
-                        amount=amount,
-                        unit=unit,
-                        expiry_date=expiry_date
-                    )
-                    
-                    if was_converted:
-                        converted_count += 1
-                    
-                    added_count += 1
-                except Exception as e:
-                    error_count += 1
-                    print(f"Błąd dodawania produktu: {str(e)}")
+                    amount = float(amount)
+                except (ValueError, TypeError):
+                    # Jeśli nie da się przekonwertować, użyj wartości domyślnej 1
+                    amount = 1
+                
+                rows.append({
+                    'ingredient_id': ingredient_id,
+                    'unit_id': unit_id,
+                    'amount': amount,
+                    'expiry_date': item.get('expiry_date') or None
+                })
+            
+            # Dodaj wszystkie produkty naraz - bulk_add zajmie się konwersją i scalaniem
+            result = FridgeItem.bulk_add(request.user, rows)
+            added_count = result['added']
+            converted_count = result['converted']
+            error_count = len(result['errors'])
+            for error in result['errors']:
+                print(f"Błąd dodawania produktu: {error}")
             
             # Wyświetl odpowiedni komunikat na podstawie liczników
             if added_count > 0:
@@ -491,37 +457,53 @@ def clean_expired(request):
 
 @login_required
 def available_recipes(request):
-    """Pokazuje przepisy, które można przygotować z produktów w lodówce"""
-    # Pobierz wszystkie przepisy użytkownika i publiczne przepisy
-    recipes = Recipe.objects.filter(Q(author=request.user) | Q(is_public=True)).distinct()
+    """
+    Pokazuje przepisy, które można przygotować z produktów w lodówce, oraz przepisy,
+    którym brakuje co najwyżej max_missing składników - od najlepiej pokrytych.
+    """
+    try:
+        max_missing = int(request.GET.get('max_missing', 2))
+    except (ValueError, TypeError):
+        max_missing = 2
+    max_missing = min(max(max_missing, 0), MAX_MISSING_LIMIT)
     
-    # Przygotuj listę przepisów z informacją o dostępności
-    recipes_with_availability = []
+    # Lodówka wczytywana jest raz, a pokrycie wszystkich przepisów liczone w pamięci z indeksu
+    snapshot = FridgeSnapshot(request.user)
+    coverage = get_cookable_index().coverage(snapshot, max_missing=max_missing, user=request.user)
+    page_obj = Paginator(coverage, 24).get_page(request.GET.get('page'))
     
-    for recipe in recipes:
-        # Sprawdź, czy wszystkie składniki są dostępne w odpowiedniej ilości
-        can_be_prepared = recipe.can_be_prepared_with_available_ingredients(request.user)
-        missing_ingredients = []
+    # Przepisy i listy brakujących składników wczytujemy tylko dla bieżącej strony
+    recipes = Recipe.objects.cards().in_bulk([item.recipe_id for item in page_obj])
+    prefetch_related_objects(list(recipes.values()), 'ingredients__ingredient', 'ingredients__unit')
+    
+    recipes_with_availability = []
+    for item in page_obj:
+        recipe = recipes.get(item.recipe_id)
+        if recipe is None:
+            continue
         
-        if not can_be_prepared:
-            # Jeśli nie wszystkie składniki są dostępne, zbierz listę brakujących
-            missing_ingredients_data = recipe.get_missing_ingredients(request.user)
-            if missing_ingredients_data:
-                for item in missing_ingredients_data:
-                    missing_ingredients.append({
-                        'name': item.ingredient.name,
-                        'amount': item.amount,
-                        'unit': item.unit.symbol if item.unit else ''
-                    })
+        missing_ingredients = []
+        if item.missing:
+            for missing in snapshot.missing_ingredients(recipe):
+                missing_ingredients.append({
+                    'name': missing.ingredient.name,
+                    'amount': missing.missing,
+                    'unit': missing.unit.symbol if missing.unit else ''
+                })
         
         recipes_with_availability.append({
             'recipe': recipe,
-            'available': can_be_prepared,
-            'missing': missing_ingredients
+            'available': item.missing == 0,
+            'missing': missing_ingredients,
+            'missing_count': item.missing,
+            'coverage': round(item.coverage * 100)
         })
     
     return render(request, 'fridge/available_recipes.html', {
-        'recipes': recipes_with_availability
+        'recipes': recipes_with_availability,
+        'page_obj': page_obj,
+        'max_missing': max_missing,
+        'max_missing_choices': range(MAX_MISSING_LIMIT + 1)
     })
 
 @login_required
@@ -530,16 +512,18 @@ def ajax_ingredient_search(request):
     term = request.GET.get('term', '')
     list_all = request.GET.get('list_all') == 'true'
     
-    queryset = Ingredient.objects.all()
-    if not list_all and term:
-        queryset = queryset.filter(name__icontains=term)
+    if list_all:
+        # Pełna lista składników (np. do wypełnienia listy wyboru)
+        ingredients = search_ingredients('', limit=None)
+    else:
+        ingredients = search_ingredients(term, limit=10)  # Limit do 10 wyników
     
     results = []
-    for ingredient in queryset[:10]:  # Limit do 10 wyników
+    for ingredient in ingredients:
         results.append({
             'id': ingredient.id,
             'name': ingredient.name,
-            'category': ingredient.category.name if ingredient.category else None
+            'category': ingredient.category_name
         })
     
     return JsonResponse({'results': results})
@@ -1122,9 +1106,7 @@ def notifications_list(request):
     notifications = ExpiryNotification.objects.filter(user=request.user).order_by('-created_at')
     
     # Zaktualizuj wszystkie nieprzeczytane powiadomienia jako przeczytane
-    unread_notifications = notifications.filter(is_read=False)
-    if unread_notifications.exists():
-        unread_notifications.update(is_read=True)
+    ExpiryNotification.mark_all_read(request.user)
     
     return render(request, 'fridge/notifications_list.html', {
         'notifications': notifications
@@ -1158,6 +1140,6 @@ def mark_notification_read(request, pk):
 def mark_all_notifications_read(request):
     """Oznacza wszystkie powiadomienia użytkownika jako przeczytane"""
     if request.user.is_authenticated:
-        ExpiryNotification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+        ExpiryNotification.mark_all_read(request.user)
         messages.success(request, "Wszystkie powiadomienia zostały oznaczone jako przeczytane.")
     return redirect('fridge:notifications_list')
\ No newline at end of file
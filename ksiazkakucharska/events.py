@@ -0,0 +1,153 @@
+"""
+Zdarzenia wysyłane na żywo do otwartych kart przeglądarki (Server-Sent Events).
+
+Widoki i sygnały publikują zdarzenia funkcją publish() - trafiają one do kanału
+użytkownika dopiero po zatwierdzeniu transakcji. Asynchroniczny widok
+event_stream subskrybuje kanał zalogowanego użytkownika i przesyła zdarzenia
+w formacie text/event-stream.
+
+Broker jest wymienny (ustawienie EVENTS_BACKEND). Domyślny InProcessBroker
+działa w pamięci jednego procesu - wystarcza dla pojedynczego serwera ASGI
+i do testów. Przy kilku procesach potrzebny jest broker oparty o wspólny
+serwer (np. Redis pub/sub) z tym samym interfejsem: subscribe, unsubscribe,
+publish.
+
+Strumień działa tylko pod serwerem ASGI (np. uvicorn ksiazkakucharska.asgi:application).
+Pod WSGI widok odpowiada 204, co przeglądarka traktuje jako koniec połączenia.
+"""
+import asyncio
+import itertools
+import json
+import threading
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+# Co ile sekund wysyłać komentarz podtrzymujący połączenie
+KEEPALIVE_SECONDS = 20
+# Po ilu milisekundach przeglądarka ma wznowić zerwane połączenie
+RETRY_MILLISECONDS = 5000
+# Ile zdarzeń może czekać na wysłanie do jednego połączenia (nadmiarowe najstarsze są pomijane)
+QUEUE_SIZE = 100
+
+_lock = threading.Lock()
+_broker = None
+
+
+def user_channel(user_id):
+    """Nazwa kanału zdarzeń użytkownika"""
+    return f'user:{user_id}'
+
+
+class Subscription:
+    """Kolejka zdarzeń jednego połączenia, związana z pętlą zdarzeń, w której powstała"""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def deliver(self, event):
+        """Przekazuje zdarzenie do kolejki - można wywołać z dowolnego wątku"""
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # Pętla zdarzeń została już zamknięta
+            pass
+
+    def _put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class InProcessBroker:
+    """Broker publikuj/subskrybuj w pamięci procesu"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+        self._ids = itertools.count(1)
+
+    def subscribe(self, channel):
+        """Tworzy subskrypcję kanału (wywoływane wewnątrz pętli zdarzeń)"""
+        subscription = Subscription(channel)
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+    def publish(self, channel, event):
+        """Wysyła zdarzenie do wszystkich subskrypcji kanału"""
+        event = dict(event, id=next(self._ids))
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+
+def get_broker():
+    """Zwraca broker skonfigurowany w EVENTS_BACKEND, tworząc go przy pierwszym użyciu"""
+    global _broker
+    if _broker is None:
+        with _lock:
+            if _broker is None:
+                backend = getattr(settings, 'EVENTS_BACKEND', 'ksiazkakucharska.events.InProcessBroker')
+                _broker = import_string(backend)()
+    return _broker
+
+
+def publish(user_id, event_type, data):
+    """Publikuje zdarzenie do otwartych kart użytkownika po zatwierdzeniu bieżącej transakcji"""
+    event = {'type': event_type, 'data': data}
+    transaction.on_commit(lambda: get_broker().publish(user_channel(user_id), event))
+
+
+def format_event(event):
+    """Zamienia zdarzenie na komunikat w formacie text/event-stream"""
+    data = json.dumps(event['data'], ensure_ascii=False, default=str)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+async def event_stream(request):
+    """Strumień zdarzeń (SSE) zalogowanego użytkownika: nowe powiadomienia i zmiany list zakupów"""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+    if not isinstance(request, ASGIRequest):
+        # Pod WSGI nieskończony strumień zablokowałby wątek serwera
+        return HttpResponse(status=204)
+
+    broker = get_broker()
+    subscription = broker.subscribe(user_channel(user.id))
+
+    async def stream():
+        try:
+            yield f'retry: {RETRY_MILLISECONDS}\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield format_event(event)
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,96 @@
+"""
+Powiązania zalogowanego użytkownika wczytywane raz na żądanie: polubione
+i ulubione przepisy, oceny oznaczone jako przydatne i śledzeni użytkownicy.
+
+UserRelationsMiddleware tworzy dla każdego żądania obiekt UserRelations
+(dostępny też jako request.user_relations). Każdy zbiór ID jest pobierany
+jednym zapytaniem dopiero przy pierwszym użyciu, więc strona z 50 ocenami
+sprawdza przydatność wszystkich w jednym zapytaniu zamiast 50.
+
+Metody modeli (np. Recipe.is_liked_by) pytają get_relations(user) - poza
+żądaniem albo dla innego użytkownika dostają None i wykonują własne zapytanie.
+"""
+import contextvars
+
+from django.apps import apps
+from django.utils.functional import cached_property
+
+_current = contextvars.ContextVar('user_relations', default=None)
+
+
+class UserRelations:
+    """Zbiory ID powiązań użytkownika z żądania, wczytywane leniwie"""
+
+    # Zbiory wczytywane przez cached_property - usuwane przez invalidate()
+    RELATION_SETS = ('liked_recipe_ids', 'favorite_recipe_ids', 'helpful_rating_ids', 'followed_user_ids')
+
+    def __init__(self, request):
+        # request.user jest leniwy - użytkownik wczytywany dopiero przy pierwszym sprawdzeniu
+        self.request = request
+
+    @property
+    def user_id(self):
+        user = self.request.user
+        return user.pk if user.is_authenticated else None
+
+    def _ids(self, model_label, field):
+        if self.user_id is None:
+            return set()
+        model = apps.get_model(model_label)
+        return set(model.objects.filter(user_id=self.user_id).values_list(field, flat=True))
+
+    @cached_property
+    def liked_recipe_ids(self):
+        return self._ids('recipes.RecipeLike', 'recipe_id')
+
+    @cached_property
+    def favorite_recipe_ids(self):
+        return self._ids('recipes.FavoriteRecipe', 'recipe_id')
+
+    @cached_property
+    def helpful_rating_ids(self):
+        return self._ids('recipes.RatingHelpful', 'rating_id')
+
+    @cached_property
+    def followed_user_ids(self):
+        return self._ids('accounts.UserFollowing', 'followed_user_id')
+
+    def is_for(self, user):
+        """Czy obiekt dotyczy danego (zalogowanego) użytkownika"""
+        return user is not None and user.is_authenticated and user.pk == self.user_id
+
+    def invalidate(self):
+        """Zapomina wczytane zbiory - np. po polubieniu przepisu w tym samym żądaniu"""
+        for name in self.RELATION_SETS:
+            self.__dict__.pop(name, None)
+
+
+def get_relations(user):
+    """Powiązania użytkownika z bieżącego żądania albo None (poza żądaniem lub dla innego użytkownika)"""
+    relations = _current.get()
+    if relations is not None and relations.is_for(user):
+        return relations
+    return None
+
+
+def invalidate_relations(user_id):
+    """Unieważnia powiązania w bieżącym żądaniu, jeśli dotyczą danego użytkownika"""
+    relations = _current.get()
+    if relations is not None and relations.user_id == user_id:
+        relations.invalidate()
+
+
+class UserRelationsMiddleware:
+    """Udostępnia powiązania zalogowanego użytkownika na czas obsługi żądania"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        relations = UserRelations(request)
+        request.user_relations = relations
+        token = _current.set(relations)
+        try:
+            return self.get_response(request)
+        finally:
+            _current.reset(token)
@@ -52,6 +52,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'ksiazkakucharska.relations.UserRelationsMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -88,6 +89,18 @@ DATABASES = {
     }
 }
 
+# Pamięć podręczna (m.in. wyniki dostępności przepisów i znaczniki wersji danych).
+# Przy kilku procesach serwera należy użyć wspólnego backendu, np. Redis lub Memcached.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ksiazkakucharska',
+    }
+}
+
+# Broker zdarzeń na żywo (SSE). Domyślny działa w pamięci jednego procesu serwera ASGI.
+EVENTS_BACKEND = 'ksiazkakucharska.events.InProcessBroker'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -6,6 +6,7 @@ from accounts import views as accounts_views
 from django.contrib.auth import views as auth_views
 from recipes.views import RecipeListView, home_view
 from django.views.generic import TemplateView
+from ksiazkakucharska.events import event_stream
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -24,6 +25,9 @@ urlpatterns = [
     path('login/', accounts_views.CustomLoginView.as_view(), name='login'),
     path('dashboard/', accounts_views.dashboard, name='dashboard'),
     path('logout/', accounts_views.custom_logout, name='logout'),
+    
+    # Zdarzenia na żywo (SSE) - wymaga serwera ASGI
+    path('events/', event_stream, name='event_stream'),
     path('password-reset/', 
          auth_views.PasswordResetView.as_view(
              template_name='registration/password_reset_form.html',
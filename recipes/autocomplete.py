@@ -0,0 +1,160 @@
+"""
+Podpowiadanie składników (autocomplete) z indeksu trzymanego w pamięci.
+
+Indeks składa się z:
+- posortowanej listy kluczy (pełna nazwa i każde jej słowo) do wyszukiwania
+  po prefiksie przez bisect,
+- indeksu trigramów do wyszukiwania fragmentów nazw i literówek.
+
+Nazwy są porównywane bez polskich znaków ("zolty" znajduje "żółty"), a wyniki
+sortowane według popularności składnika (liczba użyć w przepisach i lodówkach).
+Indeks jest budowany przy pierwszym użyciu, unieważniany sygnałami po zmianie
+składników lub kategorii i przebudowywany co USAGE_TTL sekund, aby odświeżyć
+statystyki popularności.
+"""
+import bisect
+import threading
+import time
+from collections import Counter, namedtuple
+
+from django.db.models import Count
+
+from recipes.search import fold_text
+
+# Co ile sekund przeliczać popularność składników
+USAGE_TTL = 600
+# Minimalne podobieństwo trigramowe dla wyników przybliżonych (literówki)
+FUZZY_THRESHOLD = 0.3
+
+IngredientEntry = namedtuple('IngredientEntry', 'id name folded category_id category_name usage')
+
+_lock = threading.Lock()
+_index = None
+_generation = 0
+
+
+def trigrams(text):
+    """Zwraca zbiór trigramów tekstu (z dopełnieniem spacjami na brzegach)"""
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class IngredientAutocomplete:
+    """Niezmienny indeks nazw składników"""
+
+    def __init__(self, entries):
+        # Wpisy posortowane według nazwy - kolejność dla pustego zapytania
+        self.entries = sorted(entries, key=lambda entry: entry.name.lower())
+        self.built_at = time.monotonic()
+
+        keys = []
+        self.trigram_index = {}
+        for position, entry in enumerate(self.entries):
+            keys.append((entry.folded, position))
+            for word in entry.folded.split()[1:]:
+                keys.append((word, position))
+            for trigram in trigrams(entry.folded):
+                self.trigram_index.setdefault(trigram, set()).add(position)
+        keys.sort()
+        self.prefix_keys = [key for key, _ in keys]
+        self.prefix_positions = [position for _, position in keys]
+
+    @classmethod
+    def load(cls):
+        """Wczytuje składniki, kategorie i statystyki użycia (trzy zapytania)"""
+        from fridge.models import FridgeItem
+        from recipes.models import Ingredient, RecipeIngredient
+
+        usage = Counter(dict(
+            RecipeIngredient.objects.order_by().values('ingredient_id').annotate(
+                total=Count('id')
+            ).values_list('ingredient_id', 'total')
+        ))
+        usage.update(dict(
+            FridgeItem.objects.order_by().values('ingredient_id').annotate(
+                total=Count('id')
+            ).values_list('ingredient_id', 'total')
+        ))
+
+        rows = Ingredient.objects.values_list('id', 'name', 'category_id', 'category__name')
+        entries = [
+            IngredientEntry(ingredient_id, name, fold_text(name), category_id, category_name, usage[ingredient_id])
+            for ingredient_id, name, category_id, category_name in rows
+        ]
+        return cls(entries)
+
+    def _prefix_matches(self, folded):
+        """Zwraca pozycje wpisów, których nazwa lub dowolne słowo nazwy zaczyna się od folded"""
+        matches = set()
+        start = bisect.bisect_left(self.prefix_keys, folded)
+        for i in range(start, len(self.prefix_keys)):
+            if not self.prefix_keys[i].startswith(folded):
+                break
+            matches.add(self.prefix_positions[i])
+        return matches
+
+    def _trigram_candidates(self, folded):
+        """Zwraca {pozycja: liczba wspólnych trigramów} dla nazw podobnych do folded"""
+        shared = Counter()
+        for trigram in trigrams(folded):
+            for position in self.trigram_index.get(trigram, ()):
+                shared[position] += 1
+        return shared
+
+    def search(self, term, limit=10):
+        """
+        Zwraca listę IngredientEntry pasujących do zapytania.
+        Kolejność: dopasowania prefiksowe, fragmenty nazwy, podobne nazwy (literówki);
+        w każdej grupie od najpopularniejszych składników.
+        """
+        folded = ' '.join(fold_text(term).split())
+        if not folded:
+            return self.entries[:limit] if limit else list(self.entries)
+
+        prefix = self._prefix_matches(folded)
+        ranked = [(0, position) for position in prefix]
+
+        if limit is None or len(prefix) < limit:
+            query_trigrams = len(trigrams(folded))
+            for position, shared in self._trigram_candidates(folded).items():
+                if position in prefix:
+                    continue
+                entry = self.entries[position]
+                if folded in entry.folded:
+                    ranked.append((1, position))
+                else:
+                    similarity = shared / (query_trigrams + len(trigrams(entry.folded)) - shared)
+                    if similarity >= FUZZY_THRESHOLD:
+                        ranked.append((2, position))
+
+        ranked.sort(key=lambda item: (item[0], -self.entries[item[1]].usage, self.entries[item[1]].name.lower()))
+        if limit:
+            ranked = ranked[:limit]
+        return [self.entries[position] for _, position in ranked]
+
+
+def get_ingredient_autocomplete():
+    """Zwraca indeks składników, budując go przy pierwszym użyciu lub po upływie USAGE_TTL"""
+    global _index
+    index = _index
+    if index is None or time.monotonic() - index.built_at > USAGE_TTL:
+        generation = _generation
+        index = IngredientAutocomplete.load()
+        with _lock:
+            # Nie zapisuj indeksu, jeśli w trakcie budowania dane się zmieniły
+            if generation == _generation:
+                _index = index
+    return index
+
+
+def invalidate_ingredient_autocomplete():
+    """Usuwa indeks z pamięci - zostanie zbudowany ponownie przy następnym użyciu"""
+    global _index, _generation
+    with _lock:
+        _index = None
+        _generation += 1
+
+
+def search_ingredients(term, limit=10):
+    """Zwraca składniki pasujące do zapytania (lista IngredientEntry)"""
+    return get_ingredient_autocomplete().search(term, limit)
@@ -0,0 +1,152 @@
+"""
+Graf konwersji jednostek miar przechowywany w pamięci procesu.
+
+Jednostki (MeasurementUnit) są węzłami grafu, a przeliczniki z UnitConversion
+i IngredientConversion jego krawędziami. Graf jest budowany raz, przy pierwszym
+użyciu, a następnie unieważniany sygnałami post_save/post_delete zdefiniowanymi
+w recipes/models.py. Dzięki temu convert_units w stanie ustalonym nie wykonuje
+żadnych zapytań do bazy danych.
+"""
+import logging
+import threading
+from collections import defaultdict, deque
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_graph = None
+_generation = 0
+
+
+def _build_factors(edges, unit_types):
+    """
+    Buduje słownik współczynników {(z_jednostki, na_jednostkę): współczynnik}.
+
+    Krawędzie bezpośrednie mają pierwszeństwo przed odwrotnymi, a te przed
+    przechodnimi. Współczynniki przechodnie liczone są wyłącznie po krawędziach
+    łączących jednostki tego samego typu - przelicznik typu szklanka -> g
+    (zależny od produktu) nie może posłużyć do wyprowadzenia ogólnej
+    konwersji ml -> g.
+    """
+    factors = {}
+
+    # Najpierw odwrotności, potem krawędzie bezpośrednie (nadpisują odwrotności)
+    for from_id, to_id, ratio in edges:
+        factors.setdefault((to_id, from_id), 1.0 / ratio)
+    for from_id, to_id, ratio in edges:
+        factors[(from_id, to_id)] = ratio
+
+    adjacency = defaultdict(list)
+    for (from_id, to_id), ratio in factors.items():
+        if from_id != to_id and unit_types.get(from_id) == unit_types.get(to_id):
+            adjacency[from_id].append((to_id, ratio))
+
+    # Przejście wszerz z każdego węzła - jednostek jest niewiele, więc
+    # pełne domknięcie przechodnie jest tanie
+    for start in list(adjacency):
+        visited = {start: 1.0}
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            for neighbour, ratio in adjacency[node]:
+                if neighbour not in visited:
+                    visited[neighbour] = visited[node] * ratio
+                    queue.append(neighbour)
+        for target, ratio in visited.items():
+            if target != start:
+                factors.setdefault((start, target), ratio)
+
+    return factors
+
+
+class ConversionGraph:
+    """Niezmienny graf współczynników konwersji zbudowany z danych w bazie"""
+
+    def __init__(self, unit_types, generic_edges, ingredient_edges, units=None):
+        self.unit_types = unit_types
+        self.units = units or {}
+        # Jednostki bazowe: g, ml i sztuka (jednostka 'szt' lub dowolna
+        # jednostka typu piece o współczynniku bazowym 1)
+        self.base_units = {}
+        for unit in self.units.values():
+            if unit.symbol in ('g', 'ml', 'szt'):
+                self.base_units.setdefault(unit.symbol, unit)
+        if 'szt' not in self.base_units:
+            for unit in self.units.values():
+                if unit.type == 'piece' and float(unit.base_ratio) == 1.0:
+                    self.base_units['szt'] = unit
+                    break
+        self.generic = _build_factors(generic_edges, unit_types)
+        self.by_ingredient = {
+            ingredient_id: _build_factors(edges, unit_types)
+            for ingredient_id, edges in ingredient_edges.items()
+        }
+
+    @classmethod
+    def load(cls):
+        """Wczytuje jednostki i przeliczniki z bazy danych (trzy zapytania)"""
+        from recipes.models import MeasurementUnit, UnitConversion, IngredientConversion
+
+        units = {unit.id: unit for unit in MeasurementUnit.objects.all()}
+        unit_types = {unit_id: unit.type for unit_id, unit in units.items()}
+        generic_edges = []
+        ingredient_edges = defaultdict(list)
+
+        rows = UnitConversion.objects.values_list('from_unit_id', 'to_unit_id', 'ingredient_id', 'ratio')
+        for from_id, to_id, ingredient_id, ratio in rows:
+            ratio = float(ratio)
+            if ratio <= 0:
+                logger.warning(f"Pominięto konwersję jednostek {from_id} -> {to_id} z niepoprawnym współczynnikiem {ratio}")
+                continue
+            if ingredient_id is None:
+                generic_edges.append((from_id, to_id, ratio))
+            else:
+                ingredient_edges[ingredient_id].append((from_id, to_id, ratio))
+
+        # IngredientConversion dodajemy na końcu, aby miały pierwszeństwo
+        rows = IngredientConversion.objects.values_list('ingredient_id', 'from_unit_id', 'to_unit_id', 'ratio')
+        for ingredient_id, from_id, to_id, ratio in rows:
+            ratio = float(ratio)
+            if ratio <= 0:
+                logger.warning(f"Pominięto konwersję składnika {ingredient_id} ({from_id} -> {to_id}) z niepoprawnym współczynnikiem {ratio}")
+                continue
+            ingredient_edges[ingredient_id].append((from_id, to_id, ratio))
+
+        return cls(unit_types, generic_edges, ingredient_edges, units)
+
+    def base_unit(self, symbol):
+        """Zwraca jednostkę bazową ('g', 'ml' lub 'szt') albo None, jeśli jej nie ma"""
+        return self.base_units.get(symbol)
+
+    def generic_factor(self, from_unit_id, to_unit_id):
+        """Zwraca ogólny współczynnik konwersji lub None, jeśli go nie ma"""
+        return self.generic.get((from_unit_id, to_unit_id))
+
+    def ingredient_factor(self, ingredient_id, from_unit_id, to_unit_id):
+        """Zwraca współczynnik konwersji dla składnika lub None, jeśli go nie ma"""
+        factors = self.by_ingredient.get(ingredient_id)
+        if factors is None:
+            return None
+        return factors.get((from_unit_id, to_unit_id))
+
+
+def get_conversion_graph():
+    """Zwraca graf konwersji, budując go przy pierwszym użyciu"""
+    global _graph
+    graph = _graph
+    if graph is None:
+        generation = _generation
+        graph = ConversionGraph.load()
+        with _lock:
+            # Nie zapisuj grafu, jeśli w trakcie wczytywania dane się zmieniły
+            if generation == _generation:
+                _graph = graph
+    return graph
+
+
+def invalidate_conversion_graph():
+    """Usuwa graf z pamięci - zostanie zbudowany ponownie przy następnym użyciu"""
+    global _graph, _generation
+    with _lock:
+        _graph = None
+        _generation += 1
@@ -0,0 +1,193 @@
+"""
+Indeks odwrócony składnik -> przepisy do wyszukiwania przepisów, które można
+przygotować z zawartości lodówki.
+
+Dla każdego składnika przechowujemy listę wymagań (przepis, jednostka, ilość),
+gdzie ilość jest sprowadzona do jednostki bazowej składnika (g, ml lub sztuki)
+zapisanej w kolumnie base_amount.
+Przecięcie indeksu z migawką lodówki (FridgeSnapshot) daje zbiór ID przepisów,
+które można użyć bezpośrednio w zapytaniu SQL (id__in). Przeglądane są tylko
+wymagania dotyczące składników obecnych w lodówce, a nie wszystkie przepisy.
+
+Ten sam indeks służy do wyszukiwania przepisów "prawie dostępnych" - takich,
+którym brakuje co najwyżej k składników - uszeregowanych według pokrycia.
+
+Indeks jest budowany przy pierwszym użyciu i unieważniany sygnałami
+zdefiniowanymi w recipes/models.py.
+"""
+import json
+import threading
+from collections import Counter, defaultdict, namedtuple
+
+from django.db import connections
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.expressions import RawSQL
+
+from recipes.conversion_graph import get_conversion_graph
+
+_lock = threading.Lock()
+_index = None
+_generation = 0
+
+# Pokrycie przepisu przez lodówkę: liczba wymagań, spełnionych i brakujących,
+# odsetek spełnionych (coverage) i niedobór (suma brakujących części wymagań)
+# Powyżej tylu ID lista jest przekazywana jako jeden parametr zamiast IN (%s, %s, ...),
+# bo SQLite ogranicza liczbę parametrów zapytania (domyślnie 999 w starszych wersjach)
+ID_LIST_PARAM_THRESHOLD = 500
+
+RecipeCoverage = namedtuple('RecipeCoverage', 'recipe_id required satisfied missing coverage shortfall')
+
+
+class CookableIndex:
+    """Niezmienny indeks wymagań przepisów pogrupowanych według składników"""
+
+    def __init__(self):
+        # {ingredient_id: [(recipe_id, unit_id, wymagana_ilość)]}
+        self.by_ingredient = defaultdict(list)
+        # Liczba wymagań (niezerowych składników) dla każdego przepisu
+        self.requirement_counts = Counter()
+        self.units = {}
+        # {recipe_id: (is_public, author_id)} - do filtrowania widoczności bez zapytań
+        self.visibility = {}
+
+    @classmethod
+    def load(cls):
+        """Buduje indeks na podstawie wszystkich składników przepisów"""
+        from recipes.models import Recipe, RecipeIngredient
+
+        index = cls()
+        graph = get_conversion_graph()
+        index.units = graph.units
+        index.visibility = {
+            recipe_id: (is_public, author_id)
+            for recipe_id, is_public, author_id in Recipe.objects.values_list('id', 'is_public', 'author_id').iterator(chunk_size=2000)
+        }
+
+        rows = RecipeIngredient.objects.values_list(
+            'recipe_id', 'ingredient_id', 'unit_id', 'amount', 'base_amount', 'base_unit'
+        )
+        for recipe_id, ingredient_id, unit_id, amount, base_amount, base_symbol in rows.iterator(chunk_size=2000):
+            if float(amount or 0) <= 0:
+                # Składnik w zerowej ilości jest zawsze dostępny
+                continue
+
+            index.requirement_counts[recipe_id] += 1
+
+            # Ilość w jednostce bazowej jest zapisana w wierszu - bez przeliczania
+            base_unit = graph.base_unit(base_symbol) if base_amount is not None else None
+            if base_unit is not None:
+                index.by_ingredient[ingredient_id].append((recipe_id, base_unit.id, base_amount))
+            elif unit_id in index.units:
+                index.by_ingredient[ingredient_id].append((recipe_id, unit_id, float(amount)))
+            # Bez jednostki nie da się sprawdzić dostępności - przepis nigdy nie trafi do wyników
+
+        return index
+
+    def cookable_recipe_ids(self, snapshot):
+        """Zwraca zbiór ID przepisów (mających składniki), które można przygotować z lodówki"""
+        satisfied = Counter()
+        for ingredient_id, ingredient in snapshot.ingredients.items():
+            for recipe_id, unit_id, required in self.by_ingredient.get(ingredient_id, ()):
+                if snapshot.available_amount(ingredient, self.units[unit_id]) >= required:
+                    satisfied[recipe_id] += 1
+
+        return {
+            recipe_id for recipe_id, count in satisfied.items()
+            if count == self.requirement_counts[recipe_id]
+        }
+
+    def coverage(self, snapshot, max_missing=0, user=None):
+        """
+        Ocenia wszystkie przepisy względem lodówki i zwraca listę RecipeCoverage
+        dla przepisów, którym brakuje co najwyżej max_missing składników.
+
+        Przeglądane są tylko wymagania dotyczące składników z lodówki; pozostałe
+        wymagania przepisu liczą się jako w całości brakujące. Jeśli podano
+        użytkownika, wynik obejmuje tylko przepisy publiczne i jego własne.
+        Wynik jest posortowany od najlepiej pokrytych przepisów, a przy równym
+        pokryciu od najmniejszego niedoboru.
+        """
+        satisfied = Counter()
+        # Suma częściowego pokrycia wymagań, których lodówka nie spełnia w całości
+        partial = defaultdict(float)
+        for ingredient_id, ingredient in snapshot.ingredients.items():
+            for recipe_id, unit_id, required in self.by_ingredient.get(ingredient_id, ()):
+                available = snapshot.available_amount(ingredient, self.units[unit_id])
+                if available >= required:
+                    satisfied[recipe_id] += 1
+                elif available > 0:
+                    partial[recipe_id] += available / required
+
+        user_id = user.id if user is not None and user.is_authenticated else None
+        results = []
+        for recipe_id, (is_public, author_id) in self.visibility.items():
+            if user is not None and not is_public and author_id != user_id:
+                continue
+            required = self.requirement_counts.get(recipe_id, 0)
+            done = satisfied.get(recipe_id, 0)
+            missing = required - done
+            if missing > max_missing:
+                continue
+            results.append(RecipeCoverage(
+                recipe_id, required, done, missing,
+                done / required if required else 1.0,
+                missing - partial.get(recipe_id, 0.0),
+            ))
+
+        results.sort(key=lambda item: (-item.coverage, item.shortfall, -item.recipe_id))
+        return results
+
+
+def get_cookable_index():
+    """Zwraca indeks, budując go przy pierwszym użyciu"""
+    global _index
+    index = _index
+    if index is None:
+        generation = _generation
+        index = CookableIndex.load()
+        with _lock:
+            # Nie zapisuj indeksu, jeśli w trakcie budowania dane się zmieniły
+            if generation == _generation:
+                _index = index
+    return index
+
+
+def invalidate_cookable_index():
+    """Usuwa indeks z pamięci - zostanie zbudowany ponownie przy następnym użyciu"""
+    global _index, _generation
+    with _lock:
+        _index = None
+        _generation += 1
+
+
+def filter_cookable(queryset, user, snapshot=None):
+    """
+    Zawęża queryset przepisów do tych, które użytkownik może przygotować
+    z zawartości swojej lodówki. Wynik pozostaje zwykłym querysetem.
+    """
+    from fridge.availability import FridgeSnapshot
+    from recipes.models import RecipeIngredient
+
+    if snapshot is None:
+        snapshot = FridgeSnapshot(user)
+
+    cookable_ids = get_cookable_index().cookable_recipe_ids(snapshot)
+    # Przepisy bez składników (lub tylko z zerowymi ilościami) zawsze można przygotować
+    has_requirements = Exists(RecipeIngredient.objects.filter(recipe=OuterRef('pk'), amount__gt=0))
+    return queryset.filter(Q(id__in=_id_list(cookable_ids, queryset.db)) | ~has_requirements)
+
+
+def _id_list(ids, using):
+    """
+    Wartość dla filtra id__in. Długa lista ID jest przekazywana jednym
+    parametrem - w SQLite jako tablica JSON (json_each), w PostgreSQL jako
+    tablica liczb (unnest) - więc nie przekracza limitu parametrów zapytania.
+    """
+    if len(ids) <= ID_LIST_PARAM_THRESHOLD:
+        return ids
+    vendor = connections[using].vendor
+    if vendor == 'sqlite':
+        return RawSQL('SELECT value FROM json_each(%s)', [json.dumps(sorted(ids))])
+    if vendor == 'postgresql':
+        return RawSQL('SELECT unnest(%s::integer[])', [sorted(ids)])
+    return ids
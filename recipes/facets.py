@@ -0,0 +1,115 @@
+"""
+Liczniki przepisów dla filtrów listy (fasety): kategorie, dieta, czas
+przygotowania, poziom trudności i najpopularniejsze składniki.
+
+Każda faseta to jedno zapytanie grupujące wykonywane na bieżących wynikach
+listy. Fasety dla listy bez filtrów są wspólne dla wszystkich użytkowników,
+więc trafiają do pamięci podręcznej pod kluczem z wersją listy przepisów
+(versions.RECIPE_LIST) - sygnały zmieniające przepisy, kategorie i składniki
+zwiększają tę wersję, a nieaktualne liczniki przestają być odczytywane.
+"""
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, Q, Value, When
+
+from . import versions
+from .models import Recipe, RecipeCategory, RecipeIngredient
+
+# Jak długo (w sekundach) pamiętać fasety listy bez filtrów
+FACETS_CACHE_TIMEOUT = 3600
+# Ile najpopularniejszych składników pokazywać
+TOP_INGREDIENTS_LIMIT = 20
+
+# Przedziały czasu przygotowania - takie same jak w filtrze prep_time listy przepisów
+PREP_TIME_BUCKETS = (
+    ('quick', Q(preparation_time__lte=30)),
+    ('medium', Q(preparation_time__gt=30, preparation_time__lte=60)),
+    ('long', Q(preparation_time__gt=60)),
+)
+
+
+def _category_counts(recipes):
+    """Wszystkie kategorie (także bez wyników) z liczbą pasujących przepisów"""
+    if recipes is None:
+        count = Count('recipes')
+    else:
+        count = Count('recipes', filter=Q(recipes__in=recipes))
+    return [
+        {'id': category['id'], 'name': category['name'], 'recipe_count': category['recipe_count']}
+        for category in RecipeCategory.objects.annotate(recipe_count=count).order_by('name').values('id', 'name', 'recipe_count')
+    ]
+
+
+def _diet_counts(base):
+    # Filtr "wegetariańskie" obejmuje też przepisy wegańskie, tak jak w widoku listy
+    return base.aggregate(
+        meat=Count('pk', filter=Q(is_vegetarian=False)),
+        vegetarian=Count('pk', filter=Q(is_vegetarian=True)),
+        vegan=Count('pk', filter=Q(is_vegan=True)),
+    )
+
+
+def _prep_time_counts(base):
+    bucket = Case(
+        *[When(condition, then=Value(name)) for name, condition in PREP_TIME_BUCKETS],
+        output_field=CharField(),
+    )
+    counts = dict(
+        base.annotate(bucket=bucket).values('bucket').annotate(count=Count('pk')).values_list('bucket', 'count')
+    )
+    return {name: counts.get(name, 0) for name, _ in PREP_TIME_BUCKETS}
+
+
+def _difficulty_counts(base):
+    counts = dict(base.values('difficulty').annotate(count=Count('pk')).values_list('difficulty', 'count'))
+    return {value: counts.get(value, 0) for value, _ in Recipe.DIFFICULTY_CHOICES}
+
+
+def _top_ingredients(recipes):
+    rows = RecipeIngredient.objects.all()
+    if recipes is not None:
+        rows = rows.filter(recipe__in=recipes)
+    rows = (
+        rows.values('ingredient_id', 'ingredient__name')
+        .annotate(recipe_count=Count('recipe_id', distinct=True))
+        .order_by('-recipe_count', 'ingredient__name')[:TOP_INGREDIENTS_LIMIT]
+    )
+    return [
+        {'id': row['ingredient_id'], 'name': row['ingredient__name'], 'recipe_count': row['recipe_count']}
+        for row in rows
+    ]
+
+
+def compute_facets(queryset=None):
+    """
+    Liczy fasety dla przepisów z querysetu (None - wszystkie przepisy).
+    Zwraca słownik: categories, diet, prep_time, difficulty, ingredients.
+    """
+    if queryset is None:
+        recipes = None
+        base = Recipe.objects.order_by()
+    else:
+        # Podzapytanie z samymi ID - bez sortowania, adnotacji wyszukiwania i DISTINCT z filtrów
+        recipes = queryset.order_by().values('pk')
+        base = Recipe.objects.filter(pk__in=recipes).order_by()
+    return {
+        'categories': _category_counts(recipes),
+        'diet': _diet_counts(base),
+        'prep_time': _prep_time_counts(base),
+        'difficulty': _difficulty_counts(base),
+        'ingredients': _top_ingredients(recipes),
+    }
+
+
+def get_facets(queryset=None):
+    """
+    Fasety dla listy przepisów. Bez querysetu (lista bez filtrów) wynik jest
+    brany z pamięci podręcznej; z querysetem liczony na bieżąco.
+    """
+    if queryset is not None:
+        return compute_facets(queryset)
+    key = f'recipe-facets:{versions.get_version(versions.RECIPE_LIST)}'
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets()
+        cache.set(key, facets, FACETS_CACHE_TIMEOUT)
+    return facets
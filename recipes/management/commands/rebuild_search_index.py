@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.search import rebuild_index
+
+class Command(BaseCommand):
+    help = 'Przebudowuje indeks pełnotekstowy przepisów (FTS5 w SQLite, tsvector w PostgreSQL)'
+
+    def handle(self, *args, **kwargs):
+        try:
+            count = rebuild_index()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f'Zaindeksowano {count} przepisów'))
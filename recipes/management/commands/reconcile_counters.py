@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Recipe, RecipeRating, COUNTER_CACHES
+
+def count_subquery(model, fk_name):
+    """Zwraca wyrażenie liczące obiekty model powiązane z bieżącym wierszem"""
+    counts = model.objects.filter(**{fk_name: OuterRef('pk')}).order_by().values(fk_name).annotate(
+        total=Count('pk')
+    ).values('total')
+    return Coalesce(Subquery(counts), 0)
+
+class Command(BaseCommand):
+    help = 'Naprawia zdenormalizowane liczniki (polubienia, komentarze, ulubione, przydatne oceny i agregaty ocen)'
+
+    def handle(self, *args, **kwargs):
+        for related_model, (model, fk_field, counter_field) in COUNTER_CACHES.items():
+            actual = count_subquery(related_model, fk_field.removesuffix('_id'))
+
+            # Aktualizujemy tylko obiekty, w których licznik rozjechał się z rzeczywistością
+            drifted = model.objects.annotate(actual=actual).exclude(**{counter_field: F('actual')})
+            fixed = model.objects.filter(pk__in=list(drifted.values_list('pk', flat=True))).update(
+                **{counter_field: actual}
+            )
+            self.stdout.write(f'{related_model._meta.verbose_name_plural}: poprawiono {fixed} liczników')
+
+        # Agregaty ocen (suma, średnia, rozkład) przeliczamy tam, gdzie nie zgadza się liczba ocen
+        drifted = Recipe.objects.annotate(
+            actual=count_subquery(RecipeRating, 'recipe')
+        ).exclude(rating_count=F('actual')).values_list('pk', flat=True)
+        rating_fixed = 0
+        for recipe_id in drifted:
+            Recipe.update_rating_aggregates(recipe_id)
+            rating_fixed += 1
+        self.stdout.write(f'Oceny przepisów: poprawiono {rating_fixed} agregatów')
+
+        self.stdout.write(self.style.SUCCESS('Liczniki zostały uzgodnione'))
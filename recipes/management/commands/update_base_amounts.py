@@ -0,0 +1,20 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from recipes.models import QUANTITY_MODELS
+
+class Command(BaseCommand):
+    help = ('Przelicza ilości w jednostkach bazowych (g, ml, szt) składników przepisów, '
+            'produktów w lodówkach i pozycji list zakupów. Migracje i zmiany jednostek miar lub '
+            'przeliczników przeliczają je same - polecenie służy do ręcznej naprawy danych.')
+
+    def handle(self, *args, **kwargs):
+        for label in QUANTITY_MODELS:
+            model = apps.get_model(label)
+            updated = model.update_base_amounts()
+            missing = model.objects.filter(base_amount__isnull=True).count()
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: zaktualizowano {updated}, '
+                f'bez ilości bazowej {missing}'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Przeliczono ilości w jednostkach bazowych'))
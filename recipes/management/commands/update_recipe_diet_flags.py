@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+
+class Command(BaseCommand):
+    help = 'Przelicza zapisane flagi diety (wegetariański/wegański) wszystkich przepisów'
+
+    def handle(self, *args, **kwargs):
+        updated = Recipe.update_diet_flags()
+
+        vegetarian_count = Recipe.objects.filter(is_vegetarian=True).count()
+        vegan_count = Recipe.objects.filter(is_vegan=True).count()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Przeliczono flagi diety dla {updated} przepisów '
+            f'(wegetariańskie: {vegetarian_count}, wegańskie: {vegan_count})'
+        ))
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:15
+
+from django.db import migrations, models
+
+
+def backfill_diet_flags(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ingredients = RecipeIngredient.objects.filter(recipe=models.OuterRef('pk'))
+    Recipe.objects.update(
+        is_vegetarian=~models.Exists(ingredients.filter(ingredient__category__is_vegetarian=False)),
+        is_vegan=~models.Exists(ingredients.filter(ingredient__category__is_vegan=False)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_add_parent_to_reciperating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='is_vegan',
+            field=models.BooleanField(db_index=True, default=True, editable=False, verbose_name='Wegański'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='is_vegetarian',
+            field=models.BooleanField(db_index=True, default=True, editable=False, verbose_name='Wegetariański'),
+        ),
+        migrations.RunPython(backfill_diet_flags, migrations.RunPython.noop),
+    ]
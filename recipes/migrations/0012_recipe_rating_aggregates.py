@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:16
+
+from django.db import migrations, models
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeRating = apps.get_model('recipes', 'RecipeRating')
+    histograms = {}
+    rows = RecipeRating.objects.values('recipe_id', 'rating').annotate(count=models.Count('id')).order_by()
+    for row in rows:
+        histogram = histograms.setdefault(row['recipe_id'], {str(score): 0 for score in range(1, 6)})
+        histogram[str(row['rating'])] = row['count']
+
+    for recipe_id, histogram in histograms.items():
+        rating_count = sum(histogram.values())
+        rating_sum = sum(int(score) * count for score, count in histogram.items())
+        Recipe.objects.filter(pk=recipe_id).update(
+            rating_sum=rating_sum,
+            rating_count=rating_count,
+            rating_avg=rating_sum / rating_count,
+            rating_histogram=histogram,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_diet_flags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_avg',
+            field=models.FloatField(db_index=True, default=0, editable=False, verbose_name='Średnia ocena'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Liczba ocen'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_histogram',
+            field=models.JSONField(default=dict, editable=False, verbose_name='Rozkład ocen'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Suma ocen'),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
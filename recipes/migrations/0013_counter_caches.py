@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:17
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, fk_field):
+    counts = model.objects.filter(**{fk_field: models.OuterRef('pk')}).order_by().values(fk_field).annotate(
+        total=models.Count('pk')
+    ).values('total')
+    return Coalesce(models.Subquery(counts), 0)
+
+
+def backfill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeRating = apps.get_model('recipes', 'RecipeRating')
+    Recipe.objects.update(
+        like_count=count_subquery(apps.get_model('recipes', 'RecipeLike'), 'recipe'),
+        comment_count=count_subquery(apps.get_model('recipes', 'Comment'), 'recipe'),
+        favorite_count=count_subquery(apps.get_model('recipes', 'FavoriteRecipe'), 'recipe'),
+    )
+    RecipeRating.objects.update(
+        helpful_votes=count_subquery(apps.get_model('recipes', 'RatingHelpful'), 'rating'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Liczba komentarzy'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorite_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Liczba dodań do ulubionych'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Liczba polubień'),
+        ),
+        migrations.AddField(
+            model_name='reciperating',
+            name='helpful_votes',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Liczba oznaczeń jako przydatna'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,89 @@
+import unicodedata
+
+from django.db import migrations
+
+# Kopia recipes.search.fold_text - migracja nie może zależeć od bieżącego kodu aplikacji
+_EXTRA_FOLDS = str.maketrans({'ł': 'l', 'Ł': 'l'})
+
+
+def fold_text(text):
+    text = (text or '').translate(_EXTRA_FOLDS)
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            try:
+                cursor.execute(
+                    'CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts USING fts5('
+                    'title, description, instructions, ingredients, tokenize="unicode61")'
+                )
+            except Exception:
+                # SQLite bez FTS5 - wyszukiwanie pozostanie przy icontains
+                return
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                'CREATE TABLE IF NOT EXISTS recipes_recipe_search ('
+                'recipe_id integer PRIMARY KEY, document tsvector NOT NULL)'
+            )
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS recipes_recipe_search_document_idx '
+                'ON recipes_recipe_search USING GIN (document)'
+            )
+        else:
+            return
+
+    # Wypełnienie indeksu istniejącymi przepisami
+    ingredient_names = {}
+    for recipe_id, name in RecipeIngredient.objects.values_list('recipe_id', 'ingredient__name'):
+        ingredient_names.setdefault(recipe_id, []).append(name)
+
+    with connection.cursor() as cursor:
+        for recipe_id, title, description, instructions in Recipe.objects.values_list(
+            'id', 'title', 'description', 'instructions'
+        ):
+            document = [
+                fold_text(title), fold_text(description), fold_text(instructions),
+                fold_text(' '.join(ingredient_names.get(recipe_id, []))),
+            ]
+            if connection.vendor == 'sqlite':
+                cursor.execute(
+                    'INSERT INTO recipes_recipe_fts (rowid, title, description, instructions, ingredients) '
+                    'VALUES (%s, %s, %s, %s, %s)',
+                    [recipe_id] + document
+                )
+            else:
+                cursor.execute(
+                    'INSERT INTO recipes_recipe_search (recipe_id, document) VALUES (%s, '
+                    "setweight(to_tsvector('simple', %s), 'A') || "
+                    "setweight(to_tsvector('simple', %s), 'B') || "
+                    "setweight(to_tsvector('simple', %s), 'C') || "
+                    "setweight(to_tsvector('simple', %s), 'D'))",
+                    [recipe_id, document[0], document[3], document[1], document[2]]
+                )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('DROP TABLE IF EXISTS recipes_recipe_fts')
+        elif connection.vendor == 'postgresql':
+            cursor.execute('DROP TABLE IF EXISTS recipes_recipe_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_counter_caches'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,167 @@
+"""
+Zamrożona kopia przeliczania ilości na jednostki bazowe (g, ml, szt) dla migracji
+uzupełniających kolumny base_amount/base_unit.
+
+Migracje nie mogą importować bieżącego kodu aplikacji (recipes.utils,
+recipes.conversion_graph), bo ten może się zmienić niezależnie od schematu
+bazy, dlatego logika convert_units i to_base_amount jest tu skopiowana
+i działa na modelach historycznych. Moduł zaczyna się od podkreślenia,
+więc Django nie traktuje go jako migracji.
+"""
+from collections import defaultdict, deque
+
+
+def _build_factors(edges, unit_types):
+    factors = {}
+    for from_id, to_id, ratio in edges:
+        factors.setdefault((to_id, from_id), 1.0 / ratio)
+    for from_id, to_id, ratio in edges:
+        factors[(from_id, to_id)] = ratio
+
+    adjacency = defaultdict(list)
+    for (from_id, to_id), ratio in factors.items():
+        if from_id != to_id and unit_types.get(from_id) == unit_types.get(to_id):
+            adjacency[from_id].append((to_id, ratio))
+
+    for start in list(adjacency):
+        visited = {start: 1.0}
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            for neighbour, ratio in adjacency[node]:
+                if neighbour not in visited:
+                    visited[neighbour] = visited[node] * ratio
+                    queue.append(neighbour)
+        for target, ratio in visited.items():
+            if target != start:
+                factors.setdefault((start, target), ratio)
+
+    return factors
+
+
+class _Converter:
+    """Przeliczniki jednostek wczytane z modeli historycznych"""
+
+    def __init__(self, apps):
+        MeasurementUnit = apps.get_model('recipes', 'MeasurementUnit')
+        UnitConversion = apps.get_model('recipes', 'UnitConversion')
+        IngredientConversion = apps.get_model('recipes', 'IngredientConversion')
+
+        units = list(MeasurementUnit.objects.all())
+        unit_types = {unit.id: unit.type for unit in units}
+        self.base_units = {}
+        for unit in units:
+            if unit.symbol in ('g', 'ml', 'szt'):
+                self.base_units.setdefault(unit.symbol, unit)
+        if 'szt' not in self.base_units:
+            for unit in units:
+                if unit.type == 'piece' and float(unit.base_ratio) == 1.0:
+                    self.base_units['szt'] = unit
+                    break
+
+        generic_edges = []
+        ingredient_edges = defaultdict(list)
+        for from_id, to_id, ingredient_id, ratio in UnitConversion.objects.values_list(
+            'from_unit_id', 'to_unit_id', 'ingredient_id', 'ratio'
+        ):
+            if float(ratio) <= 0:
+                continue
+            if ingredient_id is None:
+                generic_edges.append((from_id, to_id, float(ratio)))
+            else:
+                ingredient_edges[ingredient_id].append((from_id, to_id, float(ratio)))
+        for ingredient_id, from_id, to_id, ratio in IngredientConversion.objects.values_list(
+            'ingredient_id', 'from_unit_id', 'to_unit_id', 'ratio'
+        ):
+            if float(ratio) > 0:
+                ingredient_edges[ingredient_id].append((from_id, to_id, float(ratio)))
+
+        self.generic = _build_factors(generic_edges, unit_types)
+        self.by_ingredient = {
+            ingredient_id: _build_factors(edges, unit_types)
+            for ingredient_id, edges in ingredient_edges.items()
+        }
+
+    def convert(self, amount, from_unit, to_unit, ingredient):
+        """Odpowiednik recipes.utils.convert_units; ValueError, gdy przeliczenie nie jest możliwe"""
+        amount = float(amount)
+        if amount < 0:
+            raise ValueError(amount)
+        if from_unit.pk == to_unit.pk:
+            return amount
+
+        types = {from_unit.type, to_unit.type}
+        if types == {'piece', 'weight'}:
+            # Bez wagi sztuki pomijamy też przeliczniki składnika, jak convert_units
+            if ingredient.piece_weight:
+                if from_unit.type == 'piece':
+                    return amount * float(ingredient.piece_weight) / float(to_unit.base_ratio)
+                return amount * float(from_unit.base_ratio) / float(ingredient.piece_weight)
+        elif types == {'weight', 'volume'}:
+            if ingredient.density:
+                base_amount = amount * float(from_unit.base_ratio)
+                if from_unit.type == 'weight':
+                    return base_amount / float(ingredient.density) / float(to_unit.base_ratio)
+                return base_amount * float(ingredient.density) / float(to_unit.base_ratio)
+        else:
+            ratio = self.by_ingredient.get(ingredient.pk, {}).get((from_unit.pk, to_unit.pk))
+            if ratio is not None:
+                return amount * ratio
+
+        ratio = self.generic.get((from_unit.pk, to_unit.pk))
+        if ratio is not None:
+            return amount * ratio
+        if from_unit.type == to_unit.type or (
+            'spoon' in types and types & {'weight', 'volume'}
+        ):
+            if float(to_unit.base_ratio) == 0:
+                raise ValueError(to_unit.base_ratio)
+            return amount * float(from_unit.base_ratio) / float(to_unit.base_ratio)
+        raise ValueError((from_unit.type, to_unit.type))
+
+    def to_base_amount(self, amount, unit, ingredient):
+        """Odpowiednik recipes.utils.to_base_amount"""
+        if amount is None or unit is None or ingredient is None:
+            return None, ''
+
+        preferred = ['ml', 'g'] if ingredient.unit_type.startswith('volume') else ['g', 'ml']
+        for symbol in preferred:
+            base_unit = self.base_units.get(symbol)
+            if base_unit is None:
+                continue
+            if unit.type == 'piece' and base_unit.type == 'weight' and not ingredient.piece_weight:
+                continue
+            if unit.type != base_unit.type and {unit.type, base_unit.type} == {'weight', 'volume'} and not ingredient.density:
+                continue
+            try:
+                return float(self.convert(amount, unit, base_unit, ingredient)), symbol
+            except ValueError:
+                continue
+
+        piece_unit = self.base_units.get('szt')
+        if unit.type == 'piece' and piece_unit is not None:
+            try:
+                return float(self.convert(amount, unit, piece_unit, ingredient)), 'szt'
+            except ValueError:
+                pass
+
+        return None, ''
+
+
+def backfill_base_amounts(app_label, model_name, batch_size=500):
+    """Zwraca funkcję dla RunPython, która uzupełnia base_amount i base_unit wierszy modelu"""
+
+    def backfill(apps, schema_editor):
+        model = apps.get_model(app_label, model_name)
+        converter = _Converter(apps)
+        changed = []
+        for obj in model.objects.select_related('ingredient', 'unit').iterator(chunk_size=batch_size):
+            obj.base_amount, obj.base_unit = converter.to_base_amount(obj.amount, obj.unit, obj.ingredient)
+            changed.append(obj)
+            if len(changed) >= batch_size:
+                model.objects.bulk_update(changed, ['base_amount', 'base_unit'])
+                changed = []
+        if changed:
+            model.objects.bulk_update(changed, ['base_amount', 'base_unit'])
+
+    return backfill
@@ -1,12 +1,20 @@
-from django.db import models
+from django.apps import apps
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.urls import reverse
-from django.db.models.signals import post_save
+from django.db.models.functions import Substr
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 from datetime import datetime
 import copy
+from recipes.conversion_graph import invalidate_conversion_graph
+from recipes.cookable_index import invalidate_cookable_index
+from recipes import search, versions
+from recipes.autocomplete import invalidate_ingredient_autocomplete
+from recipes.utils import BASE_UNIT_CHOICES, to_base_amount
+from ksiazkakucharska.relations import get_relations, invalidate_relations
 
 class IngredientCategory(models.Model):
     name = models.CharField(max_length=100, verbose_name="Nazwa kategorii")
@@ -348,6 +356,28 @@ class RecipeCategory(models.Model):
     def __str__(self):
         return self.name
 
+class RecipeQuerySet(models.QuerySet):
+    # Kolumny wyświetlane na kartach przepisów - bez długich pól description i instructions
+    CARD_FIELDS = (
+        'title', 'servings', 'preparation_time', 'difficulty', 'image', 'author', 'created_at', 'is_public',
+        'is_vegetarian', 'is_vegan', 'rating_count', 'rating_avg', 'like_count', 'comment_count', 'favorite_count',
+    )
+    # Ile znaków opisu pobierać na kartę (więcej niż najdłuższe truncatechars w szablonach kart)
+    CARD_DESCRIPTION_LENGTH = 200
+    
+    def cards(self, with_ingredients=False):
+        """
+        Przepisy do wyświetlenia na kartach: tylko potrzebne kolumny, początek opisu
+        w short_description i nazwa autora z tego samego zapytania.
+        with_ingredients dociąga składniki z jednostkami - do sprawdzenia dostępności w lodówce.
+        """
+        queryset = self.select_related('author').only(*self.CARD_FIELDS, 'author__username').annotate(
+            short_description=Substr('description', 1, self.CARD_DESCRIPTION_LENGTH)
+        )
+        if with_ingredients:
+            queryset = queryset.prefetch_related('ingredients__ingredient', 'ingredients__unit')
+        return queryset
+
 class Recipe(models.Model):
     DIFFICULTY_CHOICES = [
         ('easy', 'Łatwy'),
@@ -367,6 +397,20 @@ class Recipe(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Data utworzenia")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Data aktualizacji")
     is_public = models.BooleanField(default=True, verbose_name="Publiczny")
+    # Flagi diety przeliczane sygnałami przy zmianie składników i ich kategorii
+    is_vegetarian = models.BooleanField(default=True, editable=False, db_index=True, verbose_name="Wegetariański")
+    is_vegan = models.BooleanField(default=True, editable=False, db_index=True, verbose_name="Wegański")
+    # Zagregowane oceny przeliczane po każdej zmianie RecipeRating
+    rating_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name="Suma ocen")
+    rating_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Liczba ocen")
+    rating_avg = models.FloatField(default=0, editable=False, db_index=True, verbose_name="Średnia ocena")
+    rating_histogram = models.JSONField(default=dict, editable=False, verbose_name="Rozkład ocen")
+    # Liczniki aktualizowane atomowo (F()) przy dodawaniu i usuwaniu powiązanych obiektów
+    like_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Liczba polubień")
+    comment_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Liczba komentarzy")
+    favorite_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Liczba dodań do ulubionych")
+    
+    objects = RecipeQuerySet.as_manager()
     
     class Meta:
         verbose_name = "Przepis"
@@ -379,13 +423,21 @@ class Recipe(models.Model):
     def get_absolute_url(self):
         return reverse('recipes:detail', args=[str(self.id)])
     
-    @property
-    def is_vegetarian(self):
-        return all(ing.ingredient.is_vegetarian for ing in self.ingredients.all())
-    
-    @property
-    def is_vegan(self):
-        return all(ing.ingredient.is_vegan for ing in self.ingredients.all())
+    @classmethod
+    def update_diet_flags(cls, queryset=None):
+        """
+        Przelicza flagi is_vegetarian i is_vegan jednym zapytaniem UPDATE.
+        Przepis jest wegetariański (wegański), jeśli żaden jego składnik nie należy
+        do kategorii niewegetariańskiej (niewegańskiej).
+        """
+        if queryset is None:
+            queryset = cls.objects.all()
+        
+        ingredients = RecipeIngredient.objects.filter(recipe=models.OuterRef('pk'))
+        return queryset.update(
+            is_vegetarian=~models.Exists(ingredients.filter(ingredient__category__is_vegetarian=False)),
+            is_vegan=~models.Exists(ingredients.filter(ingredient__category__is_vegan=False)),
+        )
     
     @property
     def is_meat(self):
@@ -395,19 +447,31 @@ class Recipe(models.Model):
     @property
     def likes_count(self):
         """Zwraca liczbę polubień przepisu"""
-        return self.likes.count()
+        return self.like_count
     
     @property
     def comments_count(self):
         """Zwraca liczbę komentarzy do przepisu"""
-        return self.comments.count()
+        return self.comment_count
     
     def is_liked_by(self, user):
         """Sprawdza, czy przepis jest polubiony przez danego użytkownika"""
         if not user.is_authenticated:
             return False
+        relations = get_relations(user)
+        if relations is not None:
+            return self.pk in relations.liked_recipe_ids
         return self.likes.filter(user=user).exists()
     
+    def is_favorite_of(self, user):
+        """Sprawdza, czy przepis jest w ulubionych danego użytkownika"""
+        if not user.is_authenticated:
+            return False
+        relations = get_relations(user)
+        if relations is not None:
+            return self.pk in relations.favorite_recipe_ids
+        return self.favorited_by.filter(user=user).exists()
+    
     def toggle_like(self, user):
         """Przełącza polubienie przepisu przez użytkownika. Zwraca True jeśli polubiono, False jeśli odklikano"""
         if not user.is_authenticated:
@@ -418,23 +482,23 @@ class Recipe(models.Model):
         if not created:
             # Jeśli polubienie już istniało, usuń je
             like.delete()
-            return False
-            
-        return True
+        
+        # Licznik został zmieniony w bazie przez sygnał - odśwież go w obiekcie
+        self.refresh_from_db(fields=['like_count'])
+        return created
     
-    def get_missing_ingredients(self, user, servings=None):
+    def get_missing_ingredients(self, user, servings=None, snapshot=None):
         """
         Zwraca listę składników, których brakuje użytkownikowi do przygotowania przepisu.
         
         Args:
             user: User object - użytkownik, dla którego sprawdzamy dostępność składników
             servings: int - liczba porcji (opcjonalnie, domyślnie używa liczby porcji z przepisu)
+            snapshot: FridgeSnapshot - wczytana wcześniej lodówka użytkownika (opcjonalnie)
             
         Returns:
             list: Lista obiektów RecipeIngredient, których brakuje
         """
-        from fridge.models import FridgeItem
-        
         # Jeśli użytkownik nie jest zalogowany, zwróć wszystkie składniki
         if not user or not user.is_authenticated:
             if servings and servings != self.servings:
@@ -449,69 +513,22 @@ class Recipe(models.Model):
                     result.append(missing_entry)
                 return result
             return self.ingredients.all()
-            
-        missing_ingredients = []
-        
-        # Oblicz współczynnik skalowania
-        scale_factor = 1.0
-        if servings and servings != self.servings:
-            scale_factor = float(servings) / float(self.servings)
         
-        # Debug - pokaż współczynnik skalowania
-        print(f"DEBUG: Współczynnik skalowania: {scale_factor} (z {self.servings} na {servings} porcji)")
+        # Cała lodówka jest wczytywana jednym zapytaniem i sprawdzana w pamięci
+        if snapshot is None:
+            from fridge.availability import FridgeSnapshot
+            snapshot = FridgeSnapshot(user)
         
-        # Sprawdź każdy składnik przepisu
-        for ingredient_entry in self.ingredients.all():
-            ingredient = ingredient_entry.ingredient
-            unit = ingredient_entry.unit
-            required_amount = ingredient_entry.amount * scale_factor  # Skaluj ilość składników
-            
-            print(f"DEBUG: Sprawdzanie {ingredient.name}: potrzeba {required_amount} {unit.symbol} (oryginalnie {ingredient_entry.amount} {unit.symbol})")
-            
-            # Sprawdź, czy ten składnik jest dostępny w lodówce
-            is_available = FridgeItem.check_ingredient_availability(user, ingredient, required_amount, unit)
-            print(f"DEBUG: Czy dostępny: {is_available}")
-            
-            if not is_available:
-                # Jeśli składnika brakuje, utwórz kopię obiektu RecipeIngredient
-                missing_entry = copy.copy(ingredient_entry)
-                
-                # Oblicz brakującą ilość
-                total_available = 0.0
-                fridge_items = FridgeItem.objects.filter(user=user, ingredient=ingredient)
-                
-                for item in fridge_items:
-                    try:
-                        # Jeśli jednostki są różne, przelicz
-                        if item.unit != unit:
-                            try:
-                                from recipes.utils import convert_units
-                                converted = convert_units(float(item.amount), item.unit, unit, ingredient=ingredient)
-                                total_available += converted
-                            except Exception as e:
-                                print(f"DEBUG: Błąd konwersji: {e}")
-                                continue
-                        else:
-                            total_available += float(item.amount)
-                    except Exception as e:
-                        print(f"DEBUG: Ogólny błąd: {e}")
-                        continue
-                
-                # Przypisz przeskalowaną ilość i brakującą wartość
-                missing_entry.amount = required_amount
-                missing_entry.missing = max(0, required_amount - total_available)
-                missing_entry.available = total_available
-                
-                print(f"DEBUG: Brakuje {missing_entry.missing} {unit.symbol} z {required_amount} {unit.symbol} (dostępne: {total_available} {unit.symbol})")
-                
-                # Dodaj do listy brakujących składników
-                missing_ingredients.append(missing_entry)
-                
-        return missing_ingredients
+        return snapshot.missing_ingredients(self, servings)
     
-    def can_be_prepared_with_available_ingredients(self, user):
+    def can_be_prepared_with_available_ingredients(self, user, snapshot=None):
         """Sprawdza, czy przepis może być przygotowany z dostępnych składników"""
-        return self.get_missing_ingredients(user) == []
+        if not user or not user.is_authenticated:
+            return False
+        if snapshot is None:
+            from fridge.availability import FridgeSnapshot
+            snapshot = FridgeSnapshot(user)
+        return snapshot.can_prepare(self)
     
     def scale_to_servings(self, target_servings):
         """Zwraca listę składników przepisu przeskalowaną do podanej liczby porcji"""
@@ -543,15 +560,31 @@ class Recipe(models.Model):
     @property
     def average_rating(self):
         """Zwraca średnią ocenę przepisu"""
-        ratings = self.ratings.all()
-        if not ratings:
-            return 0
-        return sum(rating.rating for rating in ratings) / len(ratings)
+        return self.rating_avg
     
     @property
     def ratings_count(self):
         """Zwraca liczbę ocen dla przepisu"""
-        return self.ratings.count()
+        return self.rating_count
+    
+    @classmethod
+    def update_rating_aggregates(cls, recipe_id):
+        """Przelicza zapisane agregaty ocen przepisu (suma, liczba, średnia, rozkład)"""
+        rows = RecipeRating.objects.filter(recipe_id=recipe_id).values('rating').annotate(
+            count=models.Count('id')
+        ).order_by()
+        histogram = {str(score): 0 for score in range(1, 6)}
+        for row in rows:
+            histogram[str(row['rating'])] = row['count']
+        
+        rating_count = sum(histogram.values())
+        rating_sum = sum(int(score) * count for score, count in histogram.items())
+        cls.objects.filter(pk=recipe_id).update(
+            rating_sum=rating_sum,
+            rating_count=rating_count,
+            rating_avg=rating_sum / rating_count if rating_count else 0,
+            rating_histogram=histogram,
+        )
     
     def get_user_rating(self, user):
         """Zwraca ocenę danego użytkownika dla przepisu"""
@@ -564,10 +597,8 @@ class Recipe(models.Model):
 
     def get_rating_stats(self):
         """Zwraca statystyki ocen przepisu (ile ocen poszczególnych wartości)"""
-        stats = {i: 0 for i in range(1, 6)}  # Słownik z kluczami 1-5 i wartościami początkowymi 0
-        
-        for rating in self.ratings.all():
-            stats[rating.rating] += 1
+        # Rozkład ocen jest zapisany w przepisie - nie trzeba odpytywać bazy
+        stats = {i: self.rating_histogram.get(str(i), 0) for i in range(1, 6)}
             
         # Dodajemy dodatkowe informacje: łączna liczba ocen i procenty dla każdej oceny
         total = sum(stats.values())
@@ -583,7 +614,71 @@ class Recipe(models.Model):
             'percentages': percentages
         }
 
-class RecipeIngredient(models.Model):
+class BaseQuantity(models.Model):
+    """
+    Wspólna część modeli przechowujących ilość składnika (amount + unit).
+    Oprócz ilości w jednostce podanej przez użytkownika zapisuje ilość
+    w kanonicznej jednostce składnika (g, ml lub szt), dzięki czemu sumy
+    i porównania ilości można liczyć w SQL (SUM(base_amount) GROUP BY ingredient).
+    """
+    base_amount = models.FloatField(null=True, blank=True, editable=False, verbose_name="Ilość w jednostce bazowej")
+    base_unit = models.CharField(max_length=3, choices=BASE_UNIT_CHOICES, blank=True, editable=False, verbose_name="Jednostka bazowa")
+
+    # Pola, których zmiana wymaga przeliczenia ilości bazowej
+    QUANTITY_FIELDS = {'amount', 'unit', 'unit_id', 'ingredient', 'ingredient_id'}
+
+    class Meta:
+        abstract = True
+
+    def update_base_amount(self):
+        """Przelicza ilość w jednostce bazowej (bez zapisu do bazy)"""
+        self.base_amount, self.base_unit = to_base_amount(self.amount, self.unit, self.ingredient)
+
+    def save(self, *args, **kwargs):
+        self.update_base_amount()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and self.QUANTITY_FIELDS & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'base_amount', 'base_unit'}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def update_base_amounts(cls, queryset=None, batch_size=500):
+        """
+        Przelicza i zapisuje ilości bazowe wierszy (domyślnie wszystkich).
+        Zwraca liczbę zmienionych wierszy.
+        """
+        if queryset is None:
+            queryset = cls.objects.all()
+
+        updated = 0
+        changed = []
+        for obj in queryset.select_related('ingredient', 'unit').iterator(chunk_size=batch_size):
+            previous = (obj.base_amount, obj.base_unit)
+            obj.update_base_amount()
+            if (obj.base_amount, obj.base_unit) != previous:
+                changed.append(obj)
+            if len(changed) >= batch_size:
+                cls.objects.bulk_update(changed, ['base_amount', 'base_unit'])
+                updated += len(changed)
+                changed = []
+        if changed:
+            cls.objects.bulk_update(changed, ['base_amount', 'base_unit'])
+            updated += len(changed)
+        return updated
+
+    @classmethod
+    def base_totals(cls, queryset):
+        """
+        Sumuje ilości bazowe w SQL.
+        Zwraca słownik {(ingredient_id, jednostka_bazowa): suma}; wiersze bez
+        ilości bazowej są pomijane.
+        """
+        rows = queryset.filter(base_amount__isnull=False).order_by().values(
+            'ingredient_id', 'base_unit'
+        ).annotate(total=models.Sum('base_amount'))
+        return {(row['ingredient_id'], row['base_unit']): row['total'] for row in rows}
+
+class RecipeIngredient(BaseQuantity):
     recipe = models.ForeignKey(Recipe, related_name='ingredients', on_delete=models.CASCADE, verbose_name="Przepis")
     ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, verbose_name="Składnik")
     amount = models.FloatField(verbose_name="Ilość")
@@ -953,6 +1048,7 @@ class RecipeRating(models.Model):
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Data aktualizacji")
     comment = models.TextField(blank=True, null=True, verbose_name="Komentarz do oceny")
     parent = models.ForeignKey('self', on_delete=models.CASCADE, blank=True, null=True, related_name='replies', verbose_name="Odpowiedź na ocenę")
+    helpful_votes = models.PositiveIntegerField(default=0, editable=False, verbose_name="Liczba oznaczeń jako przydatna")
     
     class Meta:
         verbose_name = "Ocena przepisu"
@@ -970,12 +1066,16 @@ class RecipeRating(models.Model):
     @property
     def helpful_count(self):
         """Zwraca liczbę oznaczeń oceny jako przydatna"""
-        return self.helpful_marks.count()
+        return self.helpful_votes
     
     def is_helpful_for(self, user):
         """Sprawdza, czy ocena jest oznaczona jako przydatna przez danego użytkownika"""
         if not user.is_authenticated:
             return False
+        # W żądaniu wszystkie przydatne oceny użytkownika są wczytywane jednym zapytaniem
+        relations = get_relations(user)
+        if relations is not None:
+            return self.pk in relations.helpful_rating_ids
         return self.helpful_marks.filter(user=user).exists()
     
     def toggle_helpful(self, user):
@@ -988,9 +1088,10 @@ class RecipeRating(models.Model):
         if not created:
             # Jeśli oznaczenie już istniało, usuń je
             helpful.delete()
-            return False
-            
-        return True
+        
+        # Licznik został zmieniony w bazie przez sygnał - odśwież go w obiekcie
+        self.refresh_from_db(fields=['helpful_votes'])
+        return created
 
 class RatingHelpful(models.Model):
     """Model do przechowywania informacji o tym, czy ocena była przydatna dla użytkownika"""
@@ -1004,4 +1105,177 @@ class RatingHelpful(models.Model):
         unique_together = ('user', 'rating')  # Użytkownik może oznaczyć ocenę jako przydatną tylko raz
         
     def __str__(self):
-        return f"Ocena {self.rating.id} oznaczona jako przydatna przez {self.user.username}" 
\ No newline at end of file
+        return f"Ocena {self.rating.id} oznaczona jako przydatna przez {self.user.username}" 
+
+@receiver([post_save, post_delete], sender=MeasurementUnit)
+@receiver([post_save, post_delete], sender=UnitConversion)
+@receiver([post_save, post_delete], sender=IngredientConversion)
+def invalidate_unit_conversions(sender, instance, **kwargs):
+    """
+    Unieważnia graf konwersji jednostek po zmianie jednostek lub przeliczników
+    i przelicza zapisane ilości bazowe wierszy, których zmiana może dotyczyć
+    """
+    invalidate_conversion_graph()
+    # Ponownie po zatwierdzeniu transakcji, aby inne wątki nie wczytały starych danych
+    transaction.on_commit(invalidate_conversion_graph)
+    if not kwargs.get('raw'):
+        # Po zatwierdzeniu - graf musi zostać zbudowany z nowych przeliczników
+        ingredient_id = None if sender is MeasurementUnit else instance.ingredient_id
+        transaction.on_commit(lambda: recompute_base_amounts(ingredient_id))
+    # Po przeliczeniu ilości bazowych, aby dostępność nie była zapamiętana ze starych danych
+    versions.bump_version(versions.UNITS)
+    # Wymagania w indeksie przepisów są przeliczone na jednostki bazowe
+    invalidate_cookable_index()
+    transaction.on_commit(invalidate_cookable_index)
+
+# Liczniki zdenormalizowane: model powiązany -> (model z licznikiem, pole klucza obcego, pole licznika)
+COUNTER_CACHES = {
+    RecipeLike: (Recipe, 'recipe_id', 'like_count'),
+    Comment: (Recipe, 'recipe_id', 'comment_count'),
+    FavoriteRecipe: (Recipe, 'recipe_id', 'favorite_count'),
+    RatingHelpful: (RecipeRating, 'rating_id', 'helpful_votes'),
+}
+
+# Modele z ilościami składników (BaseQuantity) - przeliczane przy zmianie składnika
+QUANTITY_MODELS = ('recipes.RecipeIngredient', 'fridge.FridgeItem', 'shopping.ShoppingItem')
+
+def change_counter_cache(instance, delta):
+    """Atomowo zmienia licznik obiektu nadrzędnego (UPDATE ... SET licznik = licznik + delta)"""
+    model, fk_field, counter_field = COUNTER_CACHES[type(instance)]
+    queryset = model.objects.filter(pk=getattr(instance, fk_field))
+    if delta < 0:
+        # Licznik nie może spaść poniżej zera (np. po ręcznej zmianie danych)
+        queryset = queryset.filter(**{f'{counter_field}__gte': -delta})
+    queryset.update(**{counter_field: models.F(counter_field) + delta})
+
+@receiver(post_save, sender=RecipeLike)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_save, sender=RatingHelpful)
+def increment_counter_cache(sender, instance, created, **kwargs):
+    """Zwiększa licznik przepisu lub oceny po dodaniu polubienia, komentarza itp."""
+    if created:
+        change_counter_cache(instance, 1)
+
+@receiver(post_delete, sender=RecipeLike)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_delete, sender=RatingHelpful)
+def decrement_counter_cache(sender, instance, **kwargs):
+    """Zmniejsza licznik przepisu lub oceny po usunięciu polubienia, komentarza itp."""
+    change_counter_cache(instance, -1)
+
+@receiver([post_save, post_delete], sender=RecipeRating)
+def update_recipe_rating_aggregates(sender, instance, **kwargs):
+    """Aktualizuje zagregowane oceny przepisu po dodaniu, zmianie lub usunięciu oceny"""
+    Recipe.update_rating_aggregates(instance.recipe_id)
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def update_recipe_diet_flags(sender, instance, **kwargs):
+    """Przelicza flagi diety przepisu po zmianie jego składników"""
+    Recipe.update_diet_flags(Recipe.objects.filter(pk=instance.recipe_id))
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes_diet_flags(sender, instance, created, **kwargs):
+    """Przelicza flagi diety przepisów zawierających składnik (np. po zmianie kategorii)"""
+    if not created:
+        Recipe.update_diet_flags(Recipe.objects.filter(ingredients__ingredient=instance))
+
+@receiver(post_save, sender=IngredientCategory)
+def update_category_recipes_diet_flags(sender, instance, created, **kwargs):
+    """Przelicza flagi diety przepisów ze składnikami danej kategorii"""
+    if not created:
+        Recipe.update_diet_flags(Recipe.objects.filter(ingredients__ingredient__category=instance))
+
+def recompute_base_amounts(ingredient_id=None):
+    """
+    Przelicza ilości bazowe wierszy z ilościami składników: tylko danego
+    składnika albo (None) wszystkich - współczynniki ogólne wchodzą do
+    przeliczników przechodnich, więc zmiana jednej jednostki może zmienić
+    przeliczenie dowolnej innej. Zapisywane są tylko zmienione wiersze.
+    """
+    for label in QUANTITY_MODELS:
+        model = apps.get_model(label)
+        queryset = model.objects.all()
+        if ingredient_id is not None:
+            queryset = queryset.filter(ingredient_id=ingredient_id)
+        model.update_base_amounts(queryset)
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_base_amounts(sender, instance, created, **kwargs):
+    """Po zmianie składnika (np. gęstości lub wagi sztuki) przelicza ilości bazowe jego wierszy"""
+    if not created:
+        for label in QUANTITY_MODELS:
+            model = apps.get_model(label)
+            model.update_base_amounts(model.objects.filter(ingredient=instance))
+
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_recipe_requirements(sender, **kwargs):
+    """Unieważnia indeks przepisów możliwych do przygotowania po zmianie składników"""
+    invalidate_cookable_index()
+    transaction.on_commit(invalidate_cookable_index)
+
+@receiver(post_save, sender=Recipe)
+def index_recipe_for_search(sender, instance, **kwargs):
+    """Aktualizuje przepis w indeksie pełnotekstowym"""
+    search.index_recipe(instance.pk)
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_search(sender, instance, **kwargs):
+    """Usuwa przepis z indeksu pełnotekstowego"""
+    search.remove_recipe(instance.pk)
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def index_recipe_ingredients_for_search(sender, instance, **kwargs):
+    """Aktualizuje nazwy składników przepisu w indeksie pełnotekstowym"""
+    search.index_recipe(instance.recipe_id)
+
+@receiver(post_save, sender=Ingredient)
+def index_ingredient_recipes_for_search(sender, instance, created, **kwargs):
+    """Po zmianie nazwy składnika aktualizuje w indeksie przepisy, które go zawierają"""
+    if not created:
+        for recipe_id in RecipeIngredient.objects.filter(ingredient=instance).values_list('recipe_id', flat=True).distinct():
+            search.index_recipe(recipe_id)
+
+@receiver([post_save, post_delete], sender=Ingredient)
+@receiver([post_save, post_delete], sender=IngredientCategory)
+def refresh_ingredient_autocomplete(sender, **kwargs):
+    """Unieważnia indeks podpowiedzi składników po zmianie składników lub kategorii"""
+    invalidate_ingredient_autocomplete()
+    transaction.on_commit(invalidate_ingredient_autocomplete)
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def touch_ingredient_version(sender, **kwargs):
+    """Gęstość i waga sztuki składnika wpływają na dostępność we wszystkich przepisach"""
+    versions.bump_version(versions.UNITS)
+
+@receiver([post_save, post_delete], sender=Recipe)
+def touch_recipe_version(sender, instance, **kwargs):
+    """Zmienia wersję przepisu (np. po zmianie liczby porcji) i listy przepisów"""
+    versions.bump_version(versions.RECIPE, instance.pk)
+    versions.bump_version(versions.RECIPE_LIST)
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def touch_recipe_ingredients_version(sender, instance, **kwargs):
+    """Zmienia wersję przepisu po zmianie jego składników"""
+    versions.bump_version(versions.RECIPE, instance.recipe_id)
+    versions.bump_version(versions.RECIPE_LIST)
+
+@receiver([post_save, post_delete], sender=RecipeCategory)
+@receiver([post_save, post_delete], sender=Ingredient)
+@receiver(post_save, sender=IngredientCategory)
+@receiver(m2m_changed, sender=Recipe.categories.through)
+def touch_recipe_list_facets_version(sender, action=None, **kwargs):
+    """Kategorie przepisów, nazwy składników i flagi diety wpływają na liczniki filtrów listy"""
+    # m2m_changed wysyła też sygnały pre_add/pre_remove/pre_clear - wystarczą te po zmianie
+    if action is None or action.startswith('post_'):
+        versions.bump_version(versions.RECIPE_LIST)
+
+@receiver([post_save, post_delete], sender=RecipeLike)
+@receiver([post_save, post_delete], sender=FavoriteRecipe)
+@receiver([post_save, post_delete], sender=RatingHelpful)
+def invalidate_request_user_relations(sender, instance, **kwargs):
+    """Unieważnia wczytane w bieżącym żądaniu powiązania użytkownika (polubienia, ulubione, przydatne oceny)"""
+    invalidate_relations(instance.user_id)
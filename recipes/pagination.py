@@ -0,0 +1,132 @@
+"""
+Stronicowanie po kluczu sortowania (keyset / kursor) zamiast OFFSET.
+
+Kolejna strona to wiersze "za" ostatnim wierszem bieżącej strony w porządku
+sortowania, np. (created_at, id) < (ostatnia data, ostatnie id). Baza danych nie
+musi przeglądać i pomijać wszystkich wcześniejszych wierszy, więc każda strona
+kosztuje tyle samo. Pozycja jest przekazywana jako podpisany, nieprzezroczysty
+token (kursor) - zmieniony lub nieaktualny token prowadzi do pierwszej strony.
+
+Łączna liczba wyników nie jest potrzebna do stronicowania; widoki mogą ją
+liczyć rzadziej i zapamiętywać (cached_count).
+"""
+import hashlib
+from datetime import date, datetime
+
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Q
+
+CURSOR_SALT = 'recipes.pagination'
+# Jak długo (w sekundach) pamiętać liczbę wyników zapytania
+COUNT_CACHE_TIMEOUT = 300
+
+
+class KeysetPage:
+    """Strona wyników z kursorami do sąsiednich stron"""
+
+    def __init__(self, object_list, next_cursor, previous_cursor, paginator):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.paginator = paginator
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Stronicuje queryset posortowany według ordering (lista pól jak w order_by,
+    np. ['-rating_avg', '-created_at']). Klucz główny jest dopisywany na końcu,
+    aby porządek był jednoznaczny.
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = [field for field in ordering if field.lstrip('-') not in ('pk', 'id')]
+        descending = self.ordering[-1].startswith('-') if self.ordering else True
+        self.ordering.append('-pk' if descending else 'pk')
+        # [(nazwa pola, malejąco?)]
+        self.fields = [(field.lstrip('-'), field.startswith('-')) for field in self.ordering]
+
+    def _encode(self, obj, direction):
+        values = []
+        for name, _ in self.fields:
+            value = getattr(obj, name)
+            # Daty w pełnej precyzji (z mikrosekundami) - porównanie w kursorze musi być dokładne
+            if isinstance(value, (date, datetime)):
+                value = value.isoformat()
+            values.append(value)
+        return signing.dumps({'v': values, 'd': direction}, salt=CURSOR_SALT, compress=True)
+
+    def _decode(self, token):
+        try:
+            payload = signing.loads(token, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            return None, None
+        values, direction = payload.get('v'), payload.get('d')
+        if not isinstance(values, list) or len(values) != len(self.fields) or direction not in ('next', 'prev'):
+            return None, None
+        return values, direction
+
+    def _after(self, values, reverse=False):
+        """Warunek "wiersz leży za values" w porządku sortowania (lub przed nim, gdy reverse)"""
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.fields, values):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def page(self, cursor=None):
+        """Zwraca stronę wskazaną przez kursor (bez kursora - pierwszą stronę)"""
+        values, direction = self._decode(cursor) if cursor else (None, None)
+
+        if direction == 'prev':
+            # Strona poprzednia: odwrócony porządek, a potem odwrócenie pobranych wierszy
+            reversed_ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+            rows = list(self.queryset.filter(self._after(values, reverse=True)).order_by(*reversed_ordering)[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            next_cursor = self._encode(rows[-1], 'next') if rows else None
+            previous_cursor = self._encode(rows[0], 'prev') if rows and has_more else None
+        else:
+            queryset = self.queryset.order_by(*self.ordering)
+            if values is not None:
+                queryset = queryset.filter(self._after(values))
+            rows = list(queryset[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            next_cursor = self._encode(rows[-1], 'next') if rows and has_more else None
+            previous_cursor = self._encode(rows[0], 'prev') if rows and values is not None else None
+
+        return KeysetPage(rows, next_cursor, previous_cursor, self)
+
+
+def cached_count(queryset, key_parts, timeout=COUNT_CACHE_TIMEOUT):
+    """
+    Zwraca liczbę wierszy querysetu zapamiętaną pod kluczem zbudowanym z key_parts
+    (np. parametrów filtrów i wersji danych). Wynik może być nieaktualny najwyżej
+    o timeout sekund.
+    """
+    key = 'count:' + hashlib.sha1(repr(key_parts).encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.order_by().count()
+        cache.set(key, count, timeout)
+    return count
@@ -0,0 +1,284 @@
+"""
+Indeks pełnotekstowy przepisów.
+
+Obsługiwane są dwa silniki:
+- SQLite - wirtualna tabela FTS5 z rankingiem bm25,
+- PostgreSQL - tabela z kolumną tsvector, indeksem GIN i rankingiem ts_rank.
+
+Indeks obejmuje tytuł, opis, instrukcje i nazwy składników. Tekst jest przed
+zapisem sprowadzany do małych liter bez polskich znaków (fold_text), a zapytania
+przechodzą przez prosty stemmer, który obcina typowe polskie końcówki fleksyjne
+i wyszukuje po prefiksie ("pomidorami" -> "pomidor*"). Gdy żaden silnik nie jest
+dostępny, wyszukiwanie wraca do filtrów icontains.
+
+Indeks jest aktualizowany sygnałami z recipes/models.py, a komenda
+rebuild_search_index przebudowuje go od zera.
+"""
+import logging
+import re
+import unicodedata
+
+from django.db import DatabaseError, connection
+from django.db.models import F, FloatField, Func, Q, Value
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'recipes_recipe_fts'
+PG_TABLE = 'recipes_recipe_search'
+
+# Znaki, których nie rozkłada normalizacja NFKD
+_EXTRA_FOLDS = str.maketrans({'ł': 'l', 'Ł': 'l'})
+
+# Końcówki fleksyjne (po usunięciu polskich znaków), od najdłuższych
+_SUFFIXES = sorted([
+    'owie', 'ami', 'ach', 'ego', 'emu', 'ich', 'ych', 'ymi', 'imi',
+    'ow', 'om', 'ej', 'ie', 'ia', 'iu', 'ii',
+    'a', 'e', 'i', 'o', 'u', 'y',
+], key=len, reverse=True)
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def fold_text(text):
+    """Zamienia tekst na małe litery bez znaków diakrytycznych ("Żółty" -> "zolty")"""
+    text = (text or '').translate(_EXTRA_FOLDS)
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def stem_word(word):
+    """Obcina polską końcówkę fleksyjną, zostawiając co najmniej trzy znaki"""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def query_terms(query):
+    """Zwraca listę rdzeni słów z zapytania użytkownika"""
+    return [stem_word(word) for word in _WORD_RE.findall(fold_text(query))]
+
+
+class CorrelatedSQL(Func):
+    """
+    Podzapytanie SQL skorelowane z przepisem z zapytania zewnętrznego.
+    W szablonie {column} zastępuje kolumna klucza głównego z aliasem tabeli
+    nadanym przez kompilator (działa też, gdy zapytanie jest podzapytaniem
+    z innym aliasem), a %s - kolejne parametry.
+    """
+
+    def __init__(self, sql, params, output_field=None):
+        super().__init__(F('pk'), output_field=output_field)
+        self.sql = sql
+        self.params = params
+
+    def as_sql(self, compiler, connection, **extra_context):
+        column_sql, column_params = compiler.compile(self.source_expressions[0])
+        return f'({self.sql.format(column=column_sql)})', [*self.params, *column_params]
+
+
+class SQLiteBackend:
+    """Indeks oparty o wirtualną tabelę FTS5 (rowid = id przepisu)"""
+
+    def create_table(self, cursor):
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+            'title, description, instructions, ingredients, tokenize="unicode61")'
+        )
+
+    def clear(self, cursor):
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def upsert(self, cursor, recipe_id, title, description, instructions, ingredients):
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [recipe_id])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, description, instructions, ingredients) '
+            'VALUES (%s, %s, %s, %s, %s)',
+            [recipe_id, title, description, instructions, ingredients]
+        )
+
+    def delete(self, cursor, recipe_id):
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [recipe_id])
+
+    def match_expression(self, terms):
+        return ' AND '.join(f'"{term}"*' for term in terms)
+
+    def filter_sql(self, terms):
+        return RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [self.match_expression(terms)]
+        )
+
+    def rank_sql(self, terms):
+        # bm25 zwraca wartości ujemne - im mniejsza, tym lepsze dopasowanie.
+        # Wagi kolumn: tytuł, opis, instrukcje, składniki
+        return CorrelatedSQL(
+            f'SELECT bm25({FTS_TABLE}, 10.0, 2.0, 1.0, 5.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = {{column}}',
+            [self.match_expression(terms)],
+            output_field=FloatField()
+        )
+
+
+class PostgresBackend:
+    """Indeks oparty o kolumnę tsvector (konfiguracja 'simple' na tekście bez polskich znaków)"""
+
+    def create_table(self, cursor):
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {PG_TABLE} ('
+            'recipe_id integer PRIMARY KEY, document tsvector NOT NULL)'
+        )
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {PG_TABLE}_document_idx ON {PG_TABLE} USING GIN (document)'
+        )
+
+    def clear(self, cursor):
+        cursor.execute(f'DELETE FROM {PG_TABLE}')
+
+    def upsert(self, cursor, recipe_id, title, description, instructions, ingredients):
+        cursor.execute(
+            f'INSERT INTO {PG_TABLE} (recipe_id, document) VALUES (%s, '
+            "setweight(to_tsvector('simple', %s), 'A') || "
+            "setweight(to_tsvector('simple', %s), 'B') || "
+            "setweight(to_tsvector('simple', %s), 'C') || "
+            "setweight(to_tsvector('simple', %s), 'D')) "
+            'ON CONFLICT (recipe_id) DO UPDATE SET document = EXCLUDED.document',
+            [recipe_id, title, ingredients, description, instructions]
+        )
+
+    def delete(self, cursor, recipe_id):
+        cursor.execute(f'DELETE FROM {PG_TABLE} WHERE recipe_id = %s', [recipe_id])
+
+    def match_expression(self, terms):
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def filter_sql(self, terms):
+        return RawSQL(
+            f"SELECT recipe_id FROM {PG_TABLE} WHERE document @@ to_tsquery('simple', %s)",
+            [self.match_expression(terms)]
+        )
+
+    def rank_sql(self, terms):
+        # Ranking ze znakiem minus, aby - jak w SQLite - mniejsza wartość oznaczała lepsze dopasowanie
+        return CorrelatedSQL(
+            f"SELECT -ts_rank(document, to_tsquery('simple', %s)) FROM {PG_TABLE} "
+            'WHERE recipe_id = {column}',
+            [self.match_expression(terms)],
+            output_field=FloatField()
+        )
+
+
+_BACKENDS = {
+    'sqlite': SQLiteBackend,
+    'postgresql': PostgresBackend,
+}
+_TABLES = {
+    'sqlite': FTS_TABLE,
+    'postgresql': PG_TABLE,
+}
+_available = None
+
+
+def get_backend():
+    """Zwraca silnik indeksu dla bieżącej bazy lub None, jeśli indeks nie istnieje"""
+    global _available
+    if _available is None:
+        table = _TABLES.get(connection.vendor)
+        try:
+            _available = table is not None and table in connection.introspection.table_names()
+        except DatabaseError:
+            _available = False
+    if not _available:
+        return None
+    return _BACKENDS[connection.vendor]()
+
+
+def _recipe_document(recipe_id):
+    """Zwraca złożony dokument przepisu do indeksu lub None, jeśli przepis nie istnieje"""
+    from recipes.models import Recipe, RecipeIngredient
+
+    row = Recipe.objects.filter(pk=recipe_id).values('title', 'description', 'instructions').first()
+    if row is None:
+        return None
+    ingredient_names = RecipeIngredient.objects.filter(recipe_id=recipe_id).values_list('ingredient__name', flat=True)
+    return (
+        fold_text(row['title']),
+        fold_text(row['description']),
+        fold_text(row['instructions']),
+        fold_text(' '.join(ingredient_names)),
+    )
+
+
+def index_recipe(recipe_id):
+    """Dodaje lub aktualizuje przepis w indeksie"""
+    backend = get_backend()
+    if backend is None:
+        return
+    document = _recipe_document(recipe_id)
+    with connection.cursor() as cursor:
+        if document is None:
+            backend.delete(cursor, recipe_id)
+        else:
+            backend.upsert(cursor, recipe_id, *document)
+
+
+def remove_recipe(recipe_id):
+    """Usuwa przepis z indeksu"""
+    backend = get_backend()
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        backend.delete(cursor, recipe_id)
+
+
+def rebuild_index():
+    """Tworzy (jeśli trzeba) i wypełnia od nowa indeks wszystkich przepisów. Zwraca liczbę przepisów."""
+    global _available
+    from recipes.models import Recipe, RecipeIngredient
+
+    backend_class = _BACKENDS.get(connection.vendor)
+    if backend_class is None:
+        raise ValueError(f"Baza danych '{connection.vendor}' nie obsługuje indeksu pełnotekstowego")
+    backend = backend_class()
+
+    ingredient_names = {}
+    for recipe_id, name in RecipeIngredient.objects.values_list('recipe_id', 'ingredient__name'):
+        ingredient_names.setdefault(recipe_id, []).append(name)
+
+    count = 0
+    with connection.cursor() as cursor:
+        backend.create_table(cursor)
+        backend.clear(cursor)
+        rows = Recipe.objects.values_list('id', 'title', 'description', 'instructions')
+        for recipe_id, title, description, instructions in rows.iterator(chunk_size=500):
+            backend.upsert(
+                cursor, recipe_id,
+                fold_text(title), fold_text(description), fold_text(instructions),
+                fold_text(' '.join(ingredient_names.get(recipe_id, []))),
+            )
+            count += 1
+
+    _available = True
+    return count
+
+
+def search_recipes(queryset, query):
+    """
+    Zawęża queryset przepisów do pasujących do zapytania i dodaje adnotację
+    search_rank (mniejsza wartość = lepsze dopasowanie).
+    """
+    terms = query_terms(query)
+    if not terms:
+        return queryset.annotate(search_rank=Value(0.0))
+
+    backend = get_backend()
+    if backend is None:
+        # Brak indeksu - wyszukiwanie przez icontains
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(description__icontains=query) |
+            Q(ingredients__ingredient__name__icontains=query)
+        ).distinct().annotate(search_rank=Value(0.0))
+
+    return queryset.filter(id__in=backend.filter_sql(terms)).annotate(search_rank=backend.rank_sql(terms))
@@ -0,0 +1,48 @@
+"""
+Wątki komentarzy i opinii (ocen z komentarzem) na stronie przepisu.
+
+Wszystkie komentarze (lub oceny) przepisu są pobierane jednym zapytaniem razem
+z autorami, a drzewo odpowiedzi jest układane w pamięci przez słownik
+id -> obiekt. Szablon korzysta z listy thread_replies zamiast z relacji
+replies, więc wyświetlenie strony nie wykonuje zapytań na każdy komentarz.
+Stronicowane są wątki najwyższego poziomu.
+"""
+from django.core.paginator import Paginator
+
+# Ile wątków (komentarzy lub opinii najwyższego poziomu) pokazywać na stronie
+THREADS_PER_PAGE = 10
+
+
+def build_tree(nodes):
+    """
+    Układa obiekty z polem parent w drzewo. Każdy obiekt dostaje listę
+    thread_replies (w kolejności wejściowej), a relacja parent jest ustawiana
+    z wczytanych obiektów. Zwraca obiekty najwyższego poziomu; odpowiedź na
+    obiekt spoza listy również trafia na najwyższy poziom.
+    """
+    by_id = {}
+    for node in nodes:
+        node.thread_replies = []
+        by_id[node.pk] = node
+
+    roots = []
+    for node in nodes:
+        parent = by_id.get(node.parent_id)
+        if parent is None:
+            roots.append(node)
+        else:
+            node.parent = parent
+            parent.thread_replies.append(node)
+    return roots
+
+
+def comment_threads(recipe, page=None, per_page=THREADS_PER_PAGE):
+    """Strona wątków komentarzy przepisu (od najnowszych)"""
+    comments = list(recipe.comments.select_related('user').order_by('-created_at'))
+    return Paginator(build_tree(comments), per_page).get_page(page)
+
+
+def rating_threads(recipe, page=None, per_page=THREADS_PER_PAGE):
+    """Strona wątków opinii przepisu (od najnowszych); liczba oznaczeń "przydatne" jest zapisana w ocenie"""
+    ratings = list(recipe.ratings.select_related('user').order_by('-created_at'))
+    return Paginator(build_tree(ratings), per_page).get_page(page)
@@ -1,3 +1,13 @@
+from recipes.conversion_graph import get_conversion_graph
+
+# Kanoniczne jednostki, w których zapisujemy ilości (base_amount)
+BASE_UNIT_CHOICES = [
+    ('g', 'g'),
+    ('ml', 'ml'),
+    ('szt', 'szt'),
+]
+
+
 def convert_units(amount, from_unit, to_unit, ingredient=None):
     """
     Konwertuje ilość z jednej jednostki na drugą.
@@ -40,6 +50,9 @@ def convert_units(amount, from_unit, to_unit, ingredient=None):
     if from_unit == to_unit:
         return amount
     
+    # Graf konwersji jest wczytywany raz i trzymany w pamięci procesu
+    graph = get_conversion_graph()
+    
     # Jeśli podano składnik, spróbuj użyć specyficznej konwersji dla niego
     if ingredient is not None:
         try:
@@ -90,83 +103,116 @@ def convert_units(amount, from_unit, to_unit, ingredient=None):
                     result = result / float(to_unit.base_ratio)
                     return result
                 
-            # Spróbuj użyć zapisanej konwersji dla składnika
-            from recipes.models import IngredientConversion
-            ratio = IngredientConversion.get_conversion_ratio(ingredient, from_unit, to_unit)
-            return float(amount) * float(ratio)
+            # Spróbuj użyć zapisanej konwersji dla składnika (z grafu w pamięci)
+            # - brak takiej konwersji nie jest błędem, przechodzimy do konwersji ogólnej
+            ratio = graph.ingredient_factor(ingredient.pk, from_unit.pk, to_unit.pk)
+            if ratio is not None:
+                return float(amount) * ratio
         except (ValueError, Exception) as e:
             logger.warning(f"Błąd podczas konwersji specyficznej dla składnika: {str(e)}")
             # Jeśli nie można wykonać konwersji dla składnika, pomiń i spróbuj ogólnej konwersji
             pass
     
-    try:
-        # Próba bezpośredniej konwersji
-        from recipes.models import UnitConversion
-        conversion = UnitConversion.objects.get(from_unit=from_unit, to_unit=to_unit)
-        # Zapewnij zgodność typów przed mnożeniem
-        ratio = float(conversion.ratio)
+    # Konwersja bezpośrednia, odwrotna lub przechodnia z grafu konwersji
+    ratio = graph.generic_factor(from_unit.pk, to_unit.pk)
+    if ratio is not None:
         return amount * ratio
-    except UnitConversion.DoesNotExist:
-        # Próba odwrotnej konwersji
+    
+    # Konwersja przez jednostki bazowe (bazując na typie i base_ratio)
+    
+    # Sprawdź czy obie jednostki są tego samego typu
+    if from_unit.type == to_unit.type:
+        # Konwersja za pomocą base_ratio
+        # Zapewnij zgodność typów 
         try:
-            conversion = UnitConversion.objects.get(from_unit=to_unit, to_unit=from_unit)
-            # Zapewnij zgodność typów przed dzieleniem
-            ratio = float(conversion.ratio)
-            if ratio == 0:
-                raise ValueError(f"Współczynnik konwersji nie może być zerowy")
-            return amount / ratio
-        except UnitConversion.DoesNotExist:
-            # Konwersja przez jednostki bazowe (bazując na typie i base_ratio)
+            from_ratio = float(from_unit.base_ratio)
+            to_ratio = float(to_unit.base_ratio)
+            
+            if to_ratio == 0:
+                raise ValueError(f"Współczynnik bazowy jednostki docelowej nie może być zerowy")
+            
+            # Najpierw konwertujemy amount do wartości bazowej (w g lub ml)
+            base_amount = amount * from_ratio
+            # Następnie konwertujemy z wartości bazowej do jednostki docelowej
+            return base_amount / to_ratio
+        except (ValueError, TypeError, AttributeError) as e:
+            raise ValueError(f"Błąd konwersji: {str(e)}")
+    else:
+        # Obsługa konwersji między różnymi typami jednostek
+        if hasattr(from_unit, 'type') and hasattr(to_unit, 'type'):
+            # Konwersja między sztukami a wagą/objętością wymaga dodatkowych informacji
+            if (from_unit.type == 'piece' and to_unit.type in ['weight', 'volume']) or \
+               (to_unit.type == 'piece' and from_unit.type in ['weight', 'volume']):
+                raise ValueError(f"Konwersja między {from_unit.type} a {to_unit.type} wymaga informacji o wadze sztuki")
             
-            # Sprawdź czy obie jednostki są tego samego typu
-            if from_unit.type == to_unit.type:
-                # Konwersja za pomocą base_ratio
-                # Zapewnij zgodność typów 
+            # Konwersja między wagą a objętością wymaga informacji o gęstości
+            if (from_unit.type == 'weight' and to_unit.type == 'volume') or \
+               (from_unit.type == 'volume' and to_unit.type == 'weight'):
+                raise ValueError(f"Konwersja między {from_unit.type} a {to_unit.type} wymaga informacji o gęstości")
+            
+            # Dla łyżek/łyżeczek, można zrobić przybliżoną konwersję
+            if from_unit.type == 'spoon' and to_unit.type in ['weight', 'volume']:
                 try:
-                    from_ratio = float(from_unit.base_ratio)
-                    to_ratio = float(to_unit.base_ratio)
-                    
-                    if to_ratio == 0:
-                        raise ValueError(f"Współczynnik bazowy jednostki docelowej nie może być zerowy")
-                    
-                    # Najpierw konwertujemy amount do wartości bazowej (w g lub ml)
-                    base_amount = amount * from_ratio
-                    # Następnie konwertujemy z wartości bazowej do jednostki docelowej
-                    return base_amount / to_ratio
-                except (ValueError, TypeError, AttributeError) as e:
-                    raise ValueError(f"Błąd konwersji: {str(e)}")
-            else:
-                # Obsługa konwersji między różnymi typami jednostek
-                if hasattr(from_unit, 'type') and hasattr(to_unit, 'type'):
-                    # Konwersja między sztukami a wagą/objętością wymaga dodatkowych informacji
-                    if (from_unit.type == 'piece' and to_unit.type in ['weight', 'volume']) or \
-                       (to_unit.type == 'piece' and from_unit.type in ['weight', 'volume']):
-                        raise ValueError(f"Konwersja między {from_unit.type} a {to_unit.type} wymaga informacji o wadze sztuki")
-                    
-                    # Konwersja między wagą a objętością wymaga informacji o gęstości
-                    if (from_unit.type == 'weight' and to_unit.type == 'volume') or \
-                       (from_unit.type == 'volume' and to_unit.type == 'weight'):
-                        raise ValueError(f"Konwersja między {from_unit.type} a {to_unit.type} wymaga informacji o gęstości")
-                    
-                    # Dla łyżek/łyżeczek, można zrobić przybliżoną konwersję
-                    if from_unit.type == 'spoon' and to_unit.type in ['weight', 'volume']:
-                        try:
-                            # Łyżki/łyżeczki -> ml/g
-                            base_amount = amount * float(from_unit.base_ratio)
-                            return base_amount / float(to_unit.base_ratio)
-                        except (ValueError, TypeError, AttributeError):
-                            pass
+                    # Łyżki/łyżeczki -> ml/g
+                    base_amount = amount * float(from_unit.base_ratio)
+                    return base_amount / float(to_unit.base_ratio)
+                except (ValueError, TypeError, AttributeError):
+                    pass
+            
+            if to_unit.type == 'spoon' and from_unit.type in ['weight', 'volume']:
+                try:
+                    # ml/g -> łyżki/łyżeczki
+                    base_amount = amount * float(from_unit.base_ratio)
+                    return base_amount / float(to_unit.base_ratio)
+                except (ValueError, TypeError, AttributeError):
+                    pass
                     
-                    if to_unit.type == 'spoon' and from_unit.type in ['weight', 'volume']:
-                        try:
-                            # ml/g -> łyżki/łyżeczki
-                            base_amount = amount * float(from_unit.base_ratio)
-                            return base_amount / float(to_unit.base_ratio)
-                        except (ValueError, TypeError, AttributeError):
-                            pass
-                            
-                # Jeśli nie udało się przeprowadzić żadnej konwersji
-                raise ValueError(f"Nie można przekonwertować z {from_unit} na {to_unit} - niekompatybilne typy jednostek")
+        # Jeśli nie udało się przeprowadzić żadnej konwersji
+        raise ValueError(f"Nie można przekonwertować z {from_unit} na {to_unit} - niekompatybilne typy jednostek")
+
+def to_base_amount(amount, unit, ingredient):
+    """
+    Przelicza ilość składnika do jego kanonicznej jednostki.
+
+    Składniki mierzone objętościowo sprowadzamy do ml, pozostałe do g (z użyciem
+    gęstości i wagi sztuki składnika). Jeśli przeliczenie do jednostki preferowanej
+    się nie uda, próbujemy drugiej z nich, a sztuki bez znanej wagi zostają sztukami.
+
+    Args:
+        amount (float): Ilość
+        unit (MeasurementUnit): Jednostka
+        ingredient (Ingredient): Składnik
+
+    Returns:
+        tuple: (ilość, symbol jednostki bazowej) lub (None, ''), jeśli przeliczenie nie jest możliwe
+    """
+    if amount is None or unit is None or ingredient is None:
+        return None, ''
+
+    graph = get_conversion_graph()
+    preferred = ['ml', 'g'] if ingredient.unit_type.startswith('volume') else ['g', 'ml']
+
+    for symbol in preferred:
+        base_unit = graph.base_unit(symbol)
+        if base_unit is None:
+            continue
+        if unit.type == 'piece' and base_unit.type == 'weight' and not ingredient.piece_weight:
+            continue
+        if unit.type != base_unit.type and {unit.type, base_unit.type} == {'weight', 'volume'} and not ingredient.density:
+            continue
+        try:
+            return float(convert_units(amount, unit, base_unit, ingredient=ingredient)), symbol
+        except ValueError:
+            continue
+
+    piece_unit = graph.base_unit('szt')
+    if unit.type == 'piece' and piece_unit is not None:
+        try:
+            return float(convert_units(amount, unit, piece_unit, ingredient=ingredient)), 'szt'
+        except ValueError:
+            pass
+
+    return None, ''
 
 def get_common_units():
     """
@@ -0,0 +1,58 @@
+"""
+Znaczniki wersji danych używane w kluczach pamięci podręcznej.
+
+Każdy obszar (lodówka użytkownika, śledzeni użytkownicy, przepis, jednostki
+i składniki) ma licznik
+trzymany w pamięci podręcznej Django. Zmiana danych zwiększa licznik, więc
+wyniki zapisane pod kluczem ze starą wersją przestają być odczytywane - nie
+trzeba ich wyszukiwać ani usuwać.
+
+Licznik, który wypadł z pamięci podręcznej, jest tworzony od nowa z wartością
+opartą o bieżący czas, aby nie wrócić do wersji użytej już wcześniej.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+FRIDGE = 'fridge'
+# Użytkownicy śledzeni przez użytkownika (np. filtr "od obserwowanych" na liście przepisów)
+FOLLOWING = 'following'
+RECIPE = 'recipe'
+# Dowolna zmiana przepisów - np. do zapamiętywania liczby wyników listy
+RECIPE_LIST = 'recipe_list'
+# Jednostki, przeliczniki i składniki (gęstość, waga sztuki) - wspólne dla wszystkich przepisów
+UNITS = 'units'
+
+
+def _version_key(scope, object_id=None):
+    return f'version:{scope}' if object_id is None else f'version:{scope}:{object_id}'
+
+
+def get_version(scope, object_id=None):
+    """Zwraca bieżącą wersję obszaru (np. get_version(FRIDGE, user.id))"""
+    key = _version_key(scope, object_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _increment(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Licznika nie ma w pamięci podręcznej - nowa wartość i tak różni się od poprzednich
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump_version(scope, object_id=None):
+    """
+    Zwiększa wersję obszaru. Wersja jest zwiększana od razu i ponownie po
+    zatwierdzeniu transakcji, aby inne żądania nie zapisały wyników obliczonych
+    na niezatwierdzonych jeszcze danych pod nową wersją.
+    """
+    key = _version_key(scope, object_id)
+    _increment(key)
+    transaction.on_commit(lambda: _increment(key))
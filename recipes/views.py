@@ -4,10 +4,18 @@ from django.contrib import messages
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.urls import reverse_lazy, reverse
-from django.db.models import Q, Count, F
+from django.db.models import Q, Count, F, prefetch_related_objects
 from django.http import JsonResponse, HttpResponseRedirect, FileResponse
+from django.template.loader import render_to_string
 from .models import Recipe, RecipeIngredient, Ingredient, MeasurementUnit, RecipeCategory, IngredientCategory, UnitConversion, FavoriteRecipe, RecipeLike, Comment, ConversionTable, ConversionTableEntry, UserIngredient, RecipeRating, RatingHelpful
 from .utils import convert_units, get_common_units, get_common_conversions
+from .cookable_index import filter_cookable
+from .pagination import KeysetPaginator, cached_count
+from .facets import get_facets
+from .threads import comment_threads, rating_threads
+from . import versions
+from .search import search_recipes
+from .autocomplete import search_ingredients
 from .forms import RecipeForm, RecipeIngredientFormSet, IngredientForm, CommentForm, ConversionTableForm, ConversionEntryForm, RecipeRatingForm
 from shopping.models import ShoppingItem, ShoppingList
 from fridge.models import FridgeItem
@@ -40,9 +48,12 @@ class RecipeListView(ListView):
     template_name = 'recipes/recipe_list.html'
     context_object_name = 'recipes'
     paginate_by = 12
+    # Parametry GET zawężające wyniki (sortowanie i kursor ich nie zmieniają)
+    FILTER_PARAMS = ('category', 'q', 'ingredient', 'diet', 'available_only', 'followed', 'prep_time', 'difficulty', 'min_rating')
     
     def get_queryset(self):
-        queryset = Recipe.objects.select_related('author').prefetch_related('ingredients').all()
+        # Projekcja kart - bez pełnego opisu i instrukcji
+        queryset = Recipe.objects.cards()
         
         # Filtrowanie po kategorii
         category = self.request.GET.get('category')
@@ -52,11 +63,8 @@ class RecipeListView(ListView):
         # Filtrowanie po frazie
         query = self.request.GET.get('q')
         if query and query != 'None':
-            queryset = queryset.filter(
-                Q(title__icontains=query) |
-                Q(description__icontains=query) |
-                Q(ingredients__ingredient__name__icontains=query)
-            ).distinct()
+            # Indeks pełnotekstowy (FTS5 / tsvector) z rankingiem trafności
+            queryset = search_recipes(queryset, query)
         
         # Filtrowanie po konkretnym składniku
         ingredient_id = self.request.GET.get('ingredient')
@@ -66,31 +74,17 @@ class RecipeListView(ListView):
         # Filtrowanie po typie diety
         diet = self.request.GET.get('diet')
         if diet and diet != 'None':
-            recipe_ids = []
-            
             if diet == 'vegetarian':
-                for recipe in queryset:
-                    if recipe.is_vegetarian:
-                        recipe_ids.append(recipe.id)
+                queryset = queryset.filter(is_vegetarian=True)
             elif diet == 'vegan':
-                for recipe in queryset:
-                    if recipe.is_vegan:
-                        recipe_ids.append(recipe.id)
+                queryset = queryset.filter(is_vegan=True)
             elif diet == 'meat':
-                for recipe in queryset:
-                    if recipe.is_meat:
-                        recipe_ids.append(recipe.id)
-            
-            # Filtruj oryginalny QuerySet według ID
-            queryset = queryset.filter(id__in=recipe_ids)
+                queryset = queryset.filter(is_vegetarian=False)
         
         # Filtrowanie po dostępnych składnikach
         if self.request.GET.get('available_only') == 'true' and self.request.user.is_authenticated:
-            available_recipe_ids = []
-            for recipe in queryset:
-                if recipe.can_be_prepared_with_available_ingredients(self.request.user):
-                    available_recipe_ids.append(recipe.id)
-            queryset = queryset.filter(id__in=available_recipe_ids)
+            # Indeks składnik -> przepisy przecięty z lodówką daje zbiór ID do filtrowania w SQL
+            queryset = filter_cookable(queryset, self.request.user)
             
         # Filtrowanie po przepisach użytkowników, których śledzimy
         if self.request.GET.get('followed') == 'true' and self.request.user.is_authenticated:
@@ -125,14 +119,8 @@ class RecipeListView(ListView):
         if min_rating and min_rating != 'None':
             try:
                 min_rating = float(min_rating)
-                # Krok 1: Pobierz średnie oceny dla przepisów
-                recipes_with_ratings = []
-                for recipe in queryset:
-                    if recipe.average_rating >= min_rating:
-                        recipes_with_ratings.append(recipe.id)
-                
-                # Krok 2: Filtruj przepisy na podstawie średnich ocen
-                queryset = queryset.filter(id__in=recipes_with_ratings)
+                # Średnia ocena jest zapisana w przepisie, więc filtrujemy w SQL
+                queryset = queryset.filter(rating_avg__gte=min_rating)
             except (ValueError, TypeError):
                 pass
         
@@ -149,40 +137,74 @@ class RecipeListView(ListView):
             'difficulty': 'difficulty',
         }
         
+        # Przy wyszukiwaniu bez wybranego sortowania - od najtrafniejszych
+        if query and query != 'None' and 'sort_by' not in self.request.GET:
+            ordering = ['search_rank', '-created_at']
         # Dodaj sortowanie po ocenie
-        if sort_by == 'rating':
-            # Sortowanie po średniej ocenie wymaga specjalnej obsługi
-            recipe_list = list(queryset)
-            recipe_list.sort(key=lambda r: r.average_rating, reverse=(sort_order == 'desc'))
-            # Utwórz listę ID w posortowanej kolejności
-            sorted_ids = [recipe.id for recipe in recipe_list]
-            
-            # Zachowaj kolejność sortowania przy przekazywaniu do szablonu
-            clauses = ' '.join(['WHEN id=%s THEN %s' % (pk, i) for i, pk in enumerate(sorted_ids)])
-            ordering = 'CASE %s END' % clauses
-            
-            if sorted_ids:
-                queryset = Recipe.objects.filter(id__in=sorted_ids).extra(
-                    select={'ordering': ordering}, order_by=('ordering',)
-                )
+        elif sort_by == 'rating':
+            # Sortowanie po zapisanej średniej ocenie (przy równych ocenach - od najnowszych)
+            if sort_order == 'asc':
+                ordering = ['rating_avg', '-created_at']
             else:
-                queryset = Recipe.objects.none()
+                ordering = ['-rating_avg', '-created_at']
         else:
             sort_field = sort_fields.get(sort_by, 'created_at')
             
             if sort_order == 'asc':
-                queryset = queryset.order_by(sort_field)
+                ordering = [sort_field]
             else:
-                queryset = queryset.order_by(f'-{sort_field}')
-        
-        return queryset
+                ordering = [f'-{sort_field}']
+        
+        # Ten sam porządek wyznacza klucz kursora przy stronicowaniu
+        self.ordering = ordering
+        return queryset.order_by(*ordering)
+    
+    def paginate_queryset(self, queryset, page_size):
+        """Stronicowanie kursorem zgodnym z sortowaniem - bez OFFSET i bez COUNT przy każdej stronie"""
+        paginator = KeysetPaginator(queryset, self.ordering, page_size)
+        page = paginator.page(self.request.GET.get('cursor'))
+        return paginator, page, page.object_list, page.has_other_pages()
+    
+    def render_to_response(self, context, **response_kwargs):
+        # "Pokaż więcej" - kolejna porcja kart przepisów bez przeładowania strony
+        if self.request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            page = context['page_obj']
+            return JsonResponse({
+                'html': render_to_string('recipes/partials/recipe_cards.html', context, request=self.request),
+                'next_url': f"?{context['querystring']}&cursor={page.next_cursor}" if page.has_next() else None,
+            })
+        return super().render_to_response(context, **response_kwargs)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = RecipeCategory.objects.all()
-        context['popular_ingredients'] = Ingredient.objects.annotate(
-            recipe_count=Count('recipeingredient')
-        ).order_by('-recipe_count')[:20]  # Pobieramy 20 najczęściej używanych składników
+        
+        # Parametry filtrów i sortowania bez kursora - do linków stronicowania
+        params = self.request.GET.copy()
+        params.pop('cursor', None)
+        context['querystring'] = params.urlencode()
+        
+        # Łączna liczba wyników liczona raz na zestaw filtrów i zapamiętywana (nie przy każdej stronie)
+        params.pop('sort_by', None)
+        params.pop('sort_order', None)
+        count_key = [sorted(params.lists()), versions.get_version(versions.RECIPE_LIST)]
+        if self.request.user.is_authenticated:
+            # Filtry zależne od użytkownika: lodówka (i przeliczniki jednostek) oraz śledzeni autorzy
+            user_id = self.request.user.id
+            if params.get('available_only') == 'true':
+                count_key += [
+                    'fridge', user_id, versions.get_version(versions.FRIDGE, user_id),
+                    versions.get_version(versions.UNITS),
+                ]
+            if params.get('followed') == 'true':
+                count_key += ['following', user_id, versions.get_version(versions.FOLLOWING, user_id)]
+        context['total_count'] = cached_count(self.object_list, count_key)
+        
+        # Liczniki przy filtrach (fasety) - dla listy bez filtrów z pamięci podręcznej
+        filtered = any(self.request.GET.get(name) not in (None, '', 'None') for name in self.FILTER_PARAMS)
+        facets = get_facets(self.object_list if filtered else None)
+        context['facets'] = facets
+        context['categories'] = facets['categories']
+        context['popular_ingredients'] = facets['ingredients']
         
         # Pobierz parametry z URL i upewnij się, że 'None' nie jest przekazywane do szablonu
         category = self.request.GET.get('category')
@@ -255,24 +277,21 @@ class RecipeListView(ListView):
         
         # Sprawdź, czy użytkownik jest zalogowany
         if self.request.user.is_authenticated:
-            # Pobierz ID ulubionych przepisów użytkownika
-            favorite_ids = FavoriteRecipe.objects.filter(
-                user=self.request.user
-            ).values_list('recipe_id', flat=True)
-            
-            # Przygotuj dane o dostępności przepisów i ulubionych
+            # Przygotuj dane o dostępności przepisów i ulubionych - lodówka
+            # wczytywana jest raz dla całej strony wyników
+            from fridge.availability import FridgeSnapshot
+            snapshot = FridgeSnapshot(self.request.user)
+            prefetch_related_objects(list(context['recipes']), 'ingredients__ingredient', 'ingredients__unit')
             for recipe in context['recipes']:
-                recipe.is_available = recipe.can_be_prepared_with_available_ingredients(self.request.user)
-                recipe.is_favorite = recipe.id in favorite_ids
+                recipe.is_available = snapshot.can_prepare(recipe)
+                recipe.is_favorite = recipe.is_favorite_of(self.request.user)
         
         return context
 
 def home_view(request):
     """Widok strony głównej z najpopularniejszymi przepisami"""
     # Pobierz przepisy z największą liczbą polubień (limit 8)
-    popular_recipes = Recipe.objects.annotate(
-        likes_total=Count('likes')
-    ).order_by('-likes_total', '-created_at')[:8]
+    popular_recipes = Recipe.objects.cards().order_by('-like_count', '-created_at')[:8]
     
     # Przekaż przepisy do szablonu
     context = {
@@ -430,17 +449,23 @@ def add_items_directly(shopping_list, recipe, missing_ingredients, servings=None
 
 def ajax_ingredient_search(request):
     """Widok AJAX do wyszukiwania składników"""
-    ingredients = Ingredient.objects.all().order_by('name')
-    categories = IngredientCategory.objects.all().order_by('name')
+    term = request.GET.get('term', '')
     
-    results = []
-    for category in categories:
-        category_ingredients = ingredients.filter(category=category)
-        if category_ingredients:
-            results.append({
-                'text': category.name,
-                'children': [{'id': i.id, 'text': i.name} for i in category_ingredients]
-            })
+    # Bez frazy zwracamy wszystkie składniki, z frazą - najlepsze dopasowania
+    ingredients = search_ingredients(term, limit=50 if term.strip() else None)
+    
+    # Grupowanie po kategoriach (kategorie alfabetycznie, kolejność składników z indeksu)
+    groups = {}
+    for ingredient in ingredients:
+        # Składniki bez kategorii pomijamy, jak przy grupowaniu po kategoriach z bazy
+        if ingredient.category_name is None:
+            continue
+        groups.setdefault(ingredient.category_name, []).append({'id': ingredient.id, 'text': ingredient.name})
+    
+    results = [
+        {'text': category_name, 'children': children}
+        for category_name, children in sorted(groups.items())
+    ]
     
     return JsonResponse({'results': results})
 
@@ -556,6 +581,17 @@ class RecipeDetailView(DetailView):
     template_name = 'recipes/recipe_detail.html'
     context_object_name = 'recipe'
     
+    def get_queryset(self):
+        # Składniki z jednostkami są potrzebne do sprawdzenia dostępności i wyświetlenia przepisu
+        return super().get_queryset().prefetch_related('ingredients__ingredient', 'ingredients__unit')
+    
+    def get_fridge_snapshot(self):
+        """Zwraca migawkę lodówki użytkownika, wczytywaną raz na żądanie"""
+        if not hasattr(self, '_fridge_snapshot'):
+            from fridge.availability import FridgeSnapshot
+            self._fridge_snapshot = FridgeSnapshot(self.request.user)
+        return self._fridge_snapshot
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
@@ -576,10 +612,7 @@ class RecipeDetailView(DetailView):
         # Sprawdź czy użytkownik jest zalogowany
         if self.request.user.is_authenticated:
             # Dodaj informację, czy przepis jest w ulubionych
-            context['is_favorite'] = FavoriteRecipe.objects.filter(
-                user=self.request.user, 
-                recipe=self.object
-            ).exists()
+            context['is_favorite'] = self.object.is_favorite_of(self.request.user)
             
             # Dodaj informację, czy przepis jest polubiony przez użytkownika
             context['is_liked'] = self.object.is_liked_by(self.request.user)
@@ -598,7 +631,9 @@ class RecipeDetailView(DetailView):
         context['can_be_prepared'] = False
         if self.request.user.is_authenticated:
             # Pobierz brakujące składniki z uwzględnieniem liczby porcji
-            missing_ingredients = self.object.get_missing_ingredients(self.request.user, servings)
+            missing_ingredients = self.object.get_missing_ingredients(
+                self.request.user, servings, snapshot=self.get_fridge_snapshot()
+            )
             context['missing_ingredients'] = missing_ingredients
             context['can_be_prepared'] = len(missing_ingredients) == 0
             
@@ -610,8 +645,14 @@ class RecipeDetailView(DetailView):
         # Dodaj formularz do komentowania
         context['comment_form'] = CommentForm()
         
-        # Pobierz komentarze do przepisu (tylko główne, bez odpowiedzi)
-        context['comments'] = self.object.comments.filter(parent=None)
+        # Wątki komentarzy i opinii - każda lista jednym zapytaniem, odpowiedzi układane w pamięci
+        context['comments'] = comment_threads(self.object, self.request.GET.get('comments_page'))
+        context['ratings'] = rating_threads(self.object, self.request.GET.get('ratings_page'))
+        for name in ('comments', 'ratings'):
+            # Parametry żądania (np. liczba porcji) zachowywane w linkach do kolejnych stron
+            params = self.request.GET.copy()
+            params.pop(f'{name}_page', None)
+            context[f'{name}_querystring'] = params.urlencode() + '&' if params else ''
         
         # Dodaj statystyki ocen
         context['rating_stats'] = self.object.get_rating_stats()
@@ -704,7 +745,9 @@ class RecipeDetailView(DetailView):
             
             # Oblicz brakujące składniki dla przeskalowanej liczby porcji
             if self.request.user.is_authenticated:
-                context['missing_ingredients'] = self.object.get_missing_ingredients(self.request.user, servings)
+                context['missing_ingredients'] = self.object.get_missing_ingredients(
+                    self.request.user, servings, snapshot=self.get_fridge_snapshot()
+                )
                 context['can_be_prepared'] = not context['missing_ingredients']
                 
                 # Dodaj debugowanie
@@ -993,7 +1036,9 @@ class IngredientDeleteView(LoginRequiredMixin, DeleteView):
 @login_required
 def prepare_recipe(request, pk):
     """Usuwa składniki przepisu z lodówki po jego przygotowaniu"""
-    recipe = get_object_or_404(Recipe, pk=pk)
+    recipe = get_object_or_404(
+        Recipe.objects.prefetch_related('ingredients__ingredient', 'ingredients__unit'), pk=pk
+    )
     
     # Pobierz liczbę porcji z URL (parametr GET) lub ustaw domyślną
     servings_param = request.GET.get('servings')
@@ -1009,8 +1054,10 @@ def prepare_recipe(request, pk):
     else:
         servings = recipe.servings
     
-    # Sprawdź dostępność składników w lodówce
-    missing_ingredients = recipe.get_missing_ingredients(request.user)
+    # Sprawdź dostępność składników w lodówce (cała lodówka wczytywana raz)
+    from fridge.availability import FridgeSnapshot
+    snapshot = FridgeSnapshot(request.user)
+    missing_ingredients = recipe.get_missing_ingredients(request.user, snapshot=snapshot)
     
     # Przygotuj skalowane składniki, jeśli podano liczbę porcji
     scaled_ingredients = None
@@ -1018,40 +1065,17 @@ def prepare_recipe(request, pk):
     if servings and servings != recipe.servings:
         scaled_ingredients = recipe.scale_to_servings(servings)
         
-        # Sprawdź dostępność składników dla przeskalowanych wartości
-        scaled_missing_ingredients = []
-        
-        for scaled_ing in scaled_ingredients:
-            ingredient = scaled_ing['ingredient']
-            amount = scaled_ing['amount']
-            unit = scaled_ing['unit']
-            
-            if not FridgeItem.check_ingredient_availability(request.user, ingredient, amount, unit):
-                # Oblicz brakującą ilość
-                total_available = 0.0
-                fridge_items = FridgeItem.objects.filter(user=request.user, ingredient=ingredient)
-                
-                for item in fridge_items:
-                    try:
-                        # Jeśli jednostki są różne, przelicz
-                        if item.unit != unit:
-                            converted = convert_units(float(item.amount), item.unit, unit)
-                            total_available += converted
-                        else:
-                            total_available += float(item.amount)
-                    except Exception:
-                        continue
-                
-                # Oblicz brakującą ilość
-                missing_amount = max(0, float(amount) - total_available)
-                
-                scaled_missing_ingredients.append({
-                    'ingredient': ingredient,
-                    'unit': unit,
-                    'required': float(amount),
-                    'available': total_available,
-                    'missing': missing_amount
-                })
+        # Sprawdź dostępność składników dla przeskalowanych wartości (wynik zapamiętany dla liczby porcji)
+        scaled_missing_ingredients = [
+            {
+                'ingredient': item.ingredient,
+                'unit': item.unit,
+                'required': float(item.amount),
+                'available': item.available,
+                'missing': item.missing
+            }
+            for item in snapshot.missing_ingredients(recipe, servings)
+        ]
     
     if request.method == 'POST':
         post_servings = request.POST.get('servings')
@@ -1064,32 +1088,11 @@ def prepare_recipe(request, pk):
             post_servings = recipe.servings
             
         # Sprawdź dostępność składników jeszcze raz - uwzględniając aktualną liczbę porcji
-        if post_servings != recipe.servings:
-            # Jeśli liczba porcji jest inna niż domyślna, używamy specjalnego sprawdzenia
-            scaled_ingredients = recipe.scale_to_servings(post_servings)
-            current_missing_ingredients = []
-            
-            for scaled_ing in scaled_ingredients:
-                ingredient = scaled_ing['ingredient']
-                amount = scaled_ing['amount']
-                unit = scaled_ing['unit']
-                
-                if not FridgeItem.check_ingredient_availability(request.user, ingredient, amount, unit):
-                    current_missing_ingredients.append({
-                        'ingredient': ingredient,
-                        'amount': amount,
-                        'unit': unit
-                    })
-        else:
-            # Standardowe sprawdzenie dla domyślnej liczby porcji
-            current_missing_ingredients = recipe.get_missing_ingredients(request.user)
+        current_missing_ingredients = snapshot.missing_ingredients(recipe, post_servings)
             
         # Sprawdź czy wszystkie składniki są dostępne
         if current_missing_ingredients:
-            if post_servings != recipe.servings:
-                ingredient_names = [item['ingredient'].name for item in current_missing_ingredients]
-            else:
-                ingredient_names = [ing.ingredient.name for ing in current_missing_ingredients]
+            ingredient_names = [ing.ingredient.name for ing in current_missing_ingredients]
             
             missing_text = ", ".join(ingredient_names)
             
@@ -1105,36 +1108,8 @@ def prepare_recipe(request, pk):
         try:
             from accounts.models import RecipeHistory
             
-            # Jeśli liczba porcji jest inna niż domyślna, musimy użyć przeskalowanych składników
-            if post_servings != recipe.servings:
-                # Użyj przeskalowanych ilości składników
-                success = True
-                used_items = []
-                scaled_ingredients = recipe.scale_to_servings(post_servings)
-                
-                for scaled_ing in scaled_ingredients:
-                    ingredient = scaled_ing['ingredient']
-                    amount = scaled_ing['amount']
-                    unit = scaled_ing['unit']
-                    
-                    # Usuń składnik z lodówki
-                    if not FridgeItem.remove_from_fridge(request.user, ingredient, amount, unit):
-                        success = False
-                        break
-                    
-                    used_items.append({
-                        "ingredient": ingredient,
-                        "amount": amount,
-                        "unit": unit
-                    })
-                
-                result = {
-                    "success": success,
-                    "used": used_items
-                }
-            else:
-                # Standardowe usunięcie składników dla domyślnej liczby porcji
-                result = FridgeItem.use_recipe_ingredients(request.user, recipe, post_servings)
+            # Zużyj składniki (przeskalowane do liczby porcji) w jednej transakcji
+            result = FridgeItem.use_recipe_ingredients(request.user, recipe, post_servings)
             
             if result['success']:
                 # Dodaj przepis do historii
@@ -1838,11 +1813,9 @@ def ajax_search_suggestions(request):
         return JsonResponse({'suggestions': []})
     
     # Pobierz tytuły przepisów pasujące do zapytania
-    suggestions = Recipe.objects.filter(
-        Q(title__icontains=query) |
-        Q(description__icontains=query) |
-        Q(ingredients__ingredient__name__icontains=query)
-    ).distinct().values_list('title', flat=True)[:10]
+    suggestions = search_recipes(Recipe.objects.all(), query).order_by(
+        'search_rank', '-created_at'
+    ).values_list('title', flat=True)[:10]
     
     return JsonResponse({'suggestions': list(suggestions)}) 
 
@@ -2395,7 +2368,6 @@ def admin_import_export(request):
         'measurements_count': MeasurementUnit.objects.count(),
         'categories_count': IngredientCategory.objects.count(),
         'ingredients_count': Ingredient.objects.count(),
-        'unread_notifications_count': unread_notifications_count(request),
     }
     return render(request, 'recipes/admin/import_export.html', context)
 
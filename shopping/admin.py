@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ShoppingList, ShoppingItem
+from .models import ShoppingList, ShoppingItem, MealPlan, MealPlanEntry
 
 class ShoppingItemInline(admin.TabularInline):
     model = ShoppingItem
@@ -23,3 +23,15 @@ class ShoppingItemAdmin(admin.ModelAdmin):
     list_filter = ('is_purchased', 'shopping_list', 'ingredient', 'purchase_date')
     search_fields = ('ingredient__name', 'shopping_list__name', 'shopping_list__user__username')
     date_hierarchy = 'purchase_date'
+
+class MealPlanEntryInline(admin.TabularInline):
+    model = MealPlanEntry
+    extra = 1
+
+@admin.register(MealPlan)
+class MealPlanAdmin(admin.ModelAdmin):
+    list_display = ('name', 'user', 'start_date', 'days', 'created_at')
+    list_filter = ('user', 'start_date')
+    search_fields = ('name', 'user__username')
+    date_hierarchy = 'start_date'
+    inlines = [MealPlanEntryInline]
@@ -1,7 +1,9 @@
 from django import forms
-from .models import ShoppingList, ShoppingItem
+from .models import ShoppingList, ShoppingItem, MealPlan, MealPlanEntry
 from recipes.models import Ingredient, MeasurementUnit, Recipe, IngredientCategory
 from django.forms import formset_factory
+from django.db.models import Q
+from datetime import date
 
 class ShoppingListForm(forms.ModelForm):
     """Formularz do tworzenia i edycji list zakupów"""
@@ -183,3 +185,66 @@ class MissingIngredientsForm(forms.Form):
                 user=self.user, 
                 is_completed=False
             ).order_by('-created_at')
+
+class MealPlanForm(forms.ModelForm):
+    """Formularz do tworzenia i edycji planu posiłków"""
+    class Meta:
+        model = MealPlan
+        fields = ['name', 'start_date', 'days']
+        widgets = {
+            'name': forms.TextInput(attrs={'class': 'form-control'}),
+            'start_date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}, format='%Y-%m-%d'),
+            'days': forms.NumberInput(attrs={'class': 'form-control', 'min': 1, 'max': 28}),
+        }
+        labels = {
+            'name': 'Nazwa planu',
+            'start_date': 'Data rozpoczęcia',
+            'days': 'Liczba dni'
+        }
+
+class MealPlanEntryForm(forms.ModelForm):
+    """Formularz do dodawania przepisu do planu posiłków"""
+    class Meta:
+        model = MealPlanEntry
+        fields = ['date', 'meal_type', 'recipe', 'servings']
+        widgets = {
+            'meal_type': forms.Select(attrs={'class': 'form-control'}),
+            'recipe': forms.Select(attrs={'class': 'form-control select2'}),
+            'servings': forms.NumberInput(attrs={'class': 'form-control', 'min': 1}),
+        }
+        labels = {
+            'date': 'Dzień',
+            'meal_type': 'Posiłek',
+            'recipe': 'Przepis',
+            'servings': 'Liczba porcji'
+        }
+    
+    def __init__(self, *args, meal_plan=None, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.meal_plan = meal_plan
+        
+        # Do wyboru tylko dni objęte planem
+        if meal_plan is not None:
+            self.fields['date'] = forms.TypedChoiceField(
+                choices=[(day.isoformat(), day.strftime('%d.%m.%Y')) for day in meal_plan.dates],
+                coerce=date.fromisoformat,
+                widget=forms.Select(attrs={'class': 'form-control'}),
+                label='Dzień'
+            )
+        
+        # Przepisy publiczne i własne przepisy użytkownika
+        recipes = Recipe.objects.filter(is_public=True)
+        if user is not None:
+            recipes = Recipe.objects.filter(Q(is_public=True) | Q(author=user))
+        self.fields['recipe'].queryset = recipes.order_by('title')
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.meal_plan is not None and MealPlanEntry.objects.filter(
+            meal_plan=self.meal_plan,
+            date=cleaned_data.get('date'),
+            meal_type=cleaned_data.get('meal_type'),
+            recipe=cleaned_data.get('recipe')
+        ).exists():
+            raise forms.ValidationError('Ten przepis jest już zaplanowany na ten posiłek.')
+        return cleaned_data
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:29
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipeingredient_base_amount'),
+        ('shopping', '0003_shoppingitem_base_amount'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MealPlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Nazwa planu')),
+                ('start_date', models.DateField(default=django.utils.timezone.localdate, verbose_name='Data rozpoczęcia')),
+                ('days', models.PositiveSmallIntegerField(default=7, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(28)], verbose_name='Liczba dni')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Data utworzenia')),
+                ('shopping_list', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='meal_plans', to='shopping.shoppinglist', verbose_name='Lista zakupów')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meal_plans', to=settings.AUTH_USER_MODEL, verbose_name='Użytkownik')),
+            ],
+            options={
+                'verbose_name': 'Plan posiłków',
+                'verbose_name_plural': 'Plany posiłków',
+                'ordering': ['-start_date', '-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MealPlanEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Data')),
+                ('meal_type', models.CharField(choices=[('breakfast', 'Śniadanie'), ('lunch', 'Drugie śniadanie'), ('dinner', 'Obiad'), ('snack', 'Przekąska'), ('supper', 'Kolacja')], max_length=20, verbose_name='Rodzaj posiłku')),
+                ('servings', models.PositiveIntegerField(default=2, validators=[django.core.validators.MinValueValidator(1)], verbose_name='Liczba porcji')),
+                ('meal_plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='shopping.mealplan', verbose_name='Plan posiłków')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meal_plan_entries', to='recipes.recipe', verbose_name='Przepis')),
+            ],
+            options={
+                'verbose_name': 'Posiłek w planie',
+                'verbose_name_plural': 'Posiłki w planie',
+                'ordering': ['date', 'meal_type'],
+                'unique_together': {('meal_plan', 'date', 'meal_type', 'recipe')},
+            },
+        ),
+    ]
@@ -1,8 +1,15 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.contrib.auth.models import User
-from recipes.models import Ingredient, MeasurementUnit, Recipe
+from django.core.validators import MaxValueValidator, MinValueValidator
+from recipes.models import BaseQuantity, Ingredient, MeasurementUnit, Recipe
+from recipes.utils import convert_units
 from django.utils import timezone
+from django.utils.text import Truncator
+from datetime import timedelta
 import math
+from ksiazkakucharska import events
 
 class ShoppingList(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='shopping_lists', verbose_name="Użytkownik")
@@ -37,94 +44,95 @@ class ShoppingList(models.Model):
             return 0
         return int((self.completed_item_count / self.item_count) * 100)
     
-    def normalize_units(self):
+    def normalize_units(self, dry_run=False):
         """
         Konsoliduje produkty na liście zakupów, łącząc te same składniki
         i konwertując je do jednostek podstawowych.
         
+        Pozycje są wczytywane jednym zapytaniem i grupowane w pamięci według
+        (składnik, zakupione). Ilości sumowane są na zapisanych ilościach bazowych,
+        a zmiany zapisywane jednym bulk_update i jednym DELETE w transakcji.
+        Pozycje, których nie da się przeliczyć, są łączone tylko z pozycjami
+        w tej samej jednostce.
+        
+        Args:
+            dry_run (bool): Jeśli True, nic nie zapisuje i zwraca plan konsolidacji
+            
         Returns:
-            int: Liczba skonsolidowanych produktów
+            int: Liczba skonsolidowanych (usuniętych) produktów,
+            a dla dry_run=True lista słowników planu z kluczami ingredient,
+            is_purchased, kept (pozycja zachowana), merged (pozycje do usunięcia),
+            amount i unit (nowa ilość i jednostka)
         """
-        from django.db.models import Count
-        from recipes.utils import convert_units
-        from recipes.models import MeasurementUnit
+        from recipes.conversion_graph import get_conversion_graph
         
         # Pobierz podstawowe jednostki
-        try:
-            gram_unit = MeasurementUnit.objects.get(symbol='g')
-            ml_unit = MeasurementUnit.objects.get(symbol='ml')
-        except MeasurementUnit.DoesNotExist:
+        graph = get_conversion_graph()
+        base_units = {symbol: graph.base_unit(symbol) for symbol in ('g', 'ml')}
+        if None in base_units.values():
             raise ValueError("Podstawowe jednostki (g/ml) nie istnieją w bazie danych")
         
-        # Pobierz wszystkie składniki z listy zakupów
-        ingredients_groups = self.items.values('ingredient_id').distinct()
-        consolidated_count = 0
+        # Pogrupuj wszystkie pozycje listy według składnika i statusu zakupu
+        groups = {}
+        for item in self.items.select_related('ingredient', 'unit').order_by('id'):
+            groups.setdefault((item.ingredient_id, item.is_purchased), []).append(item)
         
-        # Dla każdego unikalnego składnika
-        for ing_data in ingredients_groups:
-            ingredient_id = ing_data['ingredient_id']
-            
-            # Pobierz wszystkie wpisy dla tego składnika
-            items = self.items.filter(
-                ingredient_id=ingredient_id
-            ).select_related('ingredient', 'unit')
-            
-            if not items or items.count() <= 1:
+        plan = []
+        for (ingredient_id, is_purchased), items in groups.items():
+            if len(items) <= 1:
                 continue
-                
-            # Określ podstawową jednostkę dla tego składnika
-            first_item = items[0]
-            ingredient = first_item.ingredient
-            unit_type = 'weight'  # domyślnie zakładamy wagę
             
-            if ingredient.unit_type.startswith('volume'):
-                unit_type = 'volume'
-                base_unit = ml_unit
-            else:
-                base_unit = gram_unit
+            ingredient = items[0].ingredient
+            symbol = 'ml' if ingredient.unit_type.startswith('volume') else 'g'
+            single_unit = len({item.unit_id for item in items}) == 1
             
-            # Przygotuj się do konsolidacji zakupionych i niezakupionych osobno
-            for is_purchased in [False, True]:
-                purchase_items = items.filter(is_purchased=is_purchased)
-                
-                if purchase_items.count() <= 1:
+            # Pozycje przeliczalne do jednostki podstawowej składnika łączymy w niej,
+            # pozostałe tylko z pozycjami w tej samej jednostce
+            buckets = {}
+            for item in items:
+                if not single_unit and item.base_amount is not None and item.base_unit == symbol:
+                    buckets.setdefault(None, []).append(item)
+                else:
+                    buckets.setdefault(item.unit_id, []).append(item)
+            
+            for unit_id, mergeable in buckets.items():
+                if len(mergeable) <= 1:
                     continue
+                if unit_id is None:
+                    unit = base_units[symbol]
+                    amount = sum(item.base_amount for item in mergeable)
+                else:
+                    unit = mergeable[0].unit
+                    amount = sum(float(item.amount) for item in mergeable)
                 
-                # Skonsoliduj do jednego wpisu
-                total_amount = 0
-                for item in purchase_items:
-                    try:
-                        # Konwertuj do jednostki podstawowej i dodaj
-                        if item.unit != base_unit:
-                            # Próbuj dokonać konwersji
-                            try:
-                                converted = convert_units(item.amount, item.unit, base_unit, ingredient=ingredient)
-                                total_amount += converted
-                            except Exception as e:
-                                print(f"Błąd konwersji dla {item.ingredient.name}: {str(e)}")
-                                # Jeśli konwersja się nie powiedzie, zachowaj ten element
-                                continue
-                        else:
-                            total_amount += item.amount
-                    except Exception as e:
-                        print(f"Błąd podczas konsolidacji {item.ingredient.name}: {str(e)}")
-                        continue
-                
-                # Usuń skonsolidowane elementy
-                items_to_delete = list(purchase_items)
-                first_item = items_to_delete.pop(0)  # zachowaj pierwszy element, aby zaktualizować go
-                
-                # Usuń pozostałe elementy
-                ShoppingItem.objects.filter(id__in=[item.id for item in items_to_delete]).delete()
+                plan.append({
+                    'ingredient': ingredient,
+                    'is_purchased': is_purchased,
+                    'kept': mergeable[0],
+                    'merged': mergeable[1:],
+                    'amount': amount,
+                    'unit': unit
+                })
+        
+        if dry_run:
+            return plan
+        
+        if plan:
+            with transaction.atomic():
+                kept_items = []
+                for entry in plan:
+                    item = entry['kept']
+                    item.amount = entry['amount']
+                    item.unit = entry['unit']
+                    item.update_base_amount()
+                    kept_items.append(item)
                 
-                # Zaktualizuj pierwszy element o nową ilość i jednostkę
-                first_item.amount = total_amount
-                first_item.unit = base_unit
-                first_item.save()
-                
-                consolidated_count += len(items_to_delete)  # liczba usuniętych elementów
+                ShoppingItem.objects.bulk_update(kept_items, ['amount', 'unit', 'base_amount', 'base_unit'])
+                ShoppingItem.objects.filter(
+                    id__in=[item.id for entry in plan for item in entry['merged']]
+                ).delete()
         
-        return consolidated_count
+        return sum(len(entry['merged']) for entry in plan)
     
     def add_recipe_ingredients(self, recipe, servings=None):
         """
@@ -241,29 +249,35 @@ class ShoppingList(models.Model):
         """
         from fridge.models import FridgeItem
         
-        added_count = 0
-        
-        for item in self.items.filter(is_purchased=False):
-            # Dodaj do lodówki
-            FridgeItem.add_to_fridge(
-                user=self.user,
-                ingredient=item.ingredient,
-                amount=item.amount,
-                unit=item.unit
-            )
+        with transaction.atomic():
+            items = list(self.items.filter(is_purchased=False).values_list('id', 'ingredient_id', 'unit_id', 'amount'))
             
-            # Oznacz jako zakupione
-            item.is_purchased = True
-            item.purchase_date = timezone.now()
-            item.save()
+            # Dodaj wszystkie pozycje do lodówki jednym wywołaniem
+            FridgeItem.bulk_add(self.user, [
+                {'ingredient_id': ingredient_id, 'unit_id': unit_id, 'amount': amount}
+                for _, ingredient_id, unit_id, amount in items
+            ])
             
-            added_count += 1
+            # Oznacz jako zakupione
+            purchase_date = timezone.now()
+            self.items.filter(id__in=[item_id for item_id, *_ in items]).update(
+                is_purchased=True,
+                purchase_date=purchase_date
+            )
+            # update() nie wysyła sygnałów - zmianę ogłaszamy otwartym kartom sami
+            for item_id, *_ in items:
+                events.publish(self.user_id, 'shopping_item', {
+                    'id': item_id,
+                    'list_id': self.pk,
+                    'is_purchased': True,
+                    'purchase_date': purchase_date.isoformat(),
+                })
             
-        # Oznacz listę jako zakończoną
-        self.is_completed = True
-        self.save()
+            # Oznacz listę jako zakończoną
+            self.is_completed = True
+            self.save()
         
-        return added_count
+        return len(items)
 
     def get_items_by_category(self):
         """
@@ -349,7 +363,7 @@ class ShoppingList(models.Model):
         
         return sorted_result
 
-class ShoppingItem(models.Model):
+class ShoppingItem(BaseQuantity):
     shopping_list = models.ForeignKey(ShoppingList, on_delete=models.CASCADE, related_name='items', verbose_name="Lista zakupów")
     ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, verbose_name="Składnik")
     amount = models.FloatField(verbose_name="Ilość")
@@ -381,6 +395,15 @@ class ShoppingItem(models.Model):
             return math.ceil(self.amount)
         return self.amount
     
+    def publish(self):
+        """Wysyła stan pozycji do otwartych kart przeglądarki właściciela listy (SSE)"""
+        events.publish(self.shopping_list.user_id, 'shopping_item', {
+            'id': self.pk,
+            'list_id': self.shopping_list_id,
+            'is_purchased': self.is_purchased,
+            'purchase_date': self.purchase_date.isoformat() if self.purchase_date else None,
+        })
+
     def mark_as_purchased(self):
         """
         Oznacza produkt jako zakupiony i dodaje go do lodówki.
@@ -408,3 +431,192 @@ class ShoppingItem(models.Model):
         except Exception as e:
             print(f"Błąd podczas dodawania do lodówki: {str(e)}")
             return False
+
+class MealPlan(models.Model):
+    """Plan posiłków na kolejne dni - siatka (dzień, posiłek) z przepisami"""
+    MEAL_TYPES = [
+        ('breakfast', 'Śniadanie'),
+        ('lunch', 'Drugie śniadanie'),
+        ('dinner', 'Obiad'),
+        ('snack', 'Przekąska'),
+        ('supper', 'Kolacja'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='meal_plans', verbose_name="Użytkownik")
+    name = models.CharField(max_length=100, verbose_name="Nazwa planu")
+    start_date = models.DateField(default=timezone.localdate, verbose_name="Data rozpoczęcia")
+    days = models.PositiveSmallIntegerField(
+        default=7,
+        validators=[MinValueValidator(1), MaxValueValidator(28)],
+        verbose_name="Liczba dni"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Data utworzenia")
+    shopping_list = models.ForeignKey(
+        ShoppingList, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='meal_plans', verbose_name="Lista zakupów"
+    )
+    
+    class Meta:
+        verbose_name = "Plan posiłków"
+        verbose_name_plural = "Plany posiłków"
+        ordering = ['-start_date', '-created_at']
+    
+    def __str__(self):
+        return f"{self.name} ({self.start_date.strftime('%d.%m.%Y')})"
+    
+    @property
+    def end_date(self):
+        """Zwraca ostatni dzień planu"""
+        return self.start_date + timedelta(days=self.days - 1)
+    
+    @property
+    def dates(self):
+        """Zwraca listę dni objętych planem"""
+        return [self.start_date + timedelta(days=offset) for offset in range(self.days)]
+    
+    def get_grid(self):
+        """
+        Zwraca siatkę planu: listę (dzień, [(kod posiłku, nazwa posiłku, [wpisy])]).
+        Wszystkie wpisy są pobierane jednym zapytaniem.
+        """
+        slots = {}
+        for entry in self.entries.select_related('recipe'):
+            slots.setdefault((entry.date, entry.meal_type), []).append(entry)
+        
+        return [
+            (day, [(code, label, slots.get((day, code), [])) for code, label in self.MEAL_TYPES])
+            for day in self.dates
+        ]
+    
+    def compile_shopping_list(self, subtract_fridge=True):
+        """
+        Tworzy jedną listę zakupów dla całego planu.
+        
+        Buduje macierz przepisy x składniki (ilości w jednostkach bazowych),
+        mnoży ją przez wektor porcji (łączna liczba porcji każdego przepisu
+        w planie), odejmuje zawartość lodówki i zapisuje połączone pozycje
+        jednym bulk_create. Liczba zapytań nie zależy od liczby posiłków.
+        
+        Args:
+            subtract_fridge (bool): Czy pomijać ilości dostępne w lodówce
+            
+        Returns:
+            ShoppingList: Utworzona lista zakupów lub None, jeśli plan jest pusty
+        """
+        from collections import defaultdict
+        from fridge.availability import FridgeSnapshot
+        from recipes.conversion_graph import get_conversion_graph
+        from recipes.models import RecipeIngredient
+        
+        # Wektor porcji: {recipe_id: mnożnik ilości z przepisu}
+        scale = defaultdict(float)
+        for entry in self.entries.select_related('recipe'):
+            scale[entry.recipe_id] += float(entry.servings) / float(entry.recipe.servings or 1)
+        if not scale:
+            return None
+        
+        # Macierz przepisy x składniki: {recipe_id: {(ingredient_id, unit_id): ilość}}
+        graph = get_conversion_graph()
+        matrix = defaultdict(lambda: defaultdict(float))
+        rows = RecipeIngredient.objects.filter(recipe_id__in=list(scale)).values_list(
+            'recipe_id', 'ingredient_id', 'unit_id', 'amount', 'base_amount', 'base_unit'
+        )
+        for recipe_id, ingredient_id, unit_id, amount, base_amount, base_symbol in rows:
+            base_unit = graph.base_unit(base_symbol) if base_amount is not None else None
+            if base_unit is not None:
+                matrix[recipe_id][(ingredient_id, base_unit.id)] += base_amount
+            elif unit_id in graph.units:
+                matrix[recipe_id][(ingredient_id, unit_id)] += float(amount)
+        
+        # Iloczyn macierzy i wektora porcji - łączne zapotrzebowanie na składniki
+        required = defaultdict(float)
+        sources = defaultdict(set)
+        for recipe_id, row in matrix.items():
+            for key, amount in row.items():
+                required[key] += amount * scale[recipe_id]
+                sources[key].add(recipe_id)
+        
+        ingredients = Ingredient.objects.in_bulk({ingredient_id for ingredient_id, _ in required})
+        # Pozostała zawartość lodówki: {ingredient_id: [[jednostka, ilość]]} - składnik
+        # potrzebny w kilku jednostkach (np. g i szt) zużywa wspólny zapas tylko raz
+        stock = {}
+        if subtract_fridge:
+            stock = {
+                ingredient_id: [[unit, amount] for unit, amount in buckets.values()]
+                for ingredient_id, buckets in FridgeSnapshot(self.user).totals.items()
+            }
+        piece_unit = graph.base_unit('szt')
+        
+        shopping_list = ShoppingList(user=self.user, name=Truncator(f"Plan posiłków: {self.name}").chars(100))
+        items = []
+        for (ingredient_id, unit_id), amount in required.items():
+            ingredient = ingredients[ingredient_id]
+            unit = graph.units[unit_id]
+            for bucket in stock.get(ingredient_id, []):
+                if amount <= 0:
+                    break
+                bucket_unit, bucket_amount = bucket
+                if bucket_amount <= 0:
+                    continue
+                try:
+                    available = bucket_amount if bucket_unit == unit else convert_units(bucket_amount, bucket_unit, unit, ingredient=ingredient)
+                except ValueError:
+                    continue
+                if available <= 0:
+                    continue
+                used = min(amount, available)
+                amount -= used
+                bucket[1] -= bucket_amount * used / available
+            if amount <= 0:
+                continue
+            
+            # Składniki kupowane na sztuki pokazujemy w sztukach, a nie w gramach
+            if piece_unit is not None and unit.type == 'weight' and 'piece' in ingredient.unit_type and ingredient.piece_weight:
+                try:
+                    amount = convert_units(amount, unit, piece_unit, ingredient=ingredient)
+                    unit = piece_unit
+                except ValueError:
+                    pass
+            
+            recipe_ids = sources[(ingredient_id, unit_id)]
+            item = ShoppingItem(
+                shopping_list=shopping_list,
+                ingredient=ingredient,
+                amount=amount,
+                unit=unit,
+                recipe_id=next(iter(recipe_ids)) if len(recipe_ids) == 1 else None
+            )
+            item.update_base_amount()
+            items.append(item)
+        
+        with transaction.atomic():
+            shopping_list.save()
+            ShoppingItem.objects.bulk_create(items)
+            self.shopping_list = shopping_list
+            self.save(update_fields=['shopping_list'])
+        
+        return shopping_list
+
+class MealPlanEntry(models.Model):
+    """Przepis zaplanowany na konkretny dzień i posiłek"""
+    meal_plan = models.ForeignKey(MealPlan, on_delete=models.CASCADE, related_name='entries', verbose_name="Plan posiłków")
+    date = models.DateField(verbose_name="Data")
+    meal_type = models.CharField(max_length=20, choices=MealPlan.MEAL_TYPES, verbose_name="Rodzaj posiłku")
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='meal_plan_entries', verbose_name="Przepis")
+    servings = models.PositiveIntegerField(default=2, validators=[MinValueValidator(1)], verbose_name="Liczba porcji")
+    
+    class Meta:
+        verbose_name = "Posiłek w planie"
+        verbose_name_plural = "Posiłki w planie"
+        ordering = ['date', 'meal_type']
+        unique_together = ('meal_plan', 'date', 'meal_type', 'recipe')
+    
+    def __str__(self):
+        return f"{self.date.strftime('%d.%m.%Y')} {self.get_meal_type_display()}: {self.recipe.title} ({self.servings} porcji)"
+
+
+@receiver(post_save, sender=ShoppingItem)
+def publish_shopping_item(sender, instance, created, **kwargs):
+    """Ogłasza zmianę pozycji listy zakupów (np. oznaczenie jako zakupionej) na innych urządzeniach"""
+    if not created:
+        instance.publish()
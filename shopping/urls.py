@@ -26,4 +26,12 @@ urlpatterns = [
     path('ajax/load-units/', views.ajax_load_units, name='ajax_load_units'),
     path('list/<int:pk>/export-pdf/', views.export_list_to_pdf, name='export_pdf'),
     path('<int:pk>/normalize/', views.normalize_shopping_list, name='normalize'),
+    
+    # Plany posiłków
+    path('meal-plans/', views.MealPlanListView.as_view(), name='meal_plan_list'),
+    path('meal-plans/create/', views.MealPlanCreateView.as_view(), name='meal_plan_create'),
+    path('meal-plans/<int:pk>/', views.meal_plan_detail, name='meal_plan_detail'),
+    path('meal-plans/<int:pk>/delete/', views.MealPlanDeleteView.as_view(), name='meal_plan_delete'),
+    path('meal-plans/<int:pk>/compile/', views.compile_meal_plan, name='meal_plan_compile'),
+    path('meal-plans/entry/<int:pk>/delete/', views.delete_meal_plan_entry, name='meal_plan_entry_delete'),
 ]
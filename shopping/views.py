@@ -5,7 +5,7 @@ from django.views.generic import ListView, DetailView, CreateView, UpdateView, D
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.urls import reverse_lazy, reverse
 from django.http import JsonResponse, FileResponse, HttpResponse, HttpResponseForbidden, HttpResponseNotFound
-from django.db.models import Q, Sum
+from django.db.models import Count, Q, Sum
 from django.template.loader import get_template
 from django.conf import settings
 from django.utils.text import slugify
@@ -24,9 +24,10 @@ try:
 except ImportError:
     pdfkit = None
 
-from .models import ShoppingList, ShoppingItem
+from .models import ShoppingList, ShoppingItem, MealPlan, MealPlanEntry
 from recipes.models import Ingredient, MeasurementUnit, Recipe, IngredientCategory
-from .forms import ShoppingListForm, ShoppingItemForm, ShoppingItemFormSet
+from recipes.autocomplete import search_ingredients
+from .forms import ShoppingListForm, ShoppingItemForm, ShoppingItemFormSet, MealPlanForm, MealPlanEntryForm
 from fridge.models import FridgeItem
 
 logger = logging.getLogger(__name__)
@@ -594,28 +595,19 @@ def ajax_ingredient_search(request):
     results = []
     
     if include_categories:
-        # Pobierz wszystkie kategorie
-        categories = IngredientCategory.objects.all().order_by('name')
-        
-        for category in categories:
-            ingredients = Ingredient.objects.filter(
-                category=category,
-                name__icontains=term if term else ''
-            ).order_by('name')
-            
-            if ingredients.exists():
-                # Dodaj składniki z tej kategorii
-                for ingredient in ingredients:
-                    results.append({
-                        'id': ingredient.id,
-                        'text': ingredient.name,
-                        'category': category.name
-                    })
+        # Wszystkie pasujące składniki, pogrupowane według kategorii
+        ingredients = search_ingredients(term, limit=None)
+        ingredients = sorted(ingredients, key=lambda ingredient: ingredient.category_name or '')
+        
+        for ingredient in ingredients:
+            results.append({
+                'id': ingredient.id,
+                'text': ingredient.name,
+                'category': ingredient.category_name
+            })
     else:
         # Proste wyszukiwanie bez kategorii
-        ingredients = Ingredient.objects.filter(
-            name__icontains=term
-        ).order_by('name')[:10]
+        ingredients = search_ingredients(term, limit=10)
         
         results = [{'id': i.id, 'text': i.name} for i in ingredients]
     
@@ -837,6 +829,104 @@ def normalize_shopping_list(request, pk):
             
         return redirect('shopping:detail', pk=shopping_list.pk)
     
+    # Podgląd zmian - plan konsolidacji bez zapisu
+    try:
+        plan = shopping_list.normalize_units(dry_run=True)
+    except ValueError:
+        plan = None
+    
     return render(request, 'shopping/normalize_confirm.html', {
-        'shopping_list': shopping_list
-    })
\ No newline at end of file
+        'shopping_list': shopping_list,
+        'plan': plan
+    })
+class MealPlanListView(LoginRequiredMixin, ListView):
+    """Lista planów posiłków użytkownika"""
+    model = MealPlan
+    template_name = 'shopping/meal_plan_list.html'
+    context_object_name = 'meal_plans'
+    
+    def get_queryset(self):
+        return MealPlan.objects.filter(user=self.request.user).annotate(entry_count=Count('entries'))
+
+class MealPlanCreateView(LoginRequiredMixin, CreateView):
+    """Tworzenie nowego planu posiłków"""
+    model = MealPlan
+    form_class = MealPlanForm
+    template_name = 'shopping/meal_plan_form.html'
+    
+    def form_valid(self, form):
+        form.instance.user = self.request.user
+        messages.success(self.request, f'Plan posiłków "{form.instance.name}" został utworzony.')
+        return super().form_valid(form)
+    
+    def get_success_url(self):
+        return reverse('shopping:meal_plan_detail', kwargs={'pk': self.object.pk})
+
+class MealPlanDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+    """Usuwanie planu posiłków"""
+    model = MealPlan
+    template_name = 'shopping/meal_plan_confirm_delete.html'
+    success_url = reverse_lazy('shopping:meal_plan_list')
+    
+    def test_func(self):
+        return self.request.user == self.get_object().user
+    
+    def form_valid(self, form):
+        messages.success(self.request, f'Plan posiłków "{self.object.name}" został usunięty.')
+        return super().form_valid(form)
+
+@login_required
+def meal_plan_detail(request, pk):
+    """Siatka planu posiłków z formularzem dodawania przepisów"""
+    meal_plan = get_object_or_404(MealPlan, pk=pk, user=request.user)
+    
+    if request.method == 'POST':
+        form = MealPlanEntryForm(request.POST, meal_plan=meal_plan, user=request.user)
+        if form.is_valid():
+            entry = form.save(commit=False)
+            entry.meal_plan = meal_plan
+            entry.save()
+            messages.success(request, f'Dodano "{entry.recipe.title}" do planu.')
+            return redirect('shopping:meal_plan_detail', pk=meal_plan.pk)
+    else:
+        form = MealPlanEntryForm(meal_plan=meal_plan, user=request.user)
+    
+    return render(request, 'shopping/meal_plan_detail.html', {
+        'meal_plan': meal_plan,
+        'grid': meal_plan.get_grid(),
+        'form': form,
+    })
+
+@login_required
+def delete_meal_plan_entry(request, pk):
+    """Usuwanie przepisu z planu posiłków"""
+    entry = get_object_or_404(MealPlanEntry, pk=pk, meal_plan__user=request.user)
+    meal_plan_id = entry.meal_plan_id
+    
+    if request.method == 'POST':
+        entry.delete()
+        messages.success(request, f'Usunięto "{entry.recipe.title}" z planu.')
+    
+    return redirect('shopping:meal_plan_detail', pk=meal_plan_id)
+
+@login_required
+def compile_meal_plan(request, pk):
+    """Tworzy listę zakupów dla całego planu posiłków"""
+    meal_plan = get_object_or_404(MealPlan, pk=pk, user=request.user)
+    
+    if request.method != 'POST':
+        return redirect('shopping:meal_plan_detail', pk=meal_plan.pk)
+    
+    subtract_fridge = request.POST.get('subtract_fridge') == 'on'
+    shopping_list = meal_plan.compile_shopping_list(subtract_fridge=subtract_fridge)
+    
+    if shopping_list is None:
+        messages.warning(request, 'Plan posiłków jest pusty - dodaj przepisy, aby utworzyć listę zakupów.')
+        return redirect('shopping:meal_plan_detail', pk=meal_plan.pk)
+    
+    item_count = shopping_list.items.count()
+    if item_count:
+        messages.success(request, f'Utworzono listę zakupów "{shopping_list.name}" ({item_count} produktów).')
+    else:
+        messages.info(request, 'Masz w lodówce wszystkie składniki potrzebne do realizacji planu.')
+    return redirect('shopping:detail', pk=shopping_list.pk)